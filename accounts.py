@@ -0,0 +1,83 @@
+"""Account deletion.
+
+Deleting a busy account means adjusting the counters of everyone it
+followed, was followed by or was liked by, and deleting all its messages,
+likes, follows and timeline entries. The request only flags the user as
+deleted, which locks the account out at once (see `User.authenticate` and
+usercache.py), and queues `purge` to do the rest in the background.
+
+`purge` works in batches, committing as it goes, and may be interrupted
+and run again: the rows other users' counters depend on are removed in the
+same transaction as the counter adjustments.
+"""
+
+from sqlalchemy import or_, select
+
+from models import (db, ArchivedLike, ArchivedMessage, FollowersFollowee, Like,
+                    Message, TimelineEntry, User)
+import counters
+import jobs
+
+PURGE_BATCH = 1000
+
+
+def delete(user_id):
+    """Lock `user_id` out and queue purging its rows; the caller commits."""
+
+    (User
+     .query
+     .filter(User.id == user_id)
+     .update({User.deleted: True}, synchronize_session=False))
+
+    jobs.enqueue('accounts.purge', user_id=user_id)
+
+
+@jobs.handler('accounts.purge')
+def purge(user_id):
+    """Delete a deleted user and everything of theirs."""
+
+    # straight from the database: `delete` flags the user with a bulk
+    # UPDATE, which a User already in the session doesn't see
+    deleted = db.session.query(User.deleted).filter(User.id == user_id).scalar()
+    if not deleted:
+        return
+
+    # everything that other users' counters count, in one transaction
+    counters.user_deleted(user_id)
+    their_messages = select([Message.id]).where(Message.user_id == user_id)
+    (Like
+     .query
+     .filter(or_(Like.user_id == user_id, Like.message_id.in_(their_messages)))
+     .delete(synchronize_session=False))
+    (FollowersFollowee
+     .query
+     .filter(or_(FollowersFollowee.followee_id == user_id,
+                 FollowersFollowee.follower_id == user_id))
+     .delete(synchronize_session=False))
+    db.session.commit()
+
+    # then the bulk, a batch per transaction
+    _delete_in_batches(TimelineEntry.__table__, TimelineEntry.message_id,
+                       TimelineEntry.user_id == user_id)
+    _delete_in_batches(Message.__table__, Message.id,
+                       Message.user_id == user_id)
+    their_archived = select([ArchivedMessage.id]).where(ArchivedMessage.user_id == user_id)
+    _delete_in_batches(ArchivedLike.__table__, ArchivedLike.message_id,
+                       or_(ArchivedLike.user_id == user_id,
+                           ArchivedLike.message_id.in_(their_archived)))
+    _delete_in_batches(ArchivedMessage.__table__, ArchivedMessage.id,
+                       ArchivedMessage.user_id == user_id)
+
+    User.query.filter(User.id == user_id).delete(synchronize_session=False)
+
+
+def _delete_in_batches(table, key, where):
+    """Delete `table` rows matching `where`, PURGE_BATCH at a time."""
+
+    while True:
+        batch = select([key]).where(where).limit(PURGE_BATCH)
+        deleted = db.session.execute(
+            table.delete().where(where).where(key.in_(batch))).rowcount
+        db.session.commit()
+        if deleted < PURGE_BATCH:
+            break
@@ -0,0 +1,237 @@
+"""Versioned JSON API, for clients that update pages in place.
+
+Everything is under `/api/v1` and uses the same login session as the HTML
+pages. Message lists come back compactly: each message refers to its author
+by id, and each author is listed once under `users`. The viewer's like
+state comes back as a list of liked message ids.
+
+    GET    /api/v1/timeline?before=&limit=       the viewer's home feed
+    GET    /api/v1/users/<id>                    a profile
+    GET    /api/v1/users/<id>/messages?before=   a profile's messages
+    GET    /api/v1/messages/<id>                 one message
+    PUT    /api/v1/messages/<id>/like            like (DELETE: unlike)
+    PUT    /api/v1/users/<id>/follow             follow (DELETE: unfollow)
+    GET    /api/v1/likes?ids=1,2,3               which of these the viewer likes
+    GET    /api/v1/following?ids=1,2,3           which of these the viewer follows
+    GET    /api/v1/users/<id>/mutuals            who a user follows that follows them back
+    GET    /api/v1/suggestions?limit=            who the viewer might follow
+
+Requests that change anything must send `X-Requested-With`. Cross-site
+forms can't set that header, so it guards against CSRF.
+"""
+
+from flask import abort, Blueprint, g, jsonify, request
+from werkzeug.exceptions import HTTPException
+
+from models import db, Message, User
+import archive
+import database
+import feed
+import graph
+import interactions
+import pagination
+import timeline
+
+MAX_BATCH = 500
+
+bp = Blueprint('api', __name__, url_prefix='/api/v1')
+
+
+@bp.before_request
+def check_request():
+    """Require a login, and the CSRF guard header on writes."""
+
+    if not g.user:
+        abort(401)
+    if request.method not in ('GET', 'HEAD') and 'X-Requested-With' not in request.headers:
+        abort(403)
+
+
+@bp.errorhandler(HTTPException)
+def json_error(e):
+    """Errors as JSON, like everything else here."""
+
+    return jsonify(error=e.name, status=e.code), e.code
+
+
+##############################################################################
+# Serialization
+
+def user_json(user):
+    return {
+        'id': user.id,
+        'username': user.username,
+        'image_url': user.image_url,
+        'header_image_url': user.header_image_url,
+        'bio': user.bio,
+        'location': user.location,
+        'messages_count': user.messages_count,
+        'following_count': user.following_count,
+        'followers_count': user.followers_count,
+        'likes_count': user.likes_count,
+    }
+
+
+def author_json(user):
+    return {'id': user.id, 'username': user.username, 'image_url': user.image_url}
+
+
+def message_json(msg):
+    return {
+        'id': msg.id,
+        'text': msg.text,
+        'timestamp': msg.timestamp.isoformat(),
+        'user_id': msg.user_id,
+    }
+
+
+def messages_json(messages, next_cursor=None):
+    """A list of messages with their authors listed once and the viewer's likes."""
+
+    authors = {msg.user.id: msg.user for msg in messages}
+    body = {
+        'messages': [message_json(msg) for msg in messages],
+        'users': {str(id): author_json(user) for id, user in authors.items()},
+        'liked': sorted(feed.liked_ids(g.user, messages)),
+    }
+    if next_cursor is not None:
+        body['next'] = next_cursor
+    return body
+
+
+def ids_from_request():
+    """The `?ids=1,2,3` list, at most MAX_BATCH of them."""
+
+    try:
+        ids = [int(id) for id in request.args.get('ids', '').split(',') if id]
+    except ValueError:
+        abort(400)
+    if len(ids) > MAX_BATCH:
+        abort(400)
+    return ids
+
+
+##############################################################################
+# Reads
+
+@bp.route('/timeline')
+@database.reads_from_replica
+def timeline_page():
+    """A page of the viewer's home feed."""
+
+    page = timeline.home_page(g.user,
+                              per_page=pagination.page_size_from_request(),
+                              cursor=pagination.cursor_from_request())
+    return jsonify(messages_json(page.items, page.next_cursor))
+
+
+@bp.route('/users/<int:user_id>')
+@database.reads_from_replica
+def profile(user_id):
+    """A user's profile, and whether the viewer follows them."""
+
+    user = User.query.get_or_404(user_id)
+    body = user_json(user)
+    body['following'] = user_id in feed.following_ids(g.user, [user])
+    body['follows_you'] = graph.get().follows(user_id, g.user.id)
+    return jsonify(body)
+
+
+@bp.route('/users/<int:user_id>/messages')
+@database.reads_from_replica
+def user_messages(user_id):
+    """A page of a user's messages, newest first."""
+
+    # with the author loaded, each message's `user` comes from the session
+    User.query.get_or_404(user_id)
+    page = archive.user_messages_page(user_id,
+                                      pagination.cursor_from_request(),
+                                      pagination.page_size_from_request())
+    return jsonify(messages_json(page.items, page.next_cursor))
+
+
+@bp.route('/messages/<int:message_id>')
+@database.reads_from_replica
+def message(message_id):
+    """One message, with its author."""
+
+    msg = archive.find_message(message_id)
+    if msg is None:
+        abort(404)
+    return jsonify(messages_json([msg]))
+
+
+@bp.route('/likes')
+@database.reads_from_replica
+def likes():
+    """Which of `?ids=` the viewer likes."""
+
+    return jsonify(liked=sorted(g.user.liked_ids_among(ids_from_request())))
+
+
+@bp.route('/following')
+@database.reads_from_replica
+def following():
+    """Which of `?ids=` the viewer follows."""
+
+    return jsonify(following=sorted(g.user.following_ids_among(ids_from_request())))
+
+
+@bp.route('/users/<int:user_id>/mutuals')
+@database.reads_from_replica
+def mutuals(user_id):
+    """Ids of the users `user_id` follows who follow them back."""
+
+    return jsonify(user_id=user_id, mutuals=graph.get().mutuals(user_id)[:MAX_BATCH])
+
+
+@bp.route('/suggestions')
+@database.reads_from_replica
+def suggestions():
+    """Users followed by those the viewer follows, most shared first."""
+
+    limit = max(1, min(request.args.get('limit', 10, type=int), MAX_BATCH))
+    suggested = graph.get().who_to_follow(g.user.id, limit=limit)
+
+    users = {user.id: user for user in
+             User.query.filter(User.id.in_([id for id, _ in suggested]))}
+    return jsonify(suggestions=[
+        dict(author_json(users[id]), followed_by=count)
+        for id, count in suggested if id in users])
+
+
+##############################################################################
+# Writes
+
+@bp.route('/messages/<int:message_id>/like', methods=['PUT', 'DELETE'])
+def like(message_id):
+    """Like a message (PUT) or stop liking it (DELETE)."""
+
+    msg = Message.query.get_or_404(message_id)
+    if msg.user_id == g.user.id:
+        abort(400)
+
+    if request.method == 'PUT':
+        changed = interactions.like(g.user.id, message_id)
+    else:
+        changed = interactions.unlike(g.user.id, message_id)
+    db.session.commit()
+
+    return jsonify(message_id=message_id, liked=request.method == 'PUT', changed=changed)
+
+
+@bp.route('/users/<int:user_id>/follow', methods=['PUT', 'DELETE'])
+def follow(user_id):
+    """Follow a user (PUT) or stop following them (DELETE)."""
+
+    User.query.get_or_404(user_id)
+    if user_id == g.user.id:
+        abort(400)
+
+    if request.method == 'PUT':
+        changed = interactions.follow(g.user.id, user_id)
+    else:
+        changed = interactions.unfollow(g.user.id, user_id)
+    db.session.commit()
+
+    return jsonify(user_id=user_id, following=request.method == 'PUT', changed=changed)
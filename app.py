@@ -1,31 +1,38 @@
 import os
 
-from flask import Flask, render_template, request, flash, redirect, session, g
-from flask_debugtoolbar import DebugToolbarExtension
+import click
+from flask import abort, Blueprint, Flask, current_app, render_template, request, flash, redirect, session, g, jsonify, url_for
+from flask.cli import with_appcontext
 from sqlalchemy.exc import IntegrityError
-from sqlalchemy import or_
-from sqlalchemy.testing import in_
+from werkzeug.exceptions import Unauthorized
 from forms import UserAddForm, LoginForm, MessageForm, EditProfileForm, LikeForm
 from models import db, connect_db, User, Message, Like
+import accounts
+import api
+import archive
+import config
+import counters
+import database
+import feed
+import follows
+import fragments
+import graph
+import httpcache
+import instrumentation
+import interactions
+import jobs
+import migrations
+import pagination
+import passwords
+import search
+import snowflake
+import timeline
+import usercache
 
 CURR_USER_KEY = "curr_user"
 
-app = Flask(__name__)
-
-# Get DB_URI from environ variable (useful for production/testing) or,
-# if not set there, use development local db.
-app.config['SQLALCHEMY_DATABASE_URI'] = (
-    os.environ.get('DATABASE_URL', 'postgres:///warbler'))
-
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-app.config['SQLALCHEMY_ECHO'] = False
-app.config['DEBUG_TB_INTERCEPT_REDIRECTS'] = True
-app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', "it's a secret")
-app.config['DEBUG_TB_INTERCEPT_REDIRECTS'] = False
-
-toolbar = DebugToolbarExtension(app)
-
-connect_db(app)
+# All of Warbler's routes; create_app registers them on an app.
+bp = Blueprint('warbler', __name__)
 
 
 ##############################################################################
@@ -36,12 +43,16 @@ connect_db(app)
 # If the function returns a non-None value, 
 # it’s handled as if it was the return value from the view 
 # and further request handling is stopped.
-@app.before_request
+@bp.before_app_request
 def add_user_to_g():
-    """If we're logged in, add curr user to Flask global."""
+    """If we're logged in, add curr user to Flask global.
+
+    g.user is a cached snapshot of the user (see usercache.py); the full
+    User row is only loaded if the view needs more than the basics.
+    """
 
     if CURR_USER_KEY in session:
-        g.user = User.query.get(session[CURR_USER_KEY])
+        g.user = usercache.load(session[CURR_USER_KEY])
 
     else:
         g.user = None
@@ -60,7 +71,7 @@ def do_logout():
         del session[CURR_USER_KEY]
 
 
-@app.route('/signup', methods=["GET", "POST"])
+@bp.route('/signup', methods=["GET", "POST"])
 def signup():
     """Handle user signup.
 
@@ -96,7 +107,7 @@ def signup():
         return render_template('users/signup.html', form=form)
 
 
-@app.route('/login', methods=["GET", "POST"])
+@bp.route('/login', methods=["GET", "POST"])
 def login():
     """Handle user login."""
 
@@ -107,6 +118,8 @@ def login():
                                  form.password.data)
 
         if user:
+            # saves the password hash if authenticate upgraded its cost
+            db.session.commit()
             do_login(user)
             flash(f"Hello, {user.username}!", "success")
             return redirect("/")
@@ -116,7 +129,7 @@ def login():
     return render_template('users/login.html', form=form)
 
 
-@app.route('/logout')
+@bp.route('/logout')
 def logout():
     """Handle logout of user."""
 
@@ -130,41 +143,72 @@ def logout():
 ##############################################################################
 # General user routes:
 
-@app.route('/users')
+@bp.route('/users')
+@database.reads_from_replica
 def list_users():
     """Page with listing of users.
 
-    Can take a 'q' param in querystring to search by that username.
+    Can take a 'q' param in querystring to search by username, bio and
+    location (best matches first). Both the listing and the search results
+    are paginated.
     """
 
-    search = request.args.get('q')
+    term = request.args.get('q', '').strip()
+    per_page = current_app.config['USERS_PAGE_SIZE']
 
-    if not search:
-        users = User.query.all()
+    if not term:
+        users, next_after = search.browse(request.args.get('after', type=int),
+                                          per_page)
+        next_url = next_after and url_for('.list_users', after=next_after)
     else:
-        users = User.query.filter(User.username.like(f"%{search}%")).all()
+        page = request.args.get('page', 1, type=int)
+        users, has_next = search.search(term, page, per_page)
+        next_url = has_next and url_for('.list_users', q=term, page=page + 1)
+
+    return render_template('users/index.html',
+                           users=users,
+                           next_url=next_url,
+                           following_ids=feed.following_ids(g.user, users))
+
+
+@bp.route('/users/autocomplete')
+@database.reads_from_replica
+def users_autocomplete():
+    """JSON list of users whose username starts with the 'q' param."""
 
-    return render_template('users/index.html', users=users)
+    prefix = request.args.get('q', '').strip()
+    users = search.autocomplete(prefix) if prefix else []
 
+    return jsonify([dict(id=user.id,
+                         username=user.username,
+                         image_url=user.image_url)
+                    for user in users])
 
-@app.route('/users/<int:user_id>')
+
+@bp.route('/users/<int:user_id>')
+@database.reads_from_replica
+@httpcache.conditional(httpcache.profile_stamp)
 def users_show(user_id):
     """Show user profile."""
 
     user = User.query.get_or_404(user_id)
 
-    # snagging messages in order from the database;
+    # snagging messages in order from the database, one page at a time;
     # user.messages won't be in order by default
-    messages = (Message
-                .query
-                .filter(Message.user_id == user_id)
-                .order_by(Message.timestamp.desc())
-                .limit(100)
-                .all())
-    return render_template('users/show.html', user=user, messages=messages, redirect_to=f"/users/{user.id}")
+    page = archive.user_messages_page(user_id,
+                                      pagination.cursor_from_request(),
+                                      pagination.page_size_from_request())
+
+    return render_template('users/show.html',
+                           user=user,
+                           messages=page.items,
+                           liked_ids=feed.liked_ids(g.user, page.items),
+                           next_cursor=page.next_cursor,
+                           redirect_to=f"/users/{user.id}")
 
 
-@app.route('/users/<int:user_id>/following')
+@bp.route('/users/<int:user_id>/following')
+@database.reads_from_replica
 def show_following(user_id):
     """Show list of people this user is following."""
     
@@ -174,10 +218,21 @@ def show_following(user_id):
         return redirect("/")
 
     user = User.query.get_or_404(user_id)
-    return render_template('users/following.html', user=user)
+    users, next_after = follows.following_page(user_id,
+                                               request.args.get('after', type=int),
+                                               current_app.config['USERS_PAGE_SIZE'])
+
+    return render_template('users/following.html',
+                           user=user,
+                           users=users,
+                           next_url=next_after and url_for('.show_following',
+                                                           user_id=user_id,
+                                                           after=next_after),
+                           following_ids=feed.following_ids(g.user, users))
 
 
-@app.route('/users/<int:user_id>/followers')
+@bp.route('/users/<int:user_id>/followers')
+@database.reads_from_replica
 def users_followers(user_id):
     """Show list of followers of this user."""
 
@@ -186,10 +241,21 @@ def users_followers(user_id):
         return redirect("/")
 
     user = User.query.get_or_404(user_id)
-    return render_template('users/followers.html', user=user)
+    users, next_after = follows.followers_page(user_id,
+                                               request.args.get('after', type=int),
+                                               current_app.config['USERS_PAGE_SIZE'])
 
+    return render_template('users/followers.html',
+                           user=user,
+                           users=users,
+                           next_url=next_after and url_for('.users_followers',
+                                                           user_id=user_id,
+                                                           after=next_after),
+                           following_ids=feed.following_ids(g.user, users))
 
-@app.route('/users/<int:user_id>/likes')
+
+@bp.route('/users/<int:user_id>/likes')
+@database.reads_from_replica
 def users_likes(user_id):
     """Show list of messages that the user likes."""
 
@@ -197,10 +263,31 @@ def users_likes(user_id):
         flash("Access unauthorized.", "danger")
         return redirect("/")
     user = User.query.get_or_404(user_id)
-    return render_template('users/likes.html', user=user, redirect_to=f'/users/{user.id}/likes')
-
 
-@app.route('/users/follow/<int:follow_id>', methods=['POST'])
+    # the profile owner's likes, most recently liked first
+    liked = (feed.with_authors(Message.query)
+             .join(Like, Like.message_id == Message.id)
+             .filter(Like.user_id == user.id)
+             .add_columns(Like.created_at))
+    page = pagination.paginate(liked,
+                               Like.created_at,
+                               Like.message_id,
+                               pagination.cursor_from_request(),
+                               pagination.page_size_from_request(),
+                               key=lambda row: (row.created_at, row.Message.id))
+    messages = [row.Message for row in page.items]
+
+    return render_template('users/likes.html',
+                           user=user,
+                           messages=messages,
+                           liked_ids=feed.liked_ids(g.user, messages),
+                           following_ids=feed.following_ids(
+                               g.user, [msg.user for msg in messages]),
+                           next_cursor=page.next_cursor,
+                           redirect_to=f'/users/{user.id}/likes')
+
+
+@bp.route('/users/follow/<int:follow_id>', methods=['POST'])
 def add_follow(follow_id):
     """Add a follow for the currently-logged-in user."""
 
@@ -209,13 +296,13 @@ def add_follow(follow_id):
         return redirect("/")
 
     followee = User.query.get_or_404(follow_id)
-    g.user.following.append(followee)
+    interactions.follow(g.user.id, followee.id)
     db.session.commit()
 
     return redirect(f"/users/{g.user.id}/following")
 
 
-@app.route('/users/stop-following/<int:follow_id>', methods=['POST'])
+@bp.route('/users/stop-following/<int:follow_id>', methods=['POST'])
 def stop_following(follow_id):
     """Have currently-logged-in-user stop following this user."""
 
@@ -223,14 +310,13 @@ def stop_following(follow_id):
         flash("Access unauthorized.", "danger")
         return redirect("/")
 
-    followee = User.query.get(follow_id)
-    g.user.following.remove(followee)
+    interactions.unfollow(g.user.id, follow_id)
     db.session.commit()
 
     return redirect("/users")
 
 
-@app.route('/users/profile', methods=["GET", "POST"])
+@bp.route('/users/profile', methods=["GET", "POST"])
 def profile():
     """Update profile for current user."""
 
@@ -246,13 +332,20 @@ def profile():
                            location=g.user.location)
 
     if form.validate_on_submit():
-        user=User.authenticate(form.username.data, form.password.data)
+        user = g.user.model
+
+        # check the password against the current user directly, rather than
+        # looking them up again by the (possibly changed) username
+        if not passwords.check_password(user.password, form.password.data):
+            flash("Wrong password, please try again.", 'danger')
+            return render_template('/users/edit.html', form=form)
 
         user.username = form.username.data
         user.email = form.email.data
         user.image_url = form.image_url.data
         user.bio = form.bio.data
         user.location = form.location.data
+        user.profile_version += 1
 
         # The consequence of having 
         #### user.password = form.password.data ####
@@ -262,12 +355,14 @@ def profile():
         # and can't find salt key, hence the error "invalid Salt"
         
         db.session.commit()
+        usercache.invalidate(g.user.id)
+        fragments.forget_user(g.user.id)
         return redirect(f'/users/{g.user.id}')
         
     return render_template('/users/edit.html', form=form)
 
 
-@app.route('/users/delete', methods=["POST"])
+@bp.route('/users/delete', methods=["POST"])
 def delete_user():
     """Delete user."""
 
@@ -276,10 +371,11 @@ def delete_user():
         return redirect("/")
 
     do_logout()
-    
-    msgs = Message.query.filter(Message.user_id==g.user.id).delete()
-    db.session.delete(g.user)
+
+    accounts.delete(g.user.id)
     db.session.commit()
+    usercache.invalidate(g.user.id)
+    fragments.forget_user(g.user.id)
 
     return redirect("/signup")
 
@@ -287,7 +383,7 @@ def delete_user():
 ##############################################################################
 # Messages routes:
 
-@app.route('/messages/new', methods=["GET", "POST"])
+@bp.route('/messages/new', methods=["GET", "POST"])
 def messages_add():
     """Add a message:
 
@@ -301,8 +397,12 @@ def messages_add():
     form = MessageForm()
 
     if form.validate_on_submit():
-        msg = Message(text=form.text.data)
-        g.user.messages.append(msg)
+        # not g.user.messages.append(), which loads all the user's messages
+        msg = Message(text=form.text.data, user_id=g.user.id)
+        db.session.add(msg)
+        db.session.flush()
+        counters.adjust(g.user.id, messages_count=1)
+        timeline.fan_out(msg)
         db.session.commit()
 
         return redirect(f"/users/{g.user.id}")
@@ -310,27 +410,36 @@ def messages_add():
     return render_template('messages/new.html', form=form)
 
 
-@app.route('/messages/<int:message_id>', methods=["GET"])
+@bp.route('/messages/<int:message_id>', methods=["GET"])
+@database.reads_from_replica
+@httpcache.conditional(httpcache.message_stamp)
 def messages_show(message_id):
     """Show a message."""
 
-    msg = Message.query.get(message_id)
+    msg = archive.find_message(message_id)
+    if msg is None:
+        abort(404)
+
     return render_template('messages/show.html', message=msg)
 
 
-@app.route('/messages/<int:message_id>/delete', methods=["POST"])
+@bp.route('/messages/<int:message_id>/delete', methods=["POST"])
 def messages_destroy(message_id):
     """Delete a message."""
-    msg = Message.query.get(message_id)
+    msg = archive.find_message(message_id)
 
     # making sure a user cannot delete messages posted by another user
-    if not g.user or g.user.id != msg.user_id:
+    if not g.user or msg is None or g.user.id != msg.user_id:
         flash("Access unauthorized.", "danger")
         return redirect("/")
 
-
-    db.session.delete(msg)
+    if msg.archived:
+        archive.delete_archived(msg)
+    else:
+        counters.message_deleted(msg)
+        db.session.delete(msg)
     db.session.commit()
+    fragments.forget_message(message_id)
 
     return redirect(f"/users/{g.user.id}")
 
@@ -338,65 +447,188 @@ def messages_destroy(message_id):
 ##############################################################################
 # Homepage and error pages
 
+@bp.app_errorhandler(usercache.UserGone)
+def logged_in_user_gone(e):
+    """The account was deleted elsewhere; end its session."""
+
+    do_logout()
+    if request.blueprint == api.bp.name:
+        return api.json_error(Unauthorized())
+    return redirect("/login")
+
+
+@bp.app_errorhandler(passwords.HasherBusy)
+def password_hasher_busy(e):
+    """Shed login/signup load instead of queueing more bcrypt work."""
 
-@app.route('/')
+    return "Too many logins right now, please try again shortly.", 503, {'Retry-After': '1'}
+
+
+@bp.route('/')
+@database.reads_from_replica
 def homepage():
     """Show homepage:
     - anon users: no messages
-    - logged in: 100 most recent messages of followees
+    - logged in: most recent messages of followees, a page at a time, read
+      from the user's materialized timeline (see timeline.py)
     """
     form = LikeForm()
 
     if g.user:
-        following_ids = [u.id for u in g.user.following]  
-        messages = (Message
-                    .query
-                    .filter(or_(Message.user_id == g.user.id, 
-                                Message.user_id.in_(following_ids)))
-                    .order_by(Message.timestamp.desc())
-                    .limit(100)
-                    .all())
-       
-        return render_template('home.html', messages=messages, user=g.user, form = form, redirect_to='/')
+        page = timeline.home_page(g.user,
+                                  per_page=pagination.page_size_from_request(),
+                                  cursor=pagination.cursor_from_request())
+
+        return render_template('home.html',
+                               messages=page.items,
+                               liked_ids=feed.liked_ids(g.user, page.items),
+                               next_cursor=page.next_cursor,
+                               user=g.user,
+                               # not among the cached fields of g.user
+                               counts=counters.of(g.user.id),
+                               form=form,
+                               redirect_to='/')
 
     else:
         return render_template('home-anon.html')
 
-@app.route('/like-unlike', methods=['POST'])
+@bp.route('/like-unlike', methods=['POST'])
 def like_unlike():
     """" handles like/unlike logic, when called by clicking on the icon"""
     # form = LikeForm()
-    message_id = request.form.get('message_id')
+    message_id = request.form.get('message_id', type=int)
 
     # if form.validate_on_submit():
-    like = db.session.query(Like).filter(Like.user_id==g.user.id, Like.message_id==message_id).first()
-    
-    if not like:
-        like = Like(user_id=g.user.id, message_id=message_id)
-        
-        db.session.add(like)
-        db.session.commit()
-    
-    else:
-        db.session.delete(like)
-        db.session.commit()
-        
+    interactions.toggle_like(g.user.id, message_id)
+    db.session.commit()
+
     return redirect(request.form.get('redirect_to'))
 
 
+@click.command('db-upgrade')
+@with_appcontext
+def db_upgrade():
+    """Apply pending schema migrations (see migrations.py)."""
+
+    migrations.upgrade()
+
+
+@click.command('reconcile-counters')
+@with_appcontext
+def reconcile_counters():
+    """Recompute every user's denormalized counters from the source tables."""
+
+    counters.reconcile()
+    db.session.commit()
+
+
+@click.command('rebuild-timelines')
+@with_appcontext
+def rebuild_timelines():
+    """Rebuild every user's materialized home timeline."""
+
+    timeline.rebuild_all()
+    db.session.commit()
+
+
+@click.command('archive-messages')
+@with_appcontext
+def archive_messages():
+    """Move cold messages into the archive (see archive.py)."""
+
+    click.echo(f"Archived {archive.archive_cold_messages()} messages")
+
+
+@click.command('graph-snapshot')
+@with_appcontext
+def graph_snapshot():
+    """Write the follow graph snapshot named by GRAPH_SNAPSHOT (see graph.py)."""
+
+    path = current_app.config['GRAPH_SNAPSHOT']
+    if not path:
+        raise click.UsageError("GRAPH_SNAPSHOT isn't set")
+
+    graph.FollowGraph.from_database().save(path)
+    click.echo(f"Wrote {path}")
+
+
+@click.command('run-worker')
+@click.option('--burst', is_flag=True, help="Exit once the queue is empty.")
+@click.option('--poll', default=jobs.DEFAULT_POLL_INTERVAL, show_default=True,
+              help="Seconds to wait between polls of an empty queue.")
+@with_appcontext
+def run_worker(burst, poll):
+    """Run background jobs (see jobs.py)."""
+
+    if burst:
+        click.echo(f"Ran {jobs.run_pending()} jobs")
+    else:
+        jobs.work(poll_interval=poll)
+
+
 ##############################################################################
-# Turn off all caching in Flask
-#   (useful for dev; in production, this kind of stuff is typically
-#   handled elsewhere)
-#
-# https://stackoverflow.com/questions/34066804/disabling-caching-in-flask
-
-@app.after_request
-def add_header(req):
-    """Add non-caching headers on every request."""
-
-    req.headers["Cache-Control"] = "no-cache, no-store, must-revalidate"
-    req.headers["Pragma"] = "no-cache"
-    req.headers["Expires"] = "0"
-    req.headers['Cache-Control'] = 'public, max-age=0'
-    return req
+# HTTP caching (see httpcache.py)
+
+@bp.after_app_request
+def set_cache_headers(response):
+    """Default Cache-Control / Vary for pages, long-lived static assets."""
+
+    return httpcache.apply_policy(response)
+
+
+##############################################################################
+# App factory
+
+def create_app(config_name=None):
+    """Build a Warbler app with the named config profile (see config.py).
+
+    Dev-only extensions are imported here, only for the profiles that use
+    them, so production workers never load them.
+    """
+
+    app = Flask(__name__)
+    app.config.from_object(config.profile(config_name))
+    if 'DATABASE_URL' in os.environ:
+        app.config['SQLALCHEMY_DATABASE_URI'] = os.environ['DATABASE_URL']
+    if 'DATABASE_REPLICA_URL' in os.environ:
+        app.config['SQLALCHEMY_BINDS'] = {
+            database.REPLICA: os.environ['DATABASE_REPLICA_URL']}
+
+    app.jinja_env.globals['next_page_url'] = pagination.next_page_url
+    app.jinja_env.globals['message_item'] = fragments.message_item
+    app.jinja_env.globals['profile_header'] = fragments.profile_header
+    app.jinja_env.globals['static_url'] = httpcache.static_url
+
+    if app.config['DEBUG_TOOLBAR']:
+        from flask_debugtoolbar import DebugToolbarExtension
+        DebugToolbarExtension(app)
+
+    connect_db(app)
+    # before the blueprint, so the queries of its request hooks are counted
+    instrumentation.init_app(app)
+    snowflake.init_app(app)
+    app.register_blueprint(bp)
+    app.register_blueprint(api.bp)
+
+    for command in [db_upgrade, reconcile_counters, rebuild_timelines,
+                    archive_messages, graph_snapshot, run_worker]:
+        app.cli.add_command(command)
+
+    if app.config['JOBS_WORKER_THREADS'] and not app.config['JOBS_EAGER']:
+        jobs.start_worker_threads(app, app.config['JOBS_WORKER_THREADS'])
+
+    return app
+
+
+def __getattr__(name):
+    """Build the default app the first time `app.app` is used.
+
+    Keeps `from app import app` (tests, scripts, `flask run`) working,
+    while `gunicorn 'app:create_app("production")'` only builds the
+    production app.
+    """
+
+    if name == 'app':
+        globals()['app'] = create_app()
+        return globals()['app']
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,163 @@
+"""Archive of cold messages.
+
+Feeds, timelines and profile pages only read recent messages, but the
+`messages` table and its indexes would otherwise grow with the whole
+history. `archive_cold_messages` moves messages older than
+MESSAGE_ARCHIVE_AFTER_DAYS into `message_archive`, a batch per transaction,
+so the hot table, its indexes and its vacuums stay the size of the recent
+past.
+
+On Postgres the archive is range-partitioned by month; partitions are
+created as messages are moved into them, and old months can be detached,
+dumped or moved to cheaper storage on their own. Elsewhere it's a plain
+table.
+
+Archived messages are read-only history. They leave home timelines and
+can't be liked any more. Their likes move to `like_archive` and stop
+counting towards the likers' likes. Their pages still work (see
+`find_message`), profiles page on into the archive once the live messages
+run out (see `user_messages_page`), and they still count towards their
+author's messages. Run it from cron or a scheduler with
+
+    FLASK_APP=app.py flask archive-messages
+"""
+
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import func, select, text
+
+from models import db, ArchivedLike, ArchivedMessage, Like, Message, TimelineEntry
+import counters
+import pagination
+
+DEFAULT_AFTER_DAYS = 365
+# keeps `IN (...)` lists under SQLite's parameter limit
+DEFAULT_BATCH = 500
+
+
+def find_message(message_id):
+    """The message with `message_id`, hot or archived, or None."""
+
+    return (Message.query.get(message_id)
+            or ArchivedMessage.query.filter(ArchivedMessage.id == message_id).first())
+
+
+def author_of(message_id):
+    """The id of the author of `message_id`, hot or archived, or None."""
+
+    for model in (Message, ArchivedMessage):
+        author_id = (db.session.query(model.user_id)
+                     .filter(model.id == message_id)
+                     .scalar())
+        if author_id is not None:
+            return author_id
+    return None
+
+
+def user_messages_page(user_id, cursor, per_page):
+    """A Page of `user_id`'s messages, newest first, hot then archived.
+
+    Archived messages are all older than hot ones, so the archive is only
+    read once the hot messages run out.
+    """
+
+    rows = pagination.newest_first(Message.query.filter(Message.user_id == user_id),
+                                   Message.timestamp, Message.id,
+                                   cursor, per_page + 1)
+    if len(rows) <= per_page:
+        rows += pagination.newest_first(
+            ArchivedMessage.query.filter(ArchivedMessage.user_id == user_id),
+            ArchivedMessage.timestamp, ArchivedMessage.id,
+            cursor, per_page + 1 - len(rows))
+
+    return pagination.page_of(rows, per_page)
+
+
+def delete_archived(msg):
+    """Delete archived message `msg` and its likes; the caller commits."""
+
+    counters.adjust(msg.user_id, messages_count=-1)
+    (ArchivedLike
+     .query
+     .filter(ArchivedLike.message_id == msg.id)
+     .delete(synchronize_session=False))
+    db.session.delete(msg)
+
+
+def partition_name(month):
+    return f"message_archive_{month:%Y_%m}"
+
+
+def ensure_partitions(oldest, newest):
+    """Create the monthly partitions covering `oldest` to `newest` (Postgres)."""
+
+    if db.session.connection().dialect.name != 'postgresql':
+        return
+
+    month = oldest.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    while month <= newest:
+        next_month = (month + timedelta(days=32)).replace(day=1)
+        db.session.execute(text(
+            f"CREATE TABLE IF NOT EXISTS {partition_name(month)} "
+            f"PARTITION OF message_archive "
+            f"FOR VALUES FROM ('{month:%Y-%m-%d}') TO ('{next_month:%Y-%m-%d}')"))
+        month = next_month
+
+
+def archive_batch(cutoff, batch_size=DEFAULT_BATCH):
+    """Move up to `batch_size` of the oldest messages before `cutoff`; how many."""
+
+    ids = [id for (id,) in (db.session
+                            .query(Message.id)
+                            .filter(Message.timestamp < cutoff)
+                            .order_by(Message.timestamp, Message.id)
+                            .limit(batch_size))]
+    if not ids:
+        return 0
+
+    oldest, newest = (db.session
+                      .query(func.min(Message.timestamp), func.max(Message.timestamp))
+                      .filter(Message.id.in_(ids))
+                      .one())
+    ensure_partitions(oldest, newest)
+
+    columns = [Message.id, Message.text, Message.timestamp, Message.user_id]
+    db.session.execute(ArchivedMessage.__table__.insert().from_select(
+        ['id', 'text', 'timestamp', 'user_id'],
+        select(columns).where(Message.id.in_(ids))))
+
+    db.session.execute(ArchivedLike.__table__.insert().from_select(
+        ['user_id', 'message_id', 'created_at'],
+        select([Like.user_id, Like.message_id, Like.created_at])
+        .where(Like.message_id.in_(ids))))
+
+    # the authors' profiles change too: their messages now page from here
+    counters.adjust(select([Message.user_id]).where(Message.id.in_(ids)))
+    counters.likes_removed(ids)
+    # by hand: SQLite doesn't cascade unless foreign keys are turned on
+    Like.query.filter(Like.message_id.in_(ids)).delete(synchronize_session=False)
+    (TimelineEntry
+     .query
+     .filter(TimelineEntry.message_id.in_(ids))
+     .delete(synchronize_session=False))
+    Message.query.filter(Message.id.in_(ids)).delete(synchronize_session=False)
+
+    db.session.commit()
+    return len(ids)
+
+
+def archive_cold_messages(now=None):
+    """Archive every message older than MESSAGE_ARCHIVE_AFTER_DAYS; how many."""
+
+    config = current_app.config
+    days = config.get('MESSAGE_ARCHIVE_AFTER_DAYS', DEFAULT_AFTER_DAYS)
+    batch_size = config.get('MESSAGE_ARCHIVE_BATCH', DEFAULT_BATCH)
+    cutoff = (now or datetime.utcnow()) - timedelta(days=days)
+
+    moved = 0
+    while True:
+        count = archive_batch(cutoff, batch_size)
+        moved += count
+        if count < batch_size:
+            return moved
@@ -0,0 +1,344 @@
+"""End-to-end latency benchmark for Warbler's busiest HTTP endpoints.
+
+Seeds a database from the generator CSVs and requests each endpoint many
+times as logged-in users, then reports p50/p95/p99 latency, throughput and
+SQL queries per request, and saves the numbers as JSON so runs on different
+commits can be compared. From the repository root:
+
+    # throwaway SQLite database seeded from generator/*.csv
+    python -m benchmarks.http_bench --seed
+
+    # a generated data set of 20,000 users, on Postgres
+    python -m benchmarks.http_bench --database-url postgresql:///warbler-bench \\
+        --seed --generate 20000 --output results/$(git rev-parse --short HEAD).json
+
+    # compare with an earlier run
+    python -m benchmarks.http_bench --compare results/abc1234.json
+
+By default requests go through the Flask test client, in process. With
+`--url http://127.0.0.1:8000` they go to a running server (e.g. gunicorn,
+see Procfile) instead, logging in with the generator's password; SQL
+queries can't be counted from outside, so that column is left empty.
+"""
+
+import argparse
+import http.cookiejar
+import json
+import os
+import platform
+import random
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from datetime import datetime
+
+DEFAULT_DB_PATH = os.path.join(tempfile.gettempdir(), 'warbler-http-bench.db')
+# the generator's users all have this password
+PASSWORD = 'password'
+
+
+def percentile(samples, pct):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * pct / 100))]
+
+
+def load_app(database_url):
+    """Import the app against `database_url` (it reads DATABASE_URL on import)."""
+
+    os.environ['DATABASE_URL'] = database_url
+    from app import app
+
+    return app
+
+
+def generate(users, seed):
+    """Run the generator for a data set scaled from `users`; return its directory."""
+
+    out = tempfile.mkdtemp(prefix='warbler-bench-')
+    subprocess.run([sys.executable, os.path.join('generator', 'create_csvs.py'),
+                    '--users', str(users), '--messages', str(users * 5),
+                    '--follows', str(users * 20), '--likes', str(users * 10),
+                    '--seed', str(seed), '--out', out],
+                   check=True, stdout=subprocess.DEVNULL)
+    return out
+
+
+def seed_database(app, data_dir):
+    import loader
+
+    with app.app_context():
+        loader.load(data_dir, reset=True,
+                    progress=lambda line: print(line, file=sys.stderr))
+
+
+class QueryCounter:
+    """Count SQL statements per thread (the test client runs requests in the
+    calling thread)."""
+
+    def __init__(self, engine):
+        from sqlalchemy import event
+
+        self.local = threading.local()
+        event.listen(engine, 'before_cursor_execute', self._count)
+
+    def _count(self, *args):
+        self.local.count = getattr(self.local, 'count', 0) + 1
+
+    def reset(self):
+        self.local.count = 0
+
+    @property
+    def count(self):
+        return getattr(self.local, 'count', 0)
+
+
+class TestClientSession:
+    """A logged-in user, talking to the app in process."""
+
+    def __init__(self, app, user_id, queries):
+        from app import CURR_USER_KEY
+
+        self.client = app.test_client()
+        self.queries = queries
+        with self.client.session_transaction() as sess:
+            sess[CURR_USER_KEY] = user_id
+
+    def request(self, method, path, data=None):
+        self.queries.reset()
+        resp = self.client.open(path, method=method, data=data)
+        return resp.status_code, self.queries.count
+
+
+class HTTPSession:
+    """A logged-in user, talking to a running server over HTTP."""
+
+    CSRF_RE = re.compile(r'name="csrf_token" type="hidden" value="([^"]+)"')
+
+    def __init__(self, base_url, username):
+        self.base_url = base_url.rstrip('/')
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()),
+            NoRedirect())
+
+        self.csrf_token = self._csrf_token('/login')
+        status, _ = self.request('POST', '/login',
+                                 {'username': username, 'password': PASSWORD})
+        if status != 302:
+            raise RuntimeError(f"couldn't log in as {username} (HTTP {status})")
+        self.csrf_token = self._csrf_token('/messages/new')
+
+    def _csrf_token(self, path):
+        with self.opener.open(self.base_url + path) as resp:
+            match = self.CSRF_RE.search(resp.read().decode())
+        return match.group(1) if match else None
+
+    def request(self, method, path, data=None):
+        body = None
+        if method == 'POST':
+            data = dict(data or {}, csrf_token=self.csrf_token)
+            body = urllib.parse.urlencode(data).encode()
+        try:
+            with self.opener.open(urllib.request.Request(
+                    self.base_url + path, data=body, method=method)) as resp:
+                resp.read()
+                return resp.status, None
+        except urllib.error.HTTPError as e:
+            return e.code, None
+
+
+class NoRedirect(urllib.request.HTTPRedirectHandler):
+    """Report redirects instead of following them, like the test client."""
+
+    def redirect_request(self, *args):
+        return None
+
+
+def scenarios(rng, user_ids, message_ids):
+    """The benchmarked endpoints, as (name, method, make_path, make_data)."""
+
+    def any_user():
+        return rng.choice(user_ids)
+
+    def any_message():
+        return rng.choice(message_ids)
+
+    return [
+        ("GET /", 'GET', lambda: '/', None),
+        ("GET /users", 'GET', lambda: '/users', None),
+        ("GET /users/<id>", 'GET', lambda: f'/users/{any_user()}', None),
+        ("GET /users/<id>/likes", 'GET', lambda: f'/users/{any_user()}/likes', None),
+        ("GET /messages/new", 'GET', lambda: '/messages/new', None),
+        ("POST /messages/new", 'POST', lambda: '/messages/new',
+         lambda: {'text': f"benchmark message {rng.random()}"}),
+        ("POST /like-unlike", 'POST', lambda: '/like-unlike',
+         lambda: {'message_id': any_message(), 'redirect_to': '/'}),
+    ]
+
+
+def run_endpoint(sessions, scenario, requests, warmup):
+    """Send `requests` requests to one endpoint, one thread per session."""
+
+    name, method, make_path, make_data = scenario
+    todo = iter(range(requests + warmup * len(sessions)))
+    lock = threading.Lock()
+    latencies, query_counts, errors = [], [], []
+
+    def worker(session, warmup_left):
+        while True:
+            with lock:
+                if next(todo, None) is None:
+                    return
+                path, data = make_path(), make_data() if make_data else None
+
+            start = time.perf_counter()
+            try:
+                status, queries = session.request(method, path, data)
+            except Exception as e:
+                status, queries = repr(e), None
+            elapsed = time.perf_counter() - start
+
+            if warmup_left:
+                warmup_left -= 1
+                continue
+            with lock:
+                if not isinstance(status, int) or status >= 400:
+                    errors.append(status)
+                latencies.append(elapsed)
+                if queries is not None:
+                    query_counts.append(queries)
+
+    threads = [threading.Thread(target=worker, args=(session, warmup))
+               for session in sessions]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - start
+
+    return {
+        'requests': len(latencies),
+        'errors': len(errors),
+        'error_samples': [str(e) for e in errors[:5]],
+        'p50_ms': round(statistics.median(latencies) * 1000, 2),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 2),
+        'mean_ms': round(statistics.mean(latencies) * 1000, 2),
+        'throughput_rps': round(len(latencies) / wall, 1),
+        'queries_per_request': (round(statistics.mean(query_counts), 2)
+                                if query_counts else None),
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'],
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_results(results, baseline=None):
+    header = (f"{'endpoint':<24} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} "
+              f"{'req/s':>8} {'queries':>8} {'errors':>7}")
+    if baseline:
+        header += f" {'p95 vs base':>12}"
+    print(header)
+
+    for name, row in results['endpoints'].items():
+        queries = row['queries_per_request']
+        line = (f"{name:<24} {row['p50_ms']:>8.1f} {row['p95_ms']:>8.1f} "
+                f"{row['p99_ms']:>8.1f} {row['throughput_rps']:>8.1f} "
+                f"{queries if queries is not None else '-':>8} {row['errors']:>7}")
+        before = baseline and baseline['endpoints'].get(name)
+        if before:
+            change = (row['p95_ms'] - before['p95_ms']) / max(before['p95_ms'], 1e-9)
+            line += f" {change:>+11.0%}"
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--database-url', default=f"sqlite:///{DEFAULT_DB_PATH}")
+    parser.add_argument('--seed', action='store_true',
+                        help="(re)create the database from the CSVs first")
+    parser.add_argument('--data-dir', default='generator',
+                        help="CSVs to seed from")
+    parser.add_argument('--generate', type=int, metavar='USERS',
+                        help="seed from a freshly generated data set of this many users")
+    parser.add_argument('--url', help="benchmark a running server instead of the test client")
+    parser.add_argument('--requests', type=int, default=200,
+                        help="measured requests per endpoint")
+    parser.add_argument('--warmup', type=int, default=5,
+                        help="unmeasured requests per client before measuring")
+    parser.add_argument('--concurrency', type=int, default=4,
+                        help="concurrent clients, each logged in as a different user")
+    parser.add_argument('--random-seed', type=int, default=0)
+    parser.add_argument('--output', help="write the results as JSON to this file")
+    parser.add_argument('--compare', help="JSON results of an earlier run to compare p95 with")
+    args = parser.parse_args()
+
+    app = load_app(args.database_url)
+    app.config['WTF_CSRF_ENABLED'] = bool(args.url)
+
+    from models import db, Message, User
+
+    if args.seed or args.generate:
+        data_dir = generate(args.generate, args.random_seed) if args.generate else args.data_dir
+        seed_database(app, data_dir)
+
+    with app.app_context():
+        user_ids = [id for (id,) in db.session.query(User.id)]
+        message_ids = [id for (id,) in db.session.query(Message.id)]
+        # log in as the users following the most people: the heaviest timelines
+        viewers = (User.query.order_by(User.following_count.desc(), User.id)
+                   .limit(args.concurrency).all())
+        viewers = [(user.id, user.username) for user in viewers]
+        dataset = {'users': len(user_ids), 'messages': len(message_ids)}
+
+    if not user_ids or not message_ids:
+        parser.error("the database is empty; run with --seed")
+
+    if args.url:
+        sessions = [HTTPSession(args.url, username) for _, username in viewers]
+    else:
+        queries = QueryCounter(db.get_engine(app))
+        sessions = [TestClientSession(app, user_id, queries) for user_id, _ in viewers]
+
+    rng = random.Random(args.random_seed)
+    results = {
+        'commit': git_commit(),
+        'date': datetime.utcnow().isoformat(timespec='seconds'),
+        'target': args.url or 'test client',
+        'database': db.get_engine(app).dialect.name,
+        'python': platform.python_version(),
+        'dataset': dataset,
+        'requests_per_endpoint': args.requests,
+        'concurrency': len(sessions),
+        'endpoints': {},
+    }
+    for scenario in scenarios(rng, user_ids, message_ids):
+        results['endpoints'][scenario[0]] = run_endpoint(
+            sessions, scenario, args.requests, args.warmup)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    print_results(results, baseline)
+
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
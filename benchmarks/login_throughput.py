@@ -0,0 +1,102 @@
+"""Measure login throughput, and what a burst of logins does to other pages.
+
+Runs against a throwaway SQLite database from the repository root:
+
+    python -m benchmarks.login_throughput --logins 200 --threads 8
+
+Logs in `--logins` times from `--threads` concurrent clients while another
+thread keeps requesting a cheap page, then reports logins per second and
+the latency of the cheap page during the burst. Compare `--rounds` values
+or PASSWORD_HASH_WORKERS settings to see the trade-offs.
+"""
+
+import argparse
+import os
+import statistics
+import tempfile
+import threading
+import time
+
+DB_PATH = os.path.join(tempfile.gettempdir(), 'warbler-login-bench.db')
+os.environ['DATABASE_URL'] = f"sqlite:///{DB_PATH}"
+
+from app import app  # noqa: E402  (DATABASE_URL must be set first)
+from models import db, User  # noqa: E402
+import passwords  # noqa: E402
+
+
+def percentile(samples, pct):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * pct / 100))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--logins', type=int, default=100)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--rounds', type=int, default=passwords.DEFAULT_LOG_ROUNDS)
+    parser.add_argument('--workers', type=int, default=passwords.DEFAULT_WORKERS)
+    args = parser.parse_args()
+
+    app.config.update(WTF_CSRF_ENABLED=False,
+                      BCRYPT_LOG_ROUNDS=args.rounds,
+                      PASSWORD_HASH_WORKERS=args.workers,
+                      PASSWORD_HASH_QUEUE=args.logins)
+
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        User.signup(username="bench", email="bench@test.com",
+                    password="password", image_url=None)
+        db.session.commit()
+
+    remaining = iter(range(args.logins))
+    remaining_lock = threading.Lock()
+    rejected = []
+    burst_over = threading.Event()
+    page_latencies = []
+
+    def log_in():
+        client = app.test_client()
+        while True:
+            with remaining_lock:
+                if next(remaining, None) is None:
+                    return
+            resp = client.post('/login', data={'username': 'bench', 'password': 'password'})
+            if resp.status_code == 503:
+                rejected.append(resp)
+
+    def browse():
+        client = app.test_client()
+        while not burst_over.is_set():
+            start = time.perf_counter()
+            client.get('/login')
+            page_latencies.append(time.perf_counter() - start)
+
+    browser = threading.Thread(target=browse)
+    browser.start()
+
+    start = time.perf_counter()
+    loggers = [threading.Thread(target=log_in) for _ in range(args.threads)]
+    for thread in loggers:
+        thread.start()
+    for thread in loggers:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    burst_over.set()
+    browser.join()
+
+    print(f"bcrypt cost {args.rounds}, {args.workers} hash workers, {args.threads} clients")
+    print(f"{args.logins} logins in {elapsed:.2f}s: {args.logins / elapsed:.1f} logins/s, "
+          f"{len(rejected)} shed with 503")
+    if page_latencies:
+        print(f"cheap page during burst: {len(page_latencies)} requests, "
+              f"p50 {statistics.median(page_latencies) * 1000:.1f} ms, "
+              f"p95 {percentile(page_latencies, 95) * 1000:.1f} ms")
+
+    os.remove(DB_PATH)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+"""Show query plans for Warbler's hot queries, with and without indexes.
+
+Run against a seeded database (see seed.py) from the repository root:
+
+    DATABASE_URL=postgresql:///warbler python -m benchmarks.query_plans
+
+For each hot query this prints the plan with the indexes from
+migrations.py in place, then drops those indexes inside a transaction,
+prints the plan again, and rolls the transaction back, so the database is
+left untouched. On Postgres, `--analyze` runs EXPLAIN ANALYZE to include
+actual timings.
+"""
+
+import argparse
+import time
+
+from sqlalchemy import text
+
+from app import app
+import migrations
+from models import db, FollowersFollowee, Like, Message, TimelineEntry
+
+HOT_INDEXES = [
+    'ix_messages_user_timestamp',
+    'ix_follows_follower_followee',
+    'ix_likes_message_user',
+    'ix_timeline_entries_user_recent',
+]
+
+
+def hot_queries(user_id, message_id):
+    """The query shapes behind the busiest pages, as (name, query) pairs."""
+
+    return [
+        ("profile messages (users_show)",
+         Message.query
+         .filter(Message.user_id == user_id)
+         .order_by(Message.timestamp.desc(), Message.id.desc())
+         .limit(100)),
+        ("home timeline (homepage)",
+         Message.query
+         .join(TimelineEntry, TimelineEntry.message_id == Message.id)
+         .filter(TimelineEntry.user_id == user_id)
+         .order_by(TimelineEntry.timestamp.desc(), TimelineEntry.message_id.desc())
+         .limit(100)),
+        ("who follows user (followers page, cascades)",
+         db.session.query(FollowersFollowee.followee_id)
+         .filter(FollowersFollowee.follower_id == user_id)),
+        ("likes of a message (cascades, counters)",
+         db.session.query(Like.user_id)
+         .filter(Like.message_id == message_id)),
+    ]
+
+
+def explain(query, analyze=False, label=''):
+    """The database's plan for `query`, as a list of lines."""
+
+    bind = db.session.connection()
+    sql = str(query.statement.compile(bind=bind,
+                                      compile_kwargs={'literal_binds': True}))
+
+    if bind.dialect.name == 'sqlite':
+        prefix = "EXPLAIN QUERY PLAN "
+    elif analyze:
+        prefix = "EXPLAIN ANALYZE "
+    else:
+        prefix = "EXPLAIN "
+
+    start = time.perf_counter()
+    # the label keeps SQLite from reusing a statement prepared before the drop
+    rows = db.session.execute(text(f"{prefix}{sql} -- {label}")).fetchall()
+    elapsed = time.perf_counter() - start
+
+    plan = [' | '.join(str(col) for col in row) for row in rows]
+    return plan + [f"({elapsed * 1000:.2f} ms to plan{' and run' if analyze else ''})"]
+
+
+def show_plans(label, user_id, message_id, analyze):
+    print(f"\n=== {label} ===")
+    for name, query in hot_queries(user_id, message_id):
+        print(f"\n-- {name}")
+        for line in explain(query, analyze, label):
+            print(f"   {line}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--user-id', type=int, help="user to query for (default: most followed)")
+    parser.add_argument('--analyze', action='store_true', help="EXPLAIN ANALYZE (Postgres)")
+    args = parser.parse_args()
+
+    with app.app_context():
+        user_id = args.user_id or (db.session
+                                   .query(FollowersFollowee.follower_id)
+                                   .group_by(FollowersFollowee.follower_id)
+                                   .order_by(db.func.count().desc())
+                                   .limit(1)
+                                   .scalar())
+        message_id = (db.session.query(Like.message_id).limit(1).scalar()
+                      or db.session.query(Message.id).limit(1).scalar())
+
+        show_plans("with indexes", user_id, message_id, args.analyze)
+
+        for index in HOT_INDEXES:
+            db.session.execute(text(f"DROP INDEX IF EXISTS {index}"))
+        try:
+            show_plans("without indexes", user_id, message_id, args.analyze)
+        finally:
+            # Postgres DDL is transactional; SQLite's driver autocommits it
+            db.session.rollback()
+            migrations.add_hot_path_indexes()
+            db.session.commit()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+"""Measure worker cold start for each config profile.
+
+Each sample runs in a fresh Python process, the way a new gunicorn worker
+starts. From the repository root:
+
+    python -m benchmarks.startup --runs 10
+
+For each profile this reports how long it takes to import `app`, to build
+the app with `create_app`, and to serve the first request. It also reports
+how many modules ended up loaded. The first request is an anonymous GET /,
+which doesn't touch the database, so no database is needed.
+"""
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+
+PROFILES = ['development', 'production']
+
+# runs in the child process; prints one JSON sample
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import app as app_module
+imported = time.perf_counter()
+app = app_module.create_app(sys.argv[1])
+created = time.perf_counter()
+resp = app.test_client().get('/')
+served = time.perf_counter()
+assert resp.status_code == 200, resp.status_code
+print(json.dumps({
+    'import_ms': (imported - start) * 1000,
+    'create_app_ms': (created - imported) * 1000,
+    'first_request_ms': (served - created) * 1000,
+    'total_ms': (served - start) * 1000,
+    'modules': len(sys.modules),
+    'debug_toolbar_loaded': 'flask_debugtoolbar' in sys.modules,
+}))
+"""
+
+
+def sample(profile):
+    out = subprocess.run([sys.executable, '-c', PROBE, profile],
+                         capture_output=True, text=True, check=True).stdout
+    return json.loads(out.splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'profile':<12} {'import':>9} {'create_app':>11} {'1st request':>12} "
+          f"{'total':>9} {'modules':>8}  toolbar")
+    for profile in PROFILES:
+        samples = [sample(profile) for _ in range(args.runs)]
+
+        def median(key):
+            return statistics.median(s[key] for s in samples)
+
+        print(f"{profile:<12} {median('import_ms'):>7.1f}ms {median('create_app_ms'):>9.1f}ms "
+              f"{median('first_request_ms'):>10.1f}ms {median('total_ms'):>7.1f}ms "
+              f"{median('modules'):>8.0f}  {samples[0]['debug_toolbar_loaded']}")
+
+
+if __name__ == '__main__':
+    main()
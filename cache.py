@@ -0,0 +1,88 @@
+"""Small in-process cache used by Warbler's caching layers.
+
+Any object with the same `get`/`set`/`delete` methods (for instance an
+adapter around a shared memcached or Redis client) can be configured in
+its place; values stored through this interface are plain, picklable data.
+"""
+
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+
+class LRUCache:
+    """Thread-safe least-recently-used cache with an optional time-to-live.
+
+    Holds at most `maxsize` entries and, if `maxbytes` is set, at most that
+    many bytes of values as measured by `sizeof`. Entries older than `ttl`
+    seconds are treated as missing. A `maxsize` of 0 disables caching
+    entirely.
+    """
+
+    def __init__(self, maxsize=1024, ttl=None, maxbytes=None, sizeof=sys.getsizeof):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.maxbytes = maxbytes
+        self.sizeof = sizeof
+        self.nbytes = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        """Return the cached value for `key`, or `default`."""
+
+        with self._lock:
+            try:
+                expires, value, _ = self._data[key]
+            except KeyError:
+                return default
+
+            if expires is not None and expires < time.monotonic():
+                self._pop(key)
+                return default
+
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        """Cache `value` under `key`, evicting the least recently used entry."""
+
+        if self.maxsize <= 0:
+            return
+
+        expires = time.monotonic() + self.ttl if self.ttl else None
+        size = self.sizeof(value) if self.maxbytes else 0
+        if self.maxbytes and size > self.maxbytes:
+            return
+
+        with self._lock:
+            self._pop(key)
+            self._data[key] = (expires, value, size)
+            self.nbytes += size
+
+            while len(self._data) > self.maxsize or (
+                    self.maxbytes and self.nbytes > self.maxbytes):
+                self._pop(next(iter(self._data)))
+
+    def delete(self, key):
+        """Forget `key`, if it is cached."""
+
+        with self._lock:
+            self._pop(key)
+
+    def clear(self):
+        """Forget everything."""
+
+        with self._lock:
+            self._data.clear()
+            self.nbytes = 0
+
+    def _pop(self, key):
+        # callers hold the lock
+        entry = self._data.pop(key, None)
+        if entry is not None:
+            self.nbytes -= entry[2]
+
+    def __len__(self):
+        return len(self._data)
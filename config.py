@@ -0,0 +1,164 @@
+"""Configuration profiles for `create_app`.
+
+Pick one with `create_app('production')`, or with the WARBLER_CONFIG
+environment variable (`development` when unset):
+
+- development: the debug toolbar, background jobs run inline;
+- production: nothing dev-only is imported or installed, jobs run on
+  workers (see Procfile);
+- testing: the test database, no CSRF, no user cache, cheap bcrypt, jobs
+  run inline.
+
+Settings that depend on the deployment are read from the environment.
+DATABASE_URL and DATABASE_REPLICA_URL are read each time an app is created.
+"""
+
+import os
+
+import archive
+import database
+import fragments
+import graph
+import instrumentation
+import jobs
+import pagination
+import passwords
+import search
+import timeline
+import usercache
+
+
+class Config:
+    """Settings shared by every profile."""
+
+    # DATABASE_URL in the environment (useful for production/testing) wins
+    # over this when the app is created; see create_app.
+    SQLALCHEMY_DATABASE_URI = 'postgres:///warbler'
+    SQLALCHEMY_TRACK_MODIFICATIONS = False
+    SQLALCHEMY_ECHO = False
+    SECRET_KEY = os.environ.get('SECRET_KEY', "it's a secret")
+
+    # Connection pool, per process (see database.py): at least gunicorn's
+    # --threads plus JOBS_WORKER_THREADS. 0 means no statement timeout; set
+    # it to 0 for long maintenance commands such as db-upgrade.
+    DATABASE_POOL_SIZE = int(
+        os.environ.get('DATABASE_POOL_SIZE', database.DEFAULT_POOL_SIZE))
+    DATABASE_MAX_OVERFLOW = int(
+        os.environ.get('DATABASE_MAX_OVERFLOW', database.DEFAULT_MAX_OVERFLOW))
+    DATABASE_POOL_TIMEOUT = database.DEFAULT_POOL_TIMEOUT
+    DATABASE_POOL_RECYCLE = database.DEFAULT_POOL_RECYCLE
+    DATABASE_POOL_PRE_PING = True
+    DATABASE_STATEMENT_TIMEOUT_MS = int(
+        os.environ.get('DATABASE_STATEMENT_TIMEOUT_MS', 0))
+
+    # With DATABASE_REPLICA_URL set, read-only views read from the replica,
+    # except for a client's requests this soon after it wrote something
+    DATABASE_REPLICA_STICKY_SECONDS = database.DEFAULT_STICKY_SECONDS
+
+    # 'serial' (a database sequence) or 'snowflake' (time-ordered, assigned
+    # by each process; see snowflake.py)
+    MESSAGE_ID_SCHEME = os.environ.get('MESSAGE_ID_SCHEME', 'serial')
+    SNOWFLAKE_WORKER_ID = (int(os.environ['SNOWFLAKE_WORKER_ID'])
+                           if 'SNOWFLAKE_WORKER_ID' in os.environ else None)
+
+    # Messages older than this move to the archive (see archive.py)
+    MESSAGE_ARCHIVE_AFTER_DAYS = int(
+        os.environ.get('MESSAGE_ARCHIVE_AFTER_DAYS', archive.DEFAULT_AFTER_DAYS))
+    MESSAGE_ARCHIVE_BATCH = archive.DEFAULT_BATCH
+
+    # In-memory follow graph for mutuals and suggestions (see graph.py).
+    # Workers start from GRAPH_SNAPSHOT, if set and written, and rebuild
+    # from the database every GRAPH_REFRESH_SECONDS.
+    GRAPH_SNAPSHOT = os.environ.get('GRAPH_SNAPSHOT')
+    GRAPH_REFRESH_SECONDS = graph.DEFAULT_REFRESH_SECONDS
+    GRAPH_OVERLAY_LIMIT = graph.DEFAULT_OVERLAY_LIMIT
+
+    # install Flask-DebugToolbar (it only shows up when app.debug is on)
+    DEBUG_TOOLBAR = False
+
+    # Authors with more followers than this are merged into feeds on read
+    # instead of being fanned out to every follower's timeline on write.
+    TIMELINE_FANOUT_LIMIT = int(
+        os.environ.get('TIMELINE_FANOUT_LIMIT', timeline.DEFAULT_FANOUT_LIMIT))
+    TIMELINE_BACKFILL = timeline.DEFAULT_BACKFILL
+
+    # Feeds are paged with opaque `?before=` cursors; `?limit=` picks a page size
+    FEED_PAGE_SIZE = pagination.DEFAULT_PAGE_SIZE
+    FEED_MAX_PAGE_SIZE = pagination.MAX_PAGE_SIZE
+
+    USERS_PAGE_SIZE = search.DEFAULT_PAGE_SIZE
+
+    # bcrypt cost for new hashes; older hashes are upgraded on login. Hashing
+    # runs on a bounded pool (see passwords.py).
+    BCRYPT_LOG_ROUNDS = int(
+        os.environ.get('BCRYPT_LOG_ROUNDS', passwords.DEFAULT_LOG_ROUNDS))
+    PASSWORD_HASH_WORKERS = passwords.DEFAULT_WORKERS
+    PASSWORD_HASH_QUEUE = passwords.DEFAULT_QUEUE
+
+    # The logged-in user's hot profile fields are cached between requests
+    USER_CACHE_SIZE = usercache.DEFAULT_SIZE
+    USER_CACHE_TTL = usercache.DEFAULT_TTL
+
+    # Rendered message items and profile headers (see fragments.py)
+    FRAGMENT_CACHE_SIZE = fragments.DEFAULT_SIZE
+    FRAGMENT_CACHE_BYTES = fragments.DEFAULT_BYTES
+
+    # Per-request query counts, slow-query and N+1 logging, and /metrics (see
+    # instrumentation.py). If METRICS_TOKEN is set, /metrics requires it as a
+    # bearer token.
+    SLOW_QUERY_MS = int(
+        os.environ.get('SLOW_QUERY_MS', instrumentation.DEFAULT_SLOW_QUERY_MS))
+    N_PLUS_ONE_THRESHOLD = instrumentation.DEFAULT_N_PLUS_ONE_THRESHOLD
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+
+    # Background jobs (see jobs.py). JOBS_EAGER runs them inline instead of
+    # queueing them; JOBS_WORKER_THREADS runs workers inside the web process.
+    JOBS_EAGER = False
+    JOBS_WORKER_THREADS = int(os.environ.get('JOBS_WORKER_THREADS', 0))
+    JOBS_MAX_ATTEMPTS = jobs.DEFAULT_MAX_ATTEMPTS
+    JOBS_RETRY_DELAY = jobs.DEFAULT_RETRY_DELAY
+    JOBS_LOCK_TIMEOUT = jobs.DEFAULT_LOCK_TIMEOUT
+
+
+class DevelopmentConfig(Config):
+    """Local development, with the debug toolbar."""
+
+    DEBUG_TOOLBAR = True
+    DEBUG_TB_INTERCEPT_REDIRECTS = False
+    JOBS_EAGER = True
+
+
+class ProductionConfig(Config):
+    """What gunicorn runs (see Procfile)."""
+
+    DATABASE_STATEMENT_TIMEOUT_MS = int(
+        os.environ.get('DATABASE_STATEMENT_TIMEOUT_MS', 10000))
+
+
+class TestingConfig(Config):
+    """The unit tests."""
+
+    TESTING = True
+    SQLALCHEMY_DATABASE_URI = 'postgresql:///warbler-test'
+    WTF_CSRF_ENABLED = False
+    USER_CACHE_SIZE = 0
+    BCRYPT_LOG_ROUNDS = 4
+    JOBS_EAGER = True
+
+
+PROFILES = {
+    'development': DevelopmentConfig,
+    'production': ProductionConfig,
+    'testing': TestingConfig,
+}
+
+
+def profile(name=None):
+    """The config class called `name`, or the one in WARBLER_CONFIG."""
+
+    name = name or os.environ.get('WARBLER_CONFIG', 'development')
+    try:
+        return PROFILES[name]
+    except KeyError:
+        raise ValueError(f"unknown config profile {name!r}; "
+                         f"expected one of {', '.join(PROFILES)}")
@@ -0,0 +1,159 @@
+"""Denormalized per-user counters (messages, following, followers, likes).
+
+Write paths adjust the counters with a single relative UPDATE so concurrent
+requests can't lose increments. `reconcile` recomputes them from the source
+tables in bulk, for after imports or if they ever drift.
+
+Adjustments to someone other than the acting user, which many requests
+may be making at once (a popular user's followers count), can be left to a
+background job with `adjust_later` so requests don't queue on that row.
+
+Every adjustment also bumps the users' `activity_version`, which HTTP
+caching uses to tell that their pages changed (see httpcache.py).
+"""
+
+from sqlalchemy import func, select
+
+from models import db, ArchivedMessage, FollowersFollowee, Like, Message, User
+import jobs
+import timeline
+
+
+def of(user_id):
+    """`user_id`'s counters as one row, without loading the whole user."""
+
+    return (db.session
+            .query(User.messages_count, User.following_count,
+                   User.followers_count, User.likes_count)
+            .filter(User.id == user_id)
+            .one())
+
+
+def adjust(user_ids, **deltas):
+    """Add `deltas` (e.g. followers_count=-1) to the counters of `user_ids`.
+
+    `user_ids` is a single id, a list of ids or a select of ids.
+    """
+
+    if isinstance(user_ids, int):
+        user_ids = [user_ids]
+
+    values = {getattr(User, name): getattr(User, name) + delta
+              for name, delta in deltas.items()}
+    values[User.activity_version] = User.activity_version + 1
+
+    (User
+     .query
+     .filter(User.id.in_(user_ids))
+     .update(values, synchronize_session=False))
+
+    if deltas.get('followers_count', 0) < 0:
+        _catch_up_timelines(user_ids, deltas['followers_count'])
+
+
+def _catch_up_timelines(user_ids, delta):
+    """Queue timeline catch-ups for those of `user_ids` that just fell back
+    under the fan-out limit (see timeline.catch_up)."""
+
+    limit = timeline.fanout_limit()
+    fell_under = (db.session
+                  .query(User.id)
+                  .filter(User.id.in_(user_ids),
+                          User.followers_count <= limit,
+                          User.followers_count - delta > limit))
+
+    for (user_id,) in fell_under:
+        jobs.enqueue('timeline.catch_up', user_id=user_id)
+
+
+def adjust_later(user_ids, **deltas):
+    """Like `adjust` (with a single id or a list of ids), in a background job."""
+
+    if isinstance(user_ids, int):
+        user_ids = [user_ids]
+
+    jobs.enqueue('counters.adjust', user_ids=user_ids, deltas=deltas)
+
+
+@jobs.handler('counters.adjust')
+def _adjust_job(user_ids, deltas):
+    adjust(user_ids, **deltas)
+
+
+def message_deleted(msg):
+    """Adjust counters before `msg` is deleted (its likes go with it)."""
+
+    adjust(msg.user_id, messages_count=-1)
+    adjust(select([Like.user_id]).where(Like.message_id == msg.id),
+           likes_count=-1)
+
+
+def likes_removed(message_ids):
+    """Adjust likers' counters before the likes of `message_ids` are deleted."""
+
+    likes = select([Like.user_id]).where(Like.message_id.in_(message_ids))
+    lost = (select([func.count()])
+            .select_from(Like.__table__)
+            .where(Like.message_id.in_(message_ids))
+            .where(Like.user_id == User.id)
+            .as_scalar())
+
+    (User
+     .query
+     .filter(User.id.in_(likes))
+     .update({User.likes_count: User.likes_count - lost,
+              User.activity_version: User.activity_version + 1},
+             synchronize_session=False))
+
+
+def user_deleted(user_id):
+    """Adjust other users' counters before `user_id` and its rows are deleted."""
+
+    # `followee_id` is the follower's id; see FollowersFollowee
+    adjust(select([FollowersFollowee.follower_id])
+           .where(FollowersFollowee.followee_id == user_id),
+           followers_count=-1)
+    adjust(select([FollowersFollowee.followee_id])
+           .where(FollowersFollowee.follower_id == user_id),
+           following_count=-1)
+
+    their_likes = Like.__table__.join(Message.__table__)
+    likers = (select([Like.user_id])
+              .select_from(their_likes)
+              .where(Message.user_id == user_id))
+    lost = (select([func.count()])
+            .select_from(their_likes)
+            .where(Message.user_id == user_id)
+            .where(Like.user_id == User.id)
+            .as_scalar())
+
+    (User
+     .query
+     .filter(User.id.in_(likers))
+     .update({User.likes_count: User.likes_count - lost,
+              User.activity_version: User.activity_version + 1},
+             synchronize_session=False))
+
+
+def reconcile(user_ids=None):
+    """Recompute counters from the source tables, for `user_ids` or everyone."""
+
+    def count(table, where):
+        return select([func.count()]).select_from(table).where(where).as_scalar()
+
+    query = User.query
+    if user_ids is not None:
+        query = query.filter(User.id.in_(user_ids))
+
+    query.update({
+        User.messages_count: (count(Message.__table__,
+                                    Message.user_id == User.id)
+                              + count(ArchivedMessage.__table__,
+                                      ArchivedMessage.user_id == User.id)),
+        User.following_count: count(FollowersFollowee.__table__,
+                                    FollowersFollowee.followee_id == User.id),
+        User.followers_count: count(FollowersFollowee.__table__,
+                                    FollowersFollowee.follower_id == User.id),
+        User.likes_count: count(Like.__table__,
+                                Like.user_id == User.id),
+    }, synchronize_session=False)
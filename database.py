@@ -0,0 +1,114 @@
+"""Engine and session setup: pool settings and read-replica routing.
+
+`RoutingSQLAlchemy` is Flask-SQLAlchemy with:
+
+- pool settings from config (DATABASE_POOL_SIZE and friends). Size the pool
+  for one gunicorn worker: its threads, plus JOBS_WORKER_THREADS;
+- stale connections tested before use (pre-ping) and recycled, so a
+  restarted or failed-over database doesn't surface as errors;
+- a Postgres statement timeout (DATABASE_STATEMENT_TIMEOUT_MS), so a bad
+  query can't hold a connection forever;
+- reads of views marked `@reads_from_replica` sent to the `replica` bind
+  (DATABASE_REPLICA_URL), when one is configured.
+
+Writes, flushes and everything outside those views use the primary. After
+a request that may have written (anything but GET/HEAD/OPTIONS) the client
+reads from the primary for DATABASE_REPLICA_STICKY_SECONDS, so it sees its
+own changes even when the replica lags.
+"""
+
+import time
+from functools import wraps
+
+from flask import current_app, g, has_request_context, request, session
+from flask_sqlalchemy import SignallingSession, SQLAlchemy, get_state
+from sqlalchemy import orm
+from sqlalchemy.sql.dml import UpdateBase
+
+REPLICA = 'replica'
+STICKY_KEY = '_read_primary_until'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+DEFAULT_POOL_SIZE = 5
+DEFAULT_MAX_OVERFLOW = 5
+DEFAULT_POOL_TIMEOUT = 10
+DEFAULT_POOL_RECYCLE = 1800
+DEFAULT_STICKY_SECONDS = 5
+
+
+def reads_from_replica(view):
+    """Send the decorated view's reads to the replica, if there is one."""
+
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        g.read_from_replica = True
+        return view(*args, **kwargs)
+    return wrapper
+
+
+def has_replica(app):
+    return REPLICA in (app.config.get('SQLALCHEMY_BINDS') or {})
+
+
+def _use_replica(app):
+    """Should reads in this request go to the replica?"""
+
+    return (has_request_context()
+            and g.get('read_from_replica', False)
+            and has_replica(app)
+            and session.get(STICKY_KEY, 0) <= time.time())
+
+
+class RoutingSession(SignallingSession):
+    """Session that reads from the replica in `@reads_from_replica` views."""
+
+    def get_bind(self, mapper=None, clause=None):
+        if (not self._flushing
+                and not isinstance(clause, UpdateBase)
+                and _use_replica(self.app)):
+            return get_state(self.app).db.get_engine(self.app, bind=REPLICA)
+
+        return super().get_bind(mapper, clause)
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+    """Flask-SQLAlchemy with pool settings and replica routing (see above)."""
+
+    def init_app(self, app):
+        super().init_app(app)
+        app.after_request(read_primary_after_writes)
+
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+    def apply_driver_hacks(self, app, sa_url, options):
+        result = super().apply_driver_hacks(app, sa_url, options)
+        config = app.config
+
+        options['pool_pre_ping'] = config.get('DATABASE_POOL_PRE_PING', True)
+
+        # SQLite uses its own single-connection pools
+        if sa_url.drivername.startswith('sqlite'):
+            return result
+
+        options['pool_size'] = config.get('DATABASE_POOL_SIZE', DEFAULT_POOL_SIZE)
+        options['max_overflow'] = config.get('DATABASE_MAX_OVERFLOW', DEFAULT_MAX_OVERFLOW)
+        options['pool_timeout'] = config.get('DATABASE_POOL_TIMEOUT', DEFAULT_POOL_TIMEOUT)
+        options['pool_recycle'] = config.get('DATABASE_POOL_RECYCLE', DEFAULT_POOL_RECYCLE)
+
+        timeout = config.get('DATABASE_STATEMENT_TIMEOUT_MS')
+        if timeout and sa_url.drivername.startswith('postgres'):
+            options.setdefault('connect_args', {})['options'] = (
+                f"-c statement_timeout={int(timeout)}")
+
+        return result
+
+
+def read_primary_after_writes(response):
+    """After a write, read from the primary for a while (read-your-writes)."""
+
+    if request.method not in SAFE_METHODS and has_replica(current_app):
+        session[STICKY_KEY] = time.time() + current_app.config.get(
+            'DATABASE_REPLICA_STICKY_SECONDS', DEFAULT_STICKY_SECONDS)
+
+    return response
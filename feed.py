@@ -0,0 +1,35 @@
+"""Assemble message lists for rendering with a fixed number of queries.
+
+Templates showing a list of messages need each message's author and whether
+the viewer likes it. Loading those per row means one query per author and a
+scan of the viewer's likes per message; these helpers fetch both for the
+whole page up front.
+"""
+
+from sqlalchemy.orm import joinedload
+
+from models import Message
+
+
+def with_authors(query):
+    """Load each message's author in the same query as the messages."""
+
+    return query.options(joinedload(Message.user))
+
+
+def liked_ids(viewer, messages):
+    """Ids of those `messages` that `viewer` likes, in a single query."""
+
+    if not viewer:
+        return set()
+
+    return viewer.liked_ids_among(msg.id for msg in messages)
+
+
+def following_ids(viewer, users):
+    """Ids of those `users` that `viewer` follows, in a single query."""
+
+    if not viewer:
+        return set()
+
+    return viewer.following_ids_among(user.id for user in users)
@@ -0,0 +1,44 @@
+"""Followers / following lists, a page at a time.
+
+The pages show a card per user, so only the columns a card needs are
+selected, straight from the `follows` index for the profile's side of the
+relationship. Rows come back as named tuples, not `User` objects. Pages are
+seeked on the other user's id (`?after=`), like the user listing.
+"""
+
+from models import db, FollowersFollowee, User
+
+# what a user card shows
+CARD_COLUMNS = (User.id, User.username, User.image_url, User.header_image_url, User.bio)
+
+
+def following_page(user_id, after_id=None, per_page=24):
+    """Users `user_id` follows, as `(cards, next_after_id)`."""
+
+    # `followee_id` is the follower's id; see FollowersFollowee
+    return _page(FollowersFollowee.follower_id,
+                 FollowersFollowee.followee_id == user_id,
+                 after_id, per_page)
+
+
+def followers_page(user_id, after_id=None, per_page=24):
+    """Users following `user_id`, as `(cards, next_after_id)`."""
+
+    return _page(FollowersFollowee.followee_id,
+                 FollowersFollowee.follower_id == user_id,
+                 after_id, per_page)
+
+
+def _page(other_id, where, after_id, per_page):
+    query = (db.session
+             .query(*CARD_COLUMNS)
+             .join(FollowersFollowee, User.id == other_id)
+             .filter(where))
+    if after_id is not None:
+        query = query.filter(other_id > after_id)
+
+    cards = query.order_by(other_id).limit(per_page + 1).all()
+
+    if len(cards) <= per_page:
+        return cards, None
+    return cards[:per_page], cards[per_page - 1].id
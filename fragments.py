@@ -0,0 +1,103 @@
+"""Cache of rendered HTML fragments: message list items and profile headers.
+
+Feed pages render the same message `<li>` for every viewer, and every
+profile page renders the same header. These are rendered once and kept
+here. The viewer-specific bits (like button, follow / edit buttons) are
+rendered on every request and put into the cached HTML at the
+`<!-- viewer -->` slot.
+
+Each entry is stored with a stamp of what it was rendered from (the
+author's `profile_version`, the counters for headers, and a checksum of the
+text), so an entry for a changed profile is simply re-rendered, and so is
+one left over from a row whose id has been reused (e.g. after the database
+was reset under a shared cache). Views that delete messages or users call
+`forget_message` / `forget_user` to free the space.
+
+The cache is an in-process LRU bounded by entries and bytes, unless a
+shared backend is configured as `FRAGMENT_CACHE_BACKEND`.
+"""
+
+import zlib
+
+from flask import current_app, Markup, render_template
+
+from cache import LRUCache
+
+DEFAULT_SIZE = 10000
+DEFAULT_BYTES = 32 * 1024 * 1024
+
+VIEWER_SLOT = '<!-- viewer -->'
+
+
+def _checksum(*texts):
+    return zlib.crc32("\x00".join(text or '' for text in texts).encode())
+
+
+def _entry_size(entry):
+    stamp, html = entry
+    return len(stamp) + len(html)
+
+
+def backend():
+    """The configured cache backend (an in-process LRU by default)."""
+
+    cache = current_app.extensions.get('fragment_cache')
+
+    if cache is None:
+        cache = current_app.config.get('FRAGMENT_CACHE_BACKEND') or LRUCache(
+            maxsize=current_app.config.get('FRAGMENT_CACHE_SIZE', DEFAULT_SIZE),
+            maxbytes=current_app.config.get('FRAGMENT_CACHE_BYTES', DEFAULT_BYTES),
+            sizeof=_entry_size)
+        current_app.extensions['fragment_cache'] = cache
+
+    return cache
+
+
+def _cached(key, stamp, template, **context):
+    cache = backend()
+
+    entry = cache.get(key)
+    if entry is not None and entry[0] == stamp:
+        return entry[1]
+
+    html = render_template(template, **context)
+    cache.set(key, (stamp, html))
+    return html
+
+
+def _fill(html, viewer_markup):
+    return Markup(html.replace(VIEWER_SLOT, str(viewer_markup), 1))
+
+
+def message_item(msg, viewer_markup=''):
+    """A message's feed `<li>`, with `viewer_markup` (its like button) in it."""
+
+    author = msg.user
+    # messages can't be edited, so only their author's profile can change
+    stamp = f"{author.id}:{author.profile_version}:{_checksum(msg.text)}"
+    html = _cached(f"message:{msg.id}", stamp, 'messages/_item.html',
+                   msg=msg, author=author)
+    return _fill(html, viewer_markup)
+
+
+def profile_header(user, viewer_markup=''):
+    """A profile page's header, with `viewer_markup` (follow / edit buttons)."""
+
+    stamp = (f"{user.profile_version}:{user.messages_count}:{user.following_count}:"
+             f"{user.followers_count}:{user.likes_count}:"
+             f"{_checksum(user.username, user.image_url, user.header_image_url)}")
+    html = _cached(f"profile:{user.id}", stamp, 'users/_header.html', user=user)
+    return _fill(html, viewer_markup)
+
+
+def forget_message(message_id):
+    """Drop a deleted message's cached `<li>`."""
+
+    backend().delete(f"message:{message_id}")
+
+
+def forget_user(user_id):
+    """Drop a changed or deleted user's cached header. (Their messages' items
+    are re-rendered anyway, since their stamps include the profile version.)"""
+
+    backend().delete(f"profile:{user_id}")
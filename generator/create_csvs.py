@@ -2,27 +2,54 @@
 
 Students won't need to run this for the exercise; they will just use the CSV
 files that this generates. You should only need to run this if you wanted to
-tweak the CSV formats or generate fewer/more rows.
+tweak the CSV formats or generate fewer/more rows, e.g. a production-sized
+data set for load testing:
+
+    python generator/create_csvs.py --users 2000000 --follows 300000000 \\
+        --messages 100000000 --likes 200000000 --shards 64 --out /data/warbler
+
+Everything is generated offline and is reproducible for a given `--seed`
+(and `--until` date).
+Work is split into shards that are generated by a pool of processes, and
+rows are streamed straight to the shard files, so memory use doesn't grow
+with the number of rows. With one shard the files are the usual
+`users.csv`, `messages.csv`, ...; with more they are `users-00000.csv`,
+`users-00001.csv`, ..., which `loader.py` loads in order.
+
+Who follows whom, who posts and which messages get liked all follow a
+power law: a few users have a huge share of the followers and messages,
+and most have a handful.
 """
 
+import argparse
 import csv
-from random import choice, randint, sample
-from itertools import permutations
-import requests
+import os
+import random
+import time
+from datetime import date, datetime
+from multiprocessing import Pool
+
 from faker import Faker
-from helpers import get_random_datetime
+from helpers import get_random_datetime, PowerLaw
 
 MAX_WARBLER_LENGTH = 140
 
 USERS_CSV_HEADERS = ['email', 'username', 'image_url', 'password', 'bio', 'header_image_url', 'location']
 MESSAGES_CSV_HEADERS = ['text', 'timestamp', 'user_id']
 FOLLOWS_CSV_HEADERS = ['followee_id', 'follower_id']
+LIKES_CSV_HEADERS = ['user_id', 'message_id']
 
 NUM_USERS = 300
 NUM_MESSAGES = 1000
 NUM_FOLLWERS = 5000
+NUM_LIKES = 0
 
-fake = Faker()
+# bcrypt hash of "password"
+PASSWORD = '$2b$12$Q1PUFjhN/AWRQ21LbGYvjeLpZZB6lfZ1BPwifHALGO6oIbyC3CmJe'
+
+# Faker is slow (~0.2ms a value), so each process draws pools of fake values
+# once and builds rows from those
+POOL_SIZE = 2000
 
 # Generate random profile image URLs to use for users
 
@@ -32,46 +59,230 @@ image_urls = [
     for i in range(count)
 ]
 
-# Generate random header image URLs to use for users
+# Header images ship with the app, so no network access is needed
 
 header_image_urls = [
-    requests.get(f"http://www.splashbase.co/api/v1/images/{i}").json()['url']
-    for i in range(1, 46)
+    "/static/images/warbler-hero.jpg",
+    "/static/images/signed-out-home.jpg",
 ]
 
-with open('generator/users.csv', 'w') as users_csv:
-    users_writer = csv.DictWriter(users_csv, fieldnames=USERS_CSV_HEADERS)
-    users_writer.writeheader()
-
-    for i in range(NUM_USERS):
-        users_writer.writerow(dict(
-            email=fake.email(),
-            username=fake.user_name(),
-            image_url=choice(image_urls),
-            password='$2b$12$Q1PUFjhN/AWRQ21LbGYvjeLpZZB6lfZ1BPwifHALGO6oIbyC3CmJe',
-            bio=fake.sentence(),
-            header_image_url=choice(header_image_urls),
-            location=fake.city()
-        ))
-
-with open('generator/messages.csv', 'w') as messages_csv:
-    messages_writer = csv.DictWriter(messages_csv, fieldnames=MESSAGES_CSV_HEADERS)
-    messages_writer.writeheader()
-
-    for i in range(NUM_MESSAGES):
-        messages_writer.writerow(dict(
-            text=fake.paragraph()[:MAX_WARBLER_LENGTH],
-            timestamp=get_random_datetime(),
-            user_id=randint(1, NUM_USERS)
-        ))
-
-# Generate follows.csv from random pairings of users
-
-with open('generator/follows.csv', 'w') as follows_csv:
-    all_pairs = list(permutations(range(1, NUM_USERS + 1), 2))
-
-    users_writer = csv.DictWriter(follows_csv, fieldnames=FOLLOWS_CSV_HEADERS)
-    users_writer.writeheader()
-
-    for followee, follower in sample(all_pairs, NUM_FOLLWERS):
-        users_writer.writerow(dict(followee_id=followee, follower_id=follower))
+
+def shard_ranges(total, shards):
+    """Split 1..total into `shards` contiguous (start, stop) ranges."""
+
+    bounds = [total * i // shards for i in range(shards + 1)]
+    return [(bounds[i] + 1, bounds[i + 1] + 1) for i in range(shards)]
+
+
+def shard_path(out, table, shard, shards):
+    if shards == 1:
+        return os.path.join(out, f"{table}.csv")
+    return os.path.join(out, f"{table}-{shard:05d}.csv")
+
+
+class Shard:
+    """What one worker process needs to generate one shard of one table."""
+
+    def __init__(self, table, shard, start, stop, quota, args):
+        self.table = table
+        self.shard = shard
+        self.start = start
+        self.stop = stop
+        self.quota = quota
+        self.args = args
+        self.rng = random.Random(f"{args.seed}-{table}-{shard}")
+        self.fake = Faker()
+        self.fake.seed_instance(self.rng.random())
+
+    def pool(self, make):
+        return [make() for _ in range(min(POOL_SIZE, self.stop - self.start))]
+
+
+def generate_users(shard):
+    """Users `start`..`stop` - 1; usernames and emails are unique by id."""
+
+    rng = shard.rng
+    names = shard.pool(shard.fake.user_name)
+    domains = shard.pool(shard.fake.free_email_domain)
+    bios = shard.pool(shard.fake.sentence)
+    cities = shard.pool(shard.fake.city)
+
+    for user_id in range(shard.start, shard.stop):
+        username = f"{rng.choice(names)}{user_id}"
+        yield [f"{username}@{rng.choice(domains)}",
+               username,
+               rng.choice(image_urls),
+               PASSWORD,
+               rng.choice(bios),
+               rng.choice(header_image_urls),
+               rng.choice(cities)]
+
+
+def generate_messages(shard):
+    """Messages by power-law-distributed authors."""
+
+    rng = shard.rng
+    authors = PowerLaw(shard.args.users, shard.args.alpha, salt=1)
+    sentences = shard.pool(shard.fake.sentence)
+
+    for _ in range(shard.start, shard.stop):
+        text = rng.choice(sentences)
+        while len(text) < MAX_WARBLER_LENGTH and rng.random() < 0.6:
+            text += " " + rng.choice(sentences)
+        yield [text[:MAX_WARBLER_LENGTH],
+               get_random_datetime(rng=rng, now=shard.args.until),
+               authors.draw(rng)]
+
+
+def edges(shard, targets, allow_self):
+    """(source, target) pairs for sources `start`..`stop` - 1.
+
+    Each source gets a power-law number of distinct targets (a few have very
+    many, most have few), and targets are drawn with a power-law popularity.
+    The shard stops once it has written its quota of edges.
+    """
+
+    rng = shard.rng
+    max_degree = targets.n - (0 if allow_self else 1)
+    remaining = shard.quota
+    sources_left = shard.stop - shard.start
+    # a Pareto(shape) variate has mean shape / (shape - 1)
+    shape = 1.5
+    pareto_mean = shape / (shape - 1)
+
+    for source in range(shard.start, shard.stop):
+        if remaining <= 0:
+            return
+        mean_degree = remaining / sources_left
+        sources_left -= 1
+        degree = min(max_degree, remaining,
+                     int(rng.paretovariate(shape) * mean_degree / pareto_mean))
+
+        seen = set()
+        attempts = 0
+        while len(seen) < degree and attempts < 4 * degree + 10:
+            attempts += 1
+            target = targets.draw(rng)
+            if target == source and not allow_self:
+                continue
+            if target not in seen:
+                seen.add(target)
+                yield source, target
+
+        remaining -= len(seen)
+
+
+def generate_follows(shard):
+    """Follows where `start`..`stop` - 1 are the users doing the following.
+
+    Careful: `followee_id` is the user doing the following and `follower_id`
+    the user being followed (see FollowersFollowee), so the popular users
+    show up in the `follower_id` column.
+    """
+
+    popular = PowerLaw(shard.args.users, shard.args.alpha, salt=2)
+    for user_id, followed_id in edges(shard, popular, allow_self=False):
+        yield [user_id, followed_id]
+
+
+def generate_likes(shard):
+    """Likes by users `start`..`stop` - 1, mostly of a few popular messages."""
+
+    popular = PowerLaw(shard.args.messages, shard.args.alpha, salt=3)
+    for user_id, message_id in edges(shard, popular, allow_self=True):
+        yield [user_id, message_id]
+
+
+TABLES = {
+    'users': (USERS_CSV_HEADERS, generate_users),
+    'messages': (MESSAGES_CSV_HEADERS, generate_messages),
+    'follows': (FOLLOWS_CSV_HEADERS, generate_follows),
+    'likes': (LIKES_CSV_HEADERS, generate_likes),
+}
+
+
+def write_shard(task):
+    """Generate one shard and stream it to its CSV file."""
+
+    table, shard_no, start, stop, quota, args = task
+    headers, generate = TABLES[table]
+    path = shard_path(args.out, table, shard_no, args.shards)
+    shard = Shard(table, shard_no, start, stop, quota, args)
+
+    rows = 0
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(headers)
+        for row in generate(shard):
+            writer.writerow(row)
+            rows += 1
+
+    return table, path, rows
+
+
+def tasks(args):
+    """One task per shard per table, biggest tables first."""
+
+    work = []
+    user_ranges = shard_ranges(args.users, args.shards)
+
+    for shard_no, (start, stop) in enumerate(user_ranges):
+        work.append(('users', shard_no, start, stop, stop - start, args))
+
+    for shard_no, (start, stop) in enumerate(shard_ranges(args.messages, args.shards)):
+        work.append(('messages', shard_no, start, stop, stop - start, args))
+
+    # edges are split by source user, with a quota in proportion to the range
+    for table, total in [('follows', args.follows), ('likes', args.likes)]:
+        if table == 'likes' and not (total and args.messages):
+            continue
+        quotas = shard_ranges(total, args.shards)
+        for shard_no, (start, stop) in enumerate(user_ranges):
+            quota = quotas[shard_no][1] - quotas[shard_no][0]
+            work.append((table, shard_no, start, stop, quota, args))
+
+    return sorted(work, key=lambda task: -task[4])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=NUM_USERS)
+    parser.add_argument('--messages', type=int, default=NUM_MESSAGES)
+    parser.add_argument('--follows', type=int, default=NUM_FOLLWERS)
+    parser.add_argument('--likes', type=int, default=NUM_LIKES)
+    parser.add_argument('--shards', type=int, default=1,
+                        help="files per table; loaded in order by loader.py")
+    parser.add_argument('--processes', type=int, default=os.cpu_count(),
+                        help="worker processes (default: one per CPU)")
+    parser.add_argument('--alpha', type=float, default=1.1,
+                        help="power-law exponent for popularity (higher is more skewed)")
+    parser.add_argument('--seed', default='warbler',
+                        help="same seed, same options: same files")
+    parser.add_argument('--until', type=date.fromisoformat, default=datetime.utcnow().date(),
+                        help="newest message date, YYYY-MM-DD (default: today, UTC)")
+    parser.add_argument('--out', default='generator',
+                        help="directory to write the CSVs to")
+    args = parser.parse_args()
+
+    args.until = datetime.combine(args.until, datetime.min.time())
+    if args.users < 2:
+        parser.error("--users must be at least 2")
+    if args.shards < 1:
+        parser.error("--shards must be at least 1")
+
+    os.makedirs(args.out, exist_ok=True)
+    totals = dict.fromkeys(TABLES, 0)
+    start = time.perf_counter()
+
+    with Pool(args.processes) as pool:
+        for table, path, rows in pool.imap_unordered(write_shard, tasks(args)):
+            totals[table] += rows
+            print(f"{path}: {rows:,} rows", flush=True)
+
+    elapsed = time.perf_counter() - start
+    print(", ".join(f"{rows:,} {table}" for table, rows in totals.items()),
+          f"in {elapsed:.1f}s")
+
+
+if __name__ == '__main__':
+    main()
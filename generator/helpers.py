@@ -1,14 +1,70 @@
 """Support functions for CSV generation."""
 
-from datetime import datetime
-from random import uniform
+import random
+from datetime import datetime, timedelta
 
 
-def get_random_datetime(year_gap=2):
-    """Get a random datetime within the last few years."""
+def get_random_datetime(year_gap=2, rng=random, now=None):
+    """Get a random (naive UTC) datetime within the last few years.
 
-    now = datetime.now()
-    then = now.replace(year=now.year - year_gap)
-    random_timestamp = uniform(then.timestamp(), now.timestamp())
+    Plain timedelta arithmetic, so the same seed gives the same datetimes
+    whatever the host's timezone, and `now` may be a 29th of February.
+    """
 
-    return datetime.fromtimestamp(random_timestamp)
+    now = now or datetime.utcnow()
+    span = timedelta(days=365 * year_gap).total_seconds()
+
+    return now - timedelta(seconds=rng.uniform(0, span))
+
+
+def modular_inverse(a, m):
+    """The x with (a * x) % m == 1 (a and m must be coprime)."""
+
+    old_r, r = a, m
+    old_x, x = 1, 0
+    while r:
+        q = old_r // r
+        old_r, r = r, old_r - q * r
+        old_x, x = x, old_x - q * x
+    return old_x % m
+
+
+class PowerLaw:
+    """Draw ids 1..n with a Zipf-like (power-law) skew.
+
+    Rank 1 is drawn most often. Ranks are mapped to ids through a fixed
+    permutation so the popular ids are spread over the id range (and over
+    shards) instead of all being the lowest ids. Nothing is stored per id,
+    so this works for any n.
+    """
+
+    def __init__(self, n, exponent, salt=1):
+        self.n = n
+        self.exponent = exponent
+        # any multiplier coprime with n gives a permutation of 0..n-1
+        self.multiplier = self._coprime_multiplier(n, 2654435761 + 2 * salt)
+
+    @staticmethod
+    def _coprime_multiplier(n, start):
+        from math import gcd
+
+        multiplier = start % n or 1
+        while gcd(multiplier, n) != 1:
+            multiplier += 1
+        return multiplier
+
+    def rank(self, rng):
+        """A rank in 1..n, rank r drawn with probability ~ 1 / r**exponent."""
+
+        u = rng.random()
+        if self.exponent == 1:
+            r = self.n ** u
+        else:
+            e = 1 - self.exponent
+            r = ((self.n ** e - 1) * u + 1) ** (1 / e)
+        return min(self.n, max(1, int(r)))
+
+    def draw(self, rng):
+        """A random id in 1..n."""
+
+        return (self.rank(rng) - 1) * self.multiplier % self.n + 1
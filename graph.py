@@ -0,0 +1,431 @@
+"""In-memory follow graph, for graph questions the database answers slowly.
+
+Each process keeps the whole follow graph as two compressed sparse row
+(CSR) structures of int32 user ids, one per direction: the ids user `u`
+follows are `targets[offsets[u]:offsets[u + 1]]`, sorted. That's a few
+bytes per follow, and "does A follow B?", mutual follows and
+friends-of-friends suggestions are array lookups and bisections instead of
+queries that load `User` objects.
+
+Follows and unfollows committed by this process are applied to an overlay
+of added and removed edges, folded into fresh arrays once it grows past
+GRAPH_OVERLAY_LIMIT. Changes made by other processes are picked up by
+rebuilding from the `follows` table in a background thread every
+GRAPH_REFRESH_SECONDS, so answers can be that much out of date. Use the
+database where that matters (follow buttons, counters).
+
+`save` writes a snapshot file that `load` maps into memory without copying
+or parsing it, so new workers (see GRAPH_SNAPSHOT) start answering at once
+and rebuild in the background. Snapshots are in native byte order, for the
+machine that wrote them. Write one with
+
+    FLASK_APP=app.py flask graph-snapshot
+"""
+
+import heapq
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from collections import Counter
+
+from flask import current_app
+from sqlalchemy import event
+
+from models import db, FollowersFollowee
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_REFRESH_SECONDS = 300
+DEFAULT_OVERLAY_LIMIT = 10000
+DEFAULT_SUGGESTION_SCAN = 1000
+
+MAGIC = b'WGRAPH01'
+HEADER = struct.Struct('=8sqq')
+
+
+def _csr(size, sources, targets):
+    """Offsets and targets arrays for edges sorted by source."""
+
+    offsets = array('q', bytes(8 * (size + 1)))
+    for source in sources:
+        offsets[source + 1] += 1
+    for i in range(size):
+        offsets[i + 1] += offsets[i]
+
+    placed = array('i', bytes(4 * len(targets)))
+    position = array('q', offsets)
+    for source, target in zip(sources, targets):
+        placed[position[source]] = target
+        position[source] += 1
+
+    return offsets, placed
+
+
+class _Adjacency:
+    """One direction of the graph: CSR arrays plus an overlay of changes."""
+
+    def __init__(self, offsets, targets):
+        self.offsets = offsets
+        self.targets = targets
+        self.added = {}
+        self.removed = {}
+
+    def _bounds(self, user_id):
+        if user_id + 1 >= len(self.offsets):
+            return 0, 0
+        return self.offsets[user_id], self.offsets[user_id + 1]
+
+    def _in_base(self, user_id, other_id):
+        lo, hi = self._bounds(user_id)
+        i = bisect_left(self.targets, other_id, lo, hi)
+        return i < hi and self.targets[i] == other_id
+
+    def has(self, user_id, other_id):
+        if other_id in self.added.get(user_id, ()):
+            return True
+        if other_id in self.removed.get(user_id, ()):
+            return False
+        return self._in_base(user_id, other_id)
+
+    def neighbors(self, user_id):
+        """Sorted ids linked from `user_id`."""
+
+        lo, hi = self._bounds(user_id)
+        base = self.targets[lo:hi]
+        added = self.added.get(user_id)
+        removed = self.removed.get(user_id)
+        if not added and not removed:
+            return base
+        return sorted((set(base) - (removed or frozenset())) | (added or frozenset()))
+
+    def degree(self, user_id):
+        lo, hi = self._bounds(user_id)
+        return (hi - lo
+                + len(self.added.get(user_id, ()))
+                - len(self.removed.get(user_id, ())))
+
+    # the overlay's sets are replaced rather than changed, so readers never
+    # iterate over a set that's being written to
+
+    def add(self, user_id, other_id):
+        removed = self.removed.get(user_id, frozenset())
+        if other_id in removed:
+            self.removed[user_id] = removed - {other_id}
+        elif not self._in_base(user_id, other_id):
+            self.added[user_id] = self.added.get(user_id, frozenset()) | {other_id}
+
+    def remove(self, user_id, other_id):
+        added = self.added.get(user_id, frozenset())
+        if other_id in added:
+            self.added[user_id] = added - {other_id}
+        elif self._in_base(user_id, other_id):
+            self.removed[user_id] = self.removed.get(user_id, frozenset()) | {other_id}
+
+    def overlay_size(self):
+        return (sum(len(ids) for ids in self.added.values())
+                + sum(len(ids) for ids in self.removed.values()))
+
+
+class FollowGraph:
+    """Who follows whom, by user id. Thread-safe."""
+
+    def __init__(self, size, following, followers, snapshot=None):
+        self.size = size
+        self._following = following
+        self._followers = followers
+        self._lock = threading.Lock()
+        self._snapshot = snapshot
+        self.built_at = time.time()
+
+    @classmethod
+    def from_edges(cls, edges):
+        """Build from `(user_id, followed_id)` pairs sorted by both."""
+
+        sources = array('i')
+        targets = array('i')
+        for user_id, followed_id in edges:
+            sources.append(user_id)
+            targets.append(followed_id)
+
+        size = max(max(sources, default=0), max(targets, default=0)) + 1
+        following = _Adjacency(*_csr(size, sources, targets))
+        # `sources` is sorted, so each follower list comes out sorted too
+        followers = _Adjacency(*_csr(size, targets, sources))
+        return cls(size, following, followers)
+
+    @classmethod
+    def from_database(cls):
+        """Build from the `follows` table."""
+
+        # `followee_id` is the follower's id; see FollowersFollowee
+        rows = (db.session
+                .query(FollowersFollowee.followee_id, FollowersFollowee.follower_id)
+                .order_by(FollowersFollowee.followee_id, FollowersFollowee.follower_id)
+                .yield_per(10000))
+        return cls.from_edges(rows)
+
+    def edges(self):
+        """Every `(user_id, followed_id)` pair, sorted."""
+
+        for user_id in range(self.size):
+            for followed_id in self._following.neighbors(user_id):
+                yield user_id, followed_id
+        # ids past the arrays that only exist in the overlay
+        for user_id in sorted(u for u in list(self._following.added) if u >= self.size):
+            for followed_id in sorted(self._following.added[user_id]):
+                yield user_id, followed_id
+
+    ############ QUERIES ###################
+
+    def follows(self, user_id, other_id):
+        """Does `user_id` follow `other_id`?"""
+
+        return self._following.has(user_id, other_id)
+
+    def following(self, user_id):
+        """Sorted ids of the users `user_id` follows."""
+
+        return list(self._following.neighbors(user_id))
+
+    def followers(self, user_id):
+        """Sorted ids of the users following `user_id`."""
+
+        return list(self._followers.neighbors(user_id))
+
+    def following_count(self, user_id):
+        return self._following.degree(user_id)
+
+    def followers_count(self, user_id):
+        return self._followers.degree(user_id)
+
+    def mutuals(self, user_id):
+        """Sorted ids of the users `user_id` follows who follow them back."""
+
+        following = self._following.neighbors(user_id)
+        followers = self._followers.neighbors(user_id)
+        if len(followers) < len(following):
+            return [id for id in followers if self._following.has(user_id, id)]
+        return [id for id in following if self._followers.has(user_id, id)]
+
+    def who_to_follow(self, user_id, limit=10, scan=DEFAULT_SUGGESTION_SCAN):
+        """Users followed by those `user_id` follows, but not by `user_id`.
+
+        `(user_id, how many of the people they follow follow them)` pairs,
+        most shared first. Looks at no more than `scan` of the users
+        `user_id` follows, so hub accounts stay cheap.
+        """
+
+        following = self._following.neighbors(user_id)
+        counts = Counter()
+        for followed_id in following[:scan]:
+            counts.update(self._following.neighbors(followed_id))
+
+        counts.pop(user_id, None)
+        candidates = ((count, -id) for id, count in counts.items()
+                      if not self._following.has(user_id, id))
+        return [(-negative_id, count)
+                for count, negative_id in heapq.nlargest(limit, candidates)]
+
+    ############ UPDATES ###################
+
+    def add(self, user_id, followed_id):
+        with self._lock:
+            self._following.add(user_id, followed_id)
+            self._followers.add(followed_id, user_id)
+
+    def remove(self, user_id, followed_id):
+        with self._lock:
+            self._following.remove(user_id, followed_id)
+            self._followers.remove(followed_id, user_id)
+
+    def overlay_size(self):
+        return self._following.overlay_size()
+
+    ############ SNAPSHOTS ###################
+
+    def save(self, path):
+        """Write a snapshot to `path` (atomically)."""
+
+        compact = FollowGraph.from_edges(self.edges()) if self.overlay_size() else self
+        temporary = f"{path}.{os.getpid()}.tmp"
+
+        with open(temporary, 'wb') as out:
+            out.write(HEADER.pack(MAGIC, compact.size, len(compact._following.targets)))
+            for adjacency in (compact._following, compact._followers):
+                out.write(adjacency.offsets.tobytes())
+                out.write(adjacency.targets.tobytes())
+                # keep the next offsets array 8-byte aligned
+                out.write(bytes(-out.tell() % 8))
+
+        os.replace(temporary, path)
+
+    @classmethod
+    def load(cls, path):
+        """Map the snapshot at `path` into memory."""
+
+        with open(path, 'rb') as snapshot:
+            mapped = mmap.mmap(snapshot.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, size, edge_count = HEADER.unpack_from(mapped)
+        if magic != MAGIC:
+            raise ValueError(f"{path} isn't a follow graph snapshot")
+
+        view = memoryview(mapped)
+        position = HEADER.size
+        adjacencies = []
+        for _ in range(2):
+            end = position + 8 * (size + 1)
+            offsets = view[position:end].cast('q')
+            position, end = end, end + 4 * edge_count
+            targets = view[position:end].cast('i')
+            position = end + (-end % 8)
+            adjacencies.append(_Adjacency(offsets, targets))
+
+        graph = cls(size, *adjacencies, snapshot=mapped)
+        graph.built_at = os.path.getmtime(path)
+        return graph
+
+
+##############################################################################
+# The app's graph
+
+def get():
+    """This process's follow graph, loading or building it on first use."""
+
+    app = current_app._get_current_object()
+    state = app.extensions.get('follow_graph')
+
+    if state is None:
+        with _state_lock:
+            state = app.extensions.get('follow_graph')
+            if state is None:
+                state = app.extensions['follow_graph'] = _GraphState(_initial(app))
+
+    refresh_after = app.config.get('GRAPH_REFRESH_SECONDS', DEFAULT_REFRESH_SECONDS)
+    if time.time() - state.graph.built_at > refresh_after:
+        state.refresh_in_background(app)
+
+    return state.graph
+
+
+_state_lock = threading.Lock()
+
+
+class _GraphState:
+    """The current graph, and changes made while a rebuild was running."""
+
+    def __init__(self, graph):
+        self.graph = graph
+        self.replay = None
+        self.lock = threading.Lock()
+
+    def apply(self, changes, overlay_limit):
+        with self.lock:
+            for change in changes:
+                _apply(self.graph, change)
+            if self.replay is not None:
+                self.replay.extend(changes)
+            elif self.graph.overlay_size() > overlay_limit:
+                self.graph = FollowGraph.from_edges(self.graph.edges())
+
+    def rebuild(self):
+        """Swap in a graph freshly built from the database."""
+
+        with self.lock:
+            if self.replay is not None:
+                return
+            self.replay = []
+
+        try:
+            graph = FollowGraph.from_database()
+        finally:
+            db.session.remove()
+            with self.lock:
+                replay, self.replay = self.replay, None
+
+        with self.lock:
+            for change in replay:
+                _apply(graph, change)
+            self.graph = graph
+
+    def refresh_in_background(self, app):
+        if self.replay is not None:
+            return
+
+        def refresh():
+            with app.app_context():
+                try:
+                    self.rebuild()
+                except Exception:
+                    logger.exception("rebuilding the follow graph failed")
+
+        # don't start another refresh until this one is done
+        self.graph.built_at = time.time()
+        threading.Thread(target=refresh, name="follow-graph-refresh", daemon=True).start()
+
+
+def _apply(graph, change):
+    action, user_id, followed_id = change
+    if action == 'follow':
+        graph.add(user_id, followed_id)
+    else:
+        graph.remove(user_id, followed_id)
+
+
+def _initial(app):
+    path = app.config.get('GRAPH_SNAPSHOT')
+    if path and os.path.exists(path):
+        try:
+            return FollowGraph.load(path)
+        except (OSError, ValueError, struct.error):
+            logger.exception("couldn't load follow graph snapshot %s", path)
+    return FollowGraph.from_database()
+
+
+def rebuild():
+    """Rebuild this process's graph from the database now."""
+
+    app = current_app._get_current_object()
+    state = app.extensions.get('follow_graph')
+    if state is None:
+        get()
+    else:
+        state.rebuild()
+
+
+##############################################################################
+# Keeping it up to date
+
+def followed(user_id, followed_id):
+    """Note a follow, applied to the graph once the transaction commits."""
+
+    db.session.info.setdefault('graph_changes', []).append(('follow', user_id, followed_id))
+
+
+def unfollowed(user_id, followed_id):
+    """Note an unfollow, applied to the graph once the transaction commits."""
+
+    db.session.info.setdefault('graph_changes', []).append(('unfollow', user_id, followed_id))
+
+
+@event.listens_for(db.session, 'after_commit')
+def _apply_changes(session):
+    changes = session.info.pop('graph_changes', None)
+    if not changes:
+        return
+
+    app = db.get_app()
+    state = app.extensions.get('follow_graph')
+    # a graph that doesn't exist yet will be built with these already in it
+    if state is not None:
+        state.apply(changes, app.config.get('GRAPH_OVERLAY_LIMIT', DEFAULT_OVERLAY_LIMIT))
+
+
+@event.listens_for(db.session, 'after_rollback')
+def _drop_changes(session):
+    session.info.pop('graph_changes', None)
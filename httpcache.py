@@ -0,0 +1,136 @@
+"""HTTP caching: conditional GETs, per-route Cache-Control and static assets.
+
+Message pages and profiles get strong ETags derived from cheap version
+stamps. A stamp holds the ids, `profile_version`, `activity_version` and
+counters of the users the page shows, and the same for the viewer, since
+the viewer's likes and follows are on the page.
+The stamp is one small indexed query, so a matching `If-None-Match` is
+answered with a 304 before the view runs or any template is rendered.
+
+There is no Last-Modified: no timestamp covers profile edits, likes and
+follows, and the ETag already does.
+
+Every other page defaults to `no-cache`, made `private` for logged-in users.
+All pages vary on the session cookie. Static files linked through
+`static_url()` carry a content fingerprint, so they are cached for a year
+as immutable. Changing a file changes its URL.
+"""
+
+import hashlib
+import os
+from functools import wraps
+
+from flask import current_app, g, make_response, request, session, url_for
+
+from models import db, User
+import archive
+
+STATIC_MAX_AGE = 365 * 24 * 60 * 60
+
+
+def _versions(*user_ids):
+    """{id: (profile_version, activity_version, counters...)} for `user_ids`."""
+
+    rows = (db.session
+            .query(User.id, User.profile_version, User.activity_version,
+                   User.messages_count, User.following_count,
+                   User.followers_count, User.likes_count)
+            .filter(User.id.in_([id for id in user_ids if id is not None])))
+    return {row[0]: tuple(row[1:]) for row in rows}
+
+
+def _viewer_id():
+    return g.user.id if g.user else None
+
+
+def profile_stamp(user_id):
+    """Version stamp of `/users/<user_id>`, or None if there's no such user."""
+
+    viewer_id = _viewer_id()
+    versions = _versions(user_id, viewer_id)
+    if user_id not in versions:
+        return None
+    return ('profile', user_id, versions[user_id], viewer_id, versions.get(viewer_id))
+
+
+def message_stamp(message_id):
+    """Version stamp of `/messages/<message_id>`, or None if it's gone."""
+
+    author_id = archive.author_of(message_id)
+    if author_id is None:
+        return None
+
+    viewer_id = _viewer_id()
+    versions = _versions(author_id, viewer_id)
+    # messages can't be edited; only their author's profile can change
+    return ('message', message_id, author_id, versions[author_id][0],
+            viewer_id, versions.get(viewer_id))
+
+
+def _etag(stamp):
+    # the query string picks the page (cursors, page sizes)
+    return hashlib.sha1(repr((stamp, request.full_path)).encode()).hexdigest()[:24]
+
+
+def conditional(stamp_for):
+    """Decorate a view with ETags from `stamp_for(**view_args)`.
+
+    A matching `If-None-Match` gets a 304 without running the view. Pages
+    with flashed messages pending aren't tagged, since the flash is only
+    shown once.
+    """
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(**view_args):
+            stamp = None if session.get('_flashes') else stamp_for(**view_args)
+            if stamp is None:
+                return view(**view_args)
+
+            etag = _etag(stamp)
+            if request.if_none_match.contains(etag):
+                response = current_app.response_class(status=304)
+            else:
+                response = make_response(view(**view_args))
+
+            response.set_etag(etag)
+            return response
+
+        return wrapper
+    return decorator
+
+
+def static_url(filename):
+    """URL of a file in /static, fingerprinted with a hash of its contents."""
+
+    path = os.path.join(current_app.static_folder, filename)
+    mtime = os.path.getmtime(path)
+    fingerprints = current_app.extensions.setdefault('static_fingerprints', {})
+
+    cached = fingerprints.get(filename)
+    if cached is None or cached[0] != mtime:
+        with open(path, 'rb') as f:
+            cached = (mtime, hashlib.md5(f.read()).hexdigest()[:12])
+        fingerprints[filename] = cached
+
+    return url_for('static', filename=filename, v=cached[1])
+
+
+def apply_policy(response):
+    """Cache-Control and Vary for every response (ETagged pages still have
+    to revalidate)."""
+
+    if request.endpoint == 'static':
+        if request.args.get('v'):
+            response.headers['Cache-Control'] = (
+                f"public, max-age={STATIC_MAX_AGE}, immutable")
+        else:
+            response.headers['Cache-Control'] = "no-cache"
+        return response
+
+    response.vary.add('Cookie')
+    response.cache_control.no_cache = True
+    if g.get('user'):
+        response.cache_control.private = True
+
+    return response
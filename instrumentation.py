@@ -0,0 +1,212 @@
+"""Lightweight SQL and request instrumentation, cheap enough to leave on.
+
+For every request this counts the SQL statements run and the time spent in
+the database. It adds those numbers to the response as a `Server-Timing`
+header, and logs:
+
+- slow statements (over `SLOW_QUERY_MS`), with the route that ran them;
+- likely N+1 patterns: the same statement run `N_PLUS_ONE_THRESHOLD` or
+  more times in one request.
+
+Per-endpoint histograms of latency, query count and database time are
+kept in memory. `/metrics` serves them in the Prometheus text format.
+Each worker process keeps its own numbers, so scrape every worker or sum
+them up.
+
+Everything is plain counters and `perf_counter()` calls, kept on `g`. No
+statements are parsed and nothing is stored per request once it ends.
+"""
+
+import bisect
+import logging
+import threading
+import time
+from collections import Counter
+
+from flask import current_app, g, has_request_context, request, Response
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SLOW_QUERY_MS = 200
+DEFAULT_N_PLUS_ONE_THRESHOLD = 10
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200)
+
+
+class Histogram:
+    """Cumulative-bucket histogram in the Prometheus style."""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def samples(self):
+        """(le, cumulative count) pairs, ending with +Inf."""
+
+        total = 0
+        for le, count in zip(self.buckets + ('+Inf',), self.counts):
+            total += count
+            yield le, total
+
+
+class Metrics:
+    """Per-endpoint aggregates for one process."""
+
+    HISTOGRAMS = [
+        ('warbler_request_duration_seconds', "Request latency.", LATENCY_BUCKETS),
+        ('warbler_request_queries', "SQL statements per request.", QUERY_COUNT_BUCKETS),
+        ('warbler_request_db_seconds', "Time spent in the database per request.",
+         LATENCY_BUCKETS),
+    ]
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.histograms = {name: {} for name, _, _ in self.HISTOGRAMS}
+        self.n_plus_one = Counter()
+        self.slow_queries = Counter()
+
+    def observe(self, endpoint, duration, queries, db_time):
+        with self.lock:
+            for (name, _, buckets), value in zip(self.HISTOGRAMS,
+                                                 (duration, queries, db_time)):
+                per_endpoint = self.histograms[name]
+                if endpoint not in per_endpoint:
+                    per_endpoint[endpoint] = Histogram(buckets)
+                per_endpoint[endpoint].observe(value)
+
+    def count(self, counter, endpoint):
+        with self.lock:
+            counter[endpoint] += 1
+
+    def render(self):
+        """The metrics in the Prometheus text exposition format."""
+
+        lines = []
+        with self.lock:
+            for name, help_text, _ in self.HISTOGRAMS:
+                lines += [f"# HELP {name} {help_text}", f"# TYPE {name} histogram"]
+                for endpoint, hist in sorted(self.histograms[name].items()):
+                    label = f'endpoint="{endpoint}"'
+                    for le, total in hist.samples():
+                        lines.append(f'{name}_bucket{{{label},le="{le}"}} {total}')
+                    lines.append(f'{name}_sum{{{label}}} {hist.sum}')
+                    lines.append(f'{name}_count{{{label}}} {hist.count}')
+
+            for name, help_text, counter in [
+                    ('warbler_n_plus_one_total',
+                     "Requests that repeated one statement too often.", self.n_plus_one),
+                    ('warbler_slow_queries_total',
+                     "Statements slower than SLOW_QUERY_MS.", self.slow_queries)]:
+                lines += [f"# HELP {name} {help_text}", f"# TYPE {name} counter"]
+                for endpoint, total in sorted(counter.items()):
+                    lines.append(f'{name}{{endpoint="{endpoint}"}} {total}')
+
+        return "\n".join(lines) + "\n"
+
+
+class RequestStats:
+    """SQL activity of the current request."""
+
+    __slots__ = ('queries', 'db_time', 'statements')
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.statements = Counter()
+
+
+def _endpoint():
+    return request.endpoint or 'unmatched'
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    # statements on one connection don't nest, so one start time is enough
+    conn.info['query_started'] = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info['query_started']
+
+    if not has_request_context():
+        return
+    stats = g.get('sql_stats')
+    if stats is None:
+        return
+
+    stats.queries += 1
+    stats.db_time += elapsed
+    stats.statements[statement] += 1
+
+    settings = g.sql_settings
+    if elapsed * 1000 >= settings['slow_ms']:
+        settings['metrics'].count(settings['metrics'].slow_queries, _endpoint())
+        logger.warning("slow query (%.1f ms) in %s %s: %s",
+                       elapsed * 1000, request.method, request.path, statement)
+
+
+def _start_request(app):
+    g.request_started = time.perf_counter()
+    g.sql_stats = RequestStats()
+    g.sql_settings = {
+        'slow_ms': app.config['SLOW_QUERY_MS'],
+        'metrics': app.extensions['metrics'],
+    }
+
+
+def _finish_request(app, response):
+    stats = g.get('sql_stats')
+    if stats is None:
+        return response
+
+    duration = time.perf_counter() - g.request_started
+    endpoint = _endpoint()
+    metrics = app.extensions['metrics']
+    metrics.observe(endpoint, duration, stats.queries, stats.db_time)
+
+    if stats.statements:
+        statement, repeats = stats.statements.most_common(1)[0]
+        if repeats >= app.config['N_PLUS_ONE_THRESHOLD']:
+            metrics.count(metrics.n_plus_one, endpoint)
+            logger.warning("possible N+1 in %s %s: statement ran %d times: %s",
+                           request.method, request.path, repeats, statement)
+
+    response.headers['Server-Timing'] = (
+        f'db;dur={stats.db_time * 1000:.1f};desc="{stats.queries} queries", '
+        f'app;dur={duration * 1000:.1f}')
+    return response
+
+
+def metrics_view():
+    """Per-endpoint metrics for Prometheus to scrape."""
+
+    token = current_app.config['METRICS_TOKEN']
+    if token and request.headers.get('Authorization') != f"Bearer {token}":
+        return "Unauthorized", 401
+
+    return Response(current_app.extensions['metrics'].render(),
+                    mimetype='text/plain; version=0.0.4')
+
+
+def init_app(app):
+    """Instrument `app`: call this before registering other request hooks, so
+    their queries are counted too."""
+
+    app.extensions['metrics'] = Metrics()
+
+    if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+
+    app.before_request(lambda: _start_request(app))
+    app.after_request(lambda response: _finish_request(app, response))
+    app.add_url_rule('/metrics', 'metrics', metrics_view)
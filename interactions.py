@@ -0,0 +1,97 @@
+"""Likes and follows: the write paths shared by the HTML views and the API.
+
+Each write is a single statement that is safe to repeat or race: an
+`INSERT ... ON CONFLICT DO NOTHING` (`INSERT OR IGNORE` on SQLite) or a
+plain `DELETE`. Its row count says whether it changed anything, and only
+then are counters and timelines adjusted (see counters.py, timeline.py),
+so double clicks and concurrent requests can't skew them. The followee's
+counter is adjusted by a background job (see jobs.py), and the in-memory
+follow graph once the transaction commits (see graph.py). Relationship
+collections are never loaded. The caller commits.
+"""
+
+from sqlalchemy import and_
+from sqlalchemy.dialects import postgresql
+
+from models import db, FollowersFollowee, Like
+import counters
+import graph
+import timeline
+
+
+def _insert_ignoring_duplicates(table, **values):
+    """Insert a row unless it's already there; True if it was inserted."""
+
+    dialect = db.session.connection().dialect.name
+    if dialect == 'postgresql':
+        statement = postgresql.insert(table).values(**values).on_conflict_do_nothing()
+    else:
+        statement = table.insert().values(**values).prefix_with('OR IGNORE', dialect='sqlite')
+
+    return db.session.execute(statement).rowcount == 1
+
+
+def _delete(table, *where):
+    """Delete matching rows; True if there were any."""
+
+    return db.session.execute(table.delete().where(and_(*where))).rowcount > 0
+
+
+def like(user_id, message_id):
+    """Have `user_id` like `message_id`."""
+
+    if not _insert_ignoring_duplicates(Like.__table__,
+                                       user_id=user_id, message_id=message_id):
+        return False
+
+    counters.adjust(user_id, likes_count=1)
+    return True
+
+
+def unlike(user_id, message_id):
+    """Have `user_id` stop liking `message_id`."""
+
+    if not _delete(Like.__table__,
+                   Like.user_id == user_id, Like.message_id == message_id):
+        return False
+
+    counters.adjust(user_id, likes_count=-1)
+    return True
+
+
+def toggle_like(user_id, message_id):
+    """Like `message_id`, or unlike it if it's liked; True if it's now liked."""
+
+    if unlike(user_id, message_id):
+        return False
+    return like(user_id, message_id)
+
+
+def follow(user_id, followee_id):
+    """Have `user_id` follow `followee_id`."""
+
+    # `followee_id` is the follower's id; see FollowersFollowee
+    if not _insert_ignoring_duplicates(FollowersFollowee.__table__,
+                                       followee_id=user_id, follower_id=followee_id):
+        return False
+
+    counters.adjust(user_id, following_count=1)
+    counters.adjust_later(followee_id, followers_count=1)
+    timeline.backfill(user_id, followee_id)
+    graph.followed(user_id, followee_id)
+    return True
+
+
+def unfollow(user_id, followee_id):
+    """Have `user_id` stop following `followee_id`."""
+
+    if not _delete(FollowersFollowee.__table__,
+                   FollowersFollowee.followee_id == user_id,
+                   FollowersFollowee.follower_id == followee_id):
+        return False
+
+    counters.adjust(user_id, following_count=-1)
+    counters.adjust_later(followee_id, followers_count=-1)
+    timeline.prune(user_id, followee_id)
+    graph.unfollowed(user_id, followee_id)
+    return True
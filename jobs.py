@@ -0,0 +1,181 @@
+"""Durable background jobs for work that doesn't need to finish in the request.
+
+Request handlers commit their minimal change and `enqueue` the expensive
+follow-on work (fan-out, other users' counters, account purges). Jobs are
+rows in the `jobs` table, written in the request's own transaction, so a
+job exists exactly when the change that asked for it was committed.
+
+Workers claim ready jobs one at a time (`FOR UPDATE SKIP LOCKED` on
+Postgres, so many workers don't block each other), run the registered
+handler, and delete the job in the handler's transaction. A failing job is
+retried with exponential backoff and marked `failed` after
+`JOBS_MAX_ATTEMPTS`. A job whose worker died is picked up again after
+`JOBS_LOCK_TIMEOUT` seconds. Handlers must therefore be safe to run again.
+
+Run workers with `flask run-worker`, or in threads of the web process with
+`JOBS_WORKER_THREADS`. With `JOBS_EAGER` (development and tests) jobs run
+inline when they're enqueued.
+"""
+
+import json
+import logging
+import threading
+import traceback
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import and_, or_
+
+from models import db, Job
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_ATTEMPTS = 5
+DEFAULT_RETRY_DELAY = 10
+DEFAULT_LOCK_TIMEOUT = 300
+DEFAULT_POLL_INTERVAL = 1.0
+
+HANDLERS = {}
+
+
+def handler(name):
+    """Register the decorated function as the handler of jobs called `name`."""
+
+    def decorator(func):
+        HANDLERS[name] = func
+        return func
+    return decorator
+
+
+def enqueue(name, **payload):
+    """Ask for `name` to run with `payload` (JSON-serializable keywords)."""
+
+    if name not in HANDLERS:
+        raise KeyError(f"no job handler called {name!r}")
+
+    if current_app.config.get('JOBS_EAGER'):
+        HANDLERS[name](**payload)
+        return
+
+    db.session.add(Job(name=name, payload=json.dumps(payload)))
+
+
+def _ready(now):
+    """Jobs that are due, or were claimed by a worker that went away."""
+
+    stale = now - timedelta(
+        seconds=current_app.config.get('JOBS_LOCK_TIMEOUT', DEFAULT_LOCK_TIMEOUT))
+    return or_(and_(Job.status == 'pending', Job.run_at <= now),
+               and_(Job.status == 'running', Job.locked_at < stale))
+
+
+def claim():
+    """Claim the next ready job; its id, or None if there's nothing to do."""
+
+    # another worker may claim our pick first; then try the next one
+    while True:
+        now = datetime.utcnow()
+
+        query = (db.session.query(Job.id)
+                 .filter(_ready(now))
+                 .order_by(Job.run_at, Job.id)
+                 .limit(1))
+        if db.session.connection().dialect.name == 'postgresql':
+            query = query.with_for_update(skip_locked=True)
+
+        job_id = query.scalar()
+        if job_id is None:
+            db.session.rollback()
+            return None
+
+        # re-check readiness in case another worker claimed it in the meantime
+        claimed = (Job.query
+                   .filter(Job.id == job_id, _ready(now))
+                   .update({Job.status: 'running',
+                            Job.locked_at: now,
+                            Job.attempts: Job.attempts + 1},
+                           synchronize_session=False))
+        db.session.commit()
+
+        if claimed:
+            return job_id
+
+
+def run(job_id):
+    """Run a claimed job; True if it succeeded."""
+
+    job = Job.query.get(job_id)
+
+    try:
+        HANDLERS[job.name](**json.loads(job.payload))
+        Job.query.filter(Job.id == job_id).delete(synchronize_session=False)
+        db.session.commit()
+        return True
+
+    except Exception:
+        db.session.rollback()
+        logger.exception("job %s (%s) failed", job_id, job.name)
+        _failed(job_id, traceback.format_exc())
+        return False
+
+
+def _failed(job_id, error):
+    config = current_app.config
+    job = Job.query.get(job_id)
+
+    if job.attempts >= config.get('JOBS_MAX_ATTEMPTS', DEFAULT_MAX_ATTEMPTS):
+        job.status = 'failed'
+    else:
+        delay = config.get('JOBS_RETRY_DELAY', DEFAULT_RETRY_DELAY) * 2 ** (job.attempts - 1)
+        job.status = 'pending'
+        job.run_at = datetime.utcnow() + timedelta(seconds=delay)
+
+    job.locked_at = None
+    job.last_error = error[-4000:]
+    db.session.commit()
+
+
+def run_pending(max_jobs=None):
+    """Run ready jobs until there are none (or `max_jobs` ran); how many ran."""
+
+    ran = 0
+    while max_jobs is None or ran < max_jobs:
+        job_id = claim()
+        if job_id is None:
+            break
+        run(job_id)
+        ran += 1
+    return ran
+
+
+def work(poll_interval=DEFAULT_POLL_INTERVAL, stop=None):
+    """Run jobs until `stop` (a threading.Event) is set, polling when idle."""
+
+    stop = stop or threading.Event()
+    while not stop.is_set():
+        try:
+            ran = run_pending(max_jobs=100)
+        except Exception:
+            db.session.rollback()
+            logger.exception("job worker error")
+            ran = 0
+        finally:
+            db.session.remove()
+
+        if not ran:
+            stop.wait(poll_interval)
+
+
+def start_worker_threads(app, count):
+    """Run `count` workers in daemon threads of this process."""
+
+    stop = threading.Event()
+
+    def worker():
+        with app.app_context():
+            work(stop=stop)
+
+    for i in range(count):
+        threading.Thread(target=worker, name=f"jobs-worker-{i}", daemon=True).start()
+
+    return stop
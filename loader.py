@@ -0,0 +1,237 @@
+"""Streaming bulk loader for the generator CSVs.
+
+Loads users, messages, follows and (if present) likes in fixed-size batches,
+so memory use doesn't grow with the size of the files: with `COPY ... FROM
+STDIN` on Postgres and a batched `executemany` elsewhere. Each batch is
+committed in the same transaction as a checkpoint of how many rows of each
+file are in (the `load_checkpoints` table), so an interrupted load picks up
+where it stopped when run again, without loading any batch twice.
+
+When everything is loaded, the denormalized counters and materialized
+timelines are rebuilt from the new data.
+
+    python loader.py --reset                 # fresh database from generator/
+    python loader.py --batch-size 50000      # resume an interrupted load
+"""
+
+import argparse
+import csv
+import glob
+import io
+import os
+import sys
+import time
+
+from sqlalchemy import MetaData, text
+
+from app import app
+from models import db
+import counters
+import migrations
+import timeline
+
+DEFAULT_BATCH_SIZE = 10000
+DEFAULT_DATA_DIR = 'generator'
+
+# load order matters: messages, follows and likes refer to users by the ids
+# they get from being inserted in file order
+TABLES = ['users', 'messages', 'follows', 'likes']
+
+
+def data_files(data_dir, table):
+    """CSV files for `table`: `<table>.csv` or shards like `<table>-00001.csv`."""
+
+    single = os.path.join(data_dir, f"{table}.csv")
+    if os.path.exists(single):
+        return [single]
+    return sorted(glob.glob(os.path.join(data_dir, f"{table}-*.csv")))
+
+
+# loader bookkeeping, not part of the app's schema
+load_checkpoints = db.Table(
+    'load_checkpoints',
+    MetaData(),
+    db.Column('filename', db.Text, primary_key=True),
+    db.Column('rows_done', db.Integer, nullable=False),
+)
+
+
+def _marker(paramstyle):
+    return '?' if paramstyle == 'qmark' else '%s'
+
+
+class Checkpoint:
+    """Rows loaded so far per file, kept in `load_checkpoints`.
+
+    `save` writes in the caller's transaction on `raw_conn`, so the
+    checkpoint is committed with the batch it counts, or not at all.
+    """
+
+    def __init__(self, raw_conn):
+        load_checkpoints.create(db.engine, checkfirst=True)
+        self.raw_conn = raw_conn
+
+        cursor = raw_conn.cursor()
+        cursor.execute("SELECT filename, rows_done FROM load_checkpoints")
+        self.done = dict(cursor.fetchall())
+        cursor.close()
+        raw_conn.commit()
+
+    def rows_done(self, filename):
+        return self.done.get(filename, 0)
+
+    def save(self, cursor, filename, rows):
+        marker = _marker(db.engine.dialect.paramstyle)
+        cursor.execute(f"DELETE FROM load_checkpoints WHERE filename = {marker}",
+                       (filename,))
+        cursor.execute(f"INSERT INTO load_checkpoints (filename, rows_done) "
+                       f"VALUES ({marker}, {marker})", (filename, rows))
+        self.done[filename] = rows
+
+    def clear(self):
+        cursor = self.raw_conn.cursor()
+        cursor.execute("DELETE FROM load_checkpoints")
+        cursor.close()
+        self.raw_conn.commit()
+        self.done = {}
+
+
+def _batches(reader, size):
+    batch = []
+    for row in reader:
+        batch.append(row)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _copy_batch(cursor, table, columns, batch):
+    """Postgres: stream a batch through COPY FROM STDIN."""
+
+    buf = io.StringIO()
+    csv.writer(buf).writerows(batch)
+    buf.seek(0)
+    cursor.copy_expert(
+        f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)", buf)
+
+
+def _insert_batch(cursor, table, columns, batch, paramstyle):
+    """Everything else: one executemany per batch."""
+
+    marker = _marker(paramstyle)
+    placeholders = ', '.join([marker] * len(columns))
+    # empty CSV fields mean NULL, as they do for COPY
+    rows = [[value if value != '' else None for value in row] for row in batch]
+    cursor.executemany(
+        f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({placeholders})", rows)
+
+
+def load_file(raw_conn, table, filename, batch_size, checkpoint, progress):
+    """Load one CSV file into `table`, resuming after the checkpointed rows."""
+
+    dialect = db.engine.dialect
+    known_columns = set(db.metadata.tables[table].columns.keys())
+    skip = checkpoint.rows_done(filename)
+    loaded = skip
+    start = time.perf_counter()
+
+    with open(filename, newline='') as f:
+        reader = csv.reader(f)
+        columns = next(reader)
+
+        unknown = set(columns) - known_columns
+        if unknown:
+            raise ValueError(f"{filename}: unknown columns for {table}: {sorted(unknown)}")
+
+        for _ in range(skip):
+            next(reader, None)
+
+        for batch in _batches(reader, batch_size):
+            cursor = raw_conn.cursor()
+            if dialect.name == 'postgresql':
+                _copy_batch(cursor, table, columns, batch)
+            else:
+                _insert_batch(cursor, table, columns, batch, dialect.paramstyle)
+            loaded += len(batch)
+            checkpoint.save(cursor, filename, loaded)
+            cursor.close()
+            raw_conn.commit()
+
+            rate = (loaded - skip) / max(time.perf_counter() - start, 1e-9)
+            progress(f"{filename}: {loaded:,} rows ({rate:,.0f} rows/s)")
+
+    return loaded - skip
+
+
+def _tune_for_bulk_load(raw_conn):
+    """Trade durability of the in-flight batch for speed while loading."""
+
+    cursor = raw_conn.cursor()
+    if db.engine.dialect.name == 'postgresql':
+        cursor.execute("SET synchronous_commit = off")
+    elif db.engine.dialect.name == 'sqlite':
+        cursor.execute("PRAGMA synchronous = OFF")
+    cursor.close()
+
+
+def rebuild_projections(progress):
+    """Rebuild everything derived from the raw tables."""
+
+    progress("reconciling counters")
+    counters.reconcile()
+    db.session.commit()
+
+    progress("rebuilding timelines")
+    timeline.rebuild_all()
+    db.session.commit()
+
+    if db.engine.dialect.name == 'postgresql':
+        progress("analyzing tables")
+        db.session.execute(text("ANALYZE"))
+        db.session.commit()
+
+
+def load(data_dir=DEFAULT_DATA_DIR, batch_size=DEFAULT_BATCH_SIZE,
+         reset=False, progress=print):
+    """Load every generator CSV in `data_dir` and rebuild the projections."""
+
+    if reset:
+        db.drop_all()
+        migrations.upgrade(log=progress)
+
+    raw_conn = db.engine.raw_connection()
+    try:
+        checkpoint = Checkpoint(raw_conn)
+        if reset:
+            checkpoint.clear()
+
+        _tune_for_bulk_load(raw_conn)
+        for table in TABLES:
+            for filename in data_files(data_dir, table):
+                load_file(raw_conn, table, filename, batch_size, checkpoint, progress)
+
+        rebuild_projections(progress)
+        checkpoint.clear()
+    finally:
+        raw_conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--data-dir', default=DEFAULT_DATA_DIR)
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument('--reset', action='store_true',
+                        help="drop and recreate all tables first")
+    args = parser.parse_args()
+
+    def progress(line):
+        print(line, file=sys.stderr, flush=True)
+
+    with app.app_context():
+        load(args.data_dir, args.batch_size, args.reset, progress)
+
+
+if __name__ == '__main__':
+    main()
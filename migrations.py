@@ -0,0 +1,243 @@
+"""Versioned schema migrations for Warbler.
+
+Each migration is a function registered with `@migration(version)` and is
+applied once, in version order, in its own transaction; applied versions
+are recorded in the `schema_migrations` table. Migrations must be safe to
+run against a database created by an older `db.create_all()`, so they
+check before adding columns or indexes.
+
+Apply pending migrations with:
+
+    FLASK_APP=app.py flask db-upgrade
+"""
+
+from datetime import datetime
+
+from sqlalchemy import inspect, text
+
+from models import db, ArchivedLike, ArchivedMessage, Job, TimelineEntry
+import counters
+import search
+import timeline
+
+schema_migrations = db.Table(
+    'schema_migrations',
+    db.Column('version', db.Integer, primary_key=True),
+    db.Column('name', db.Text, nullable=False),
+    db.Column('applied_at', db.DateTime, nullable=False),
+)
+
+MIGRATIONS = []
+
+
+def migration(version):
+    """Register the decorated function as migration number `version`."""
+
+    def register(fn):
+        assert all(v != version for v, _ in MIGRATIONS), f"duplicate migration {version}"
+        MIGRATIONS.append((version, fn))
+        MIGRATIONS.sort(key=lambda m: m[0])
+        return fn
+
+    return register
+
+
+def applied_versions():
+    """Versions already applied to the database."""
+
+    schema_migrations.create(db.session.connection(), checkfirst=True)
+    rows = db.session.execute(schema_migrations.select()).fetchall()
+    return {row.version for row in rows}
+
+
+def pending():
+    """Migrations not yet applied, as `(version, fn)` pairs in order."""
+
+    done = applied_versions()
+    return [(version, fn) for version, fn in MIGRATIONS if version not in done]
+
+
+def upgrade(log=print):
+    """Apply every pending migration."""
+
+    for version, fn in pending():
+        log(f"Applying migration {version}: {fn.__name__}")
+        fn()
+        db.session.execute(schema_migrations.insert().values(
+            version=version, name=fn.__name__, applied_at=datetime.utcnow()))
+        db.session.commit()
+
+
+##############################################################################
+# Helpers
+
+def _dialect():
+    return db.session.connection().dialect.name
+
+
+def _has_column(table, column):
+    columns = inspect(db.session.connection()).get_columns(table)
+    return any(c['name'] == column for c in columns)
+
+
+def _has_index(table, name):
+    indexes = inspect(db.session.connection()).get_indexes(table)
+    return any(i['name'] == name for i in indexes)
+
+
+def _create_index(table, name, columns):
+    """Create index `name` on `table` unless it exists already.
+
+    Spelled out rather than taken from the models, which describe the
+    latest schema, not the one this migration runs against.
+    """
+
+    if not _has_index(table, name):
+        db.session.execute(text(f"CREATE INDEX {name} ON {table} ({columns})"))
+
+
+##############################################################################
+# Migrations
+
+@migration(1)
+def create_tables():
+    """Create any tables that don't exist yet (the pre-migration baseline)."""
+
+    db.metadata.create_all(db.session.connection())
+
+
+@migration(2)
+def add_user_counters():
+    """Denormalized counters on users (see counters.py)."""
+
+    for name in ('messages_count', 'following_count', 'followers_count', 'likes_count'):
+        if not _has_column('users', name):
+            db.session.execute(text(
+                f"ALTER TABLE users ADD COLUMN {name} INTEGER NOT NULL DEFAULT 0"))
+
+    counters.reconcile()
+
+
+@migration(3)
+def populate_timelines():
+    """Materialize home timelines for messages posted before fan-out on write."""
+
+    if TimelineEntry.query.first() is None:
+        timeline.rebuild_all()
+
+
+@migration(4)
+def add_user_search_indexes():
+    """Full-text / trigram indexes behind /users?q= (see search.py)."""
+
+    statements = {'postgresql': search.POSTGRES_DDL,
+                  'sqlite': search.SQLITE_DDL}.get(_dialect(), [])
+
+    for statement in statements:
+        db.session.execute(text(statement))
+
+
+@migration(5)
+def add_hot_path_indexes():
+    """Indexes for profile messages, reverse follows and likes of a message."""
+
+    # superseded by ix_timeline_entries_user_recent, which also covers the
+    # message_id tie-breaker the feed sorts on
+    if _has_index('timeline_entries', 'ix_timeline_entries_user_timestamp'):
+        db.session.execute(text("DROP INDEX ix_timeline_entries_user_timestamp"))
+
+    _create_index('messages', 'ix_messages_user_timestamp',
+                  'user_id, timestamp DESC, id DESC')
+    _create_index('follows', 'ix_follows_follower_followee',
+                  'follower_id, followee_id')
+    _create_index('likes', 'ix_likes_message_user', 'message_id, user_id')
+    _create_index('timeline_entries', 'ix_timeline_entries_user_recent',
+                  'user_id, timestamp, message_id')
+
+
+@migration(6)
+def add_profile_version():
+    """Profile version stamp for the fragment cache (see fragments.py)."""
+
+    if not _has_column('users', 'profile_version'):
+        db.session.execute(text(
+            "ALTER TABLE users ADD COLUMN profile_version INTEGER NOT NULL DEFAULT 1"))
+
+
+@migration(7)
+def add_activity_version():
+    """Activity version stamp for HTTP caching (see httpcache.py)."""
+
+    if not _has_column('users', 'activity_version'):
+        db.session.execute(text(
+            "ALTER TABLE users ADD COLUMN activity_version INTEGER NOT NULL DEFAULT 1"))
+
+
+@migration(8)
+def add_jobs():
+    """Background job queue and soft-deleted users (see jobs.py, accounts.py)."""
+
+    Job.__table__.create(db.session.connection(), checkfirst=True)
+
+    if not _has_column('users', 'deleted'):
+        false = 'false' if _dialect() == 'postgresql' else '0'
+        db.session.execute(text(
+            f"ALTER TABLE users ADD COLUMN deleted BOOLEAN NOT NULL DEFAULT {false}"))
+
+
+@migration(9)
+def add_message_timestamp_default():
+    """Server-assigned message timestamps and 64-bit message ids (see snowflake.py).
+
+    SQLite can't change a column's default; its INTEGER ids are 64-bit
+    already. Recreate SQLite databases made before this migration.
+    """
+
+    if _dialect() != 'postgresql':
+        return
+
+    db.session.execute(text(
+        "ALTER TABLE messages ALTER COLUMN timestamp "
+        "SET DEFAULT TIMEZONE('utc', CURRENT_TIMESTAMP)"))
+
+    for table, column in (('messages', 'id'),
+                          ('likes', 'message_id'),
+                          ('timeline_entries', 'message_id')):
+        db.session.execute(text(
+            f"ALTER TABLE {table} ALTER COLUMN {column} TYPE BIGINT"))
+
+
+@migration(10)
+def add_message_archive():
+    """Archive table for cold messages, partitioned by month on Postgres (see archive.py)."""
+
+    ArchivedMessage.__table__.create(db.session.connection(), checkfirst=True)
+
+
+@migration(11)
+def add_like_created_at():
+    """When each like was made, and the index behind the likes page."""
+
+    if not _has_column('likes', 'created_at'):
+        if _dialect() == 'postgresql':
+            default = "TIMEZONE('utc', CURRENT_TIMESTAMP)"
+        else:
+            # SQLite only adds columns with constant defaults; recreate
+            # SQLite databases made before this migration to get the real one
+            default = "'1970-01-01 00:00:00'"
+        db.session.execute(text(
+            f"ALTER TABLE likes ADD COLUMN created_at TIMESTAMP NOT NULL DEFAULT {default}"))
+        # older likes weren't timed; they can't be older than their messages
+        db.session.execute(text(
+            "UPDATE likes SET created_at = "
+            "(SELECT timestamp FROM messages WHERE messages.id = likes.message_id)"))
+
+    _create_index('likes', 'ix_likes_user_created',
+                  'user_id, created_at, message_id')
+
+
+@migration(12)
+def add_like_archive():
+    """Likes of archived messages, kept alongside them (see archive.py)."""
+
+    ArchivedLike.__table__.create(db.session.connection(), checkfirst=True)
@@ -2,15 +2,49 @@
 
 from datetime import datetime
 
-from flask_bcrypt import Bcrypt
-from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.expression import FunctionElement
 
-bcrypt = Bcrypt()
-db = SQLAlchemy()
+from database import RoutingSQLAlchemy
+import passwords
+
+db = RoutingSQLAlchemy()
+
+# message ids are 64-bit so they can be time-ordered (see snowflake.py);
+# SQLite's INTEGER primary keys already are
+MessageId = db.BigInteger().with_variant(db.Integer(), 'sqlite')
+
+
+class utcnow(FunctionElement):
+    """The current UTC time, as the database sees it (for server defaults)."""
+
+    type = db.DateTime()
+
+
+@compiles(utcnow)
+def _utcnow(element, compiler, **kw):
+    return "CURRENT_TIMESTAMP"
+
+
+@compiles(utcnow, 'sqlite')
+def _utcnow_sqlite(element, compiler, **kw):
+    # SQLite compares datetimes as text, so these must be in the format
+    # SQLAlchemy binds (cursors included): CURRENT_TIMESTAMP drops the
+    # fraction, and %f only has milliseconds
+    return "(strftime('%Y-%m-%d %H:%M:%f', 'now') || '000')"
+
+
+@compiles(utcnow, 'postgresql')
+def _utcnow_postgresql(element, compiler, **kw):
+    return "TIMEZONE('utc', CURRENT_TIMESTAMP)"
 
 
 class FollowersFollowee(db.Model):
-    """Connection of a follower <-> followee."""
+    """Connection of a follower <-> followee.
+
+    Note the column naming: `followee_id` holds the user doing the following
+    and `follower_id` holds the user being followed (see `User.followers`).
+    """
 
     __tablename__ = 'follows'
 
@@ -26,6 +60,12 @@ class FollowersFollowee(db.Model):
         primary_key=True,
     )
 
+    # the primary key leads with followee_id; this serves lookups of the
+    # other direction ("who follows user X?") and cascades from users
+    __table_args__ = (
+        db.Index('ix_follows_follower_followee', 'follower_id', 'followee_id'),
+    )
+
 
 class User(db.Model):
     """User in the system."""
@@ -72,6 +112,65 @@ class User(db.Model):
         nullable=False,
     )
 
+    ############ USER COUNTERS ###################
+    # denormalized so profile cards don't load whole collections to count
+    # them; kept up to date by the write paths in app.py via counters.py
+    messages_count = db.Column(
+        db.Integer,
+        nullable=False,
+        default=0,
+        server_default='0',
+    )
+
+    following_count = db.Column(
+        db.Integer,
+        nullable=False,
+        default=0,
+        server_default='0',
+    )
+
+    followers_count = db.Column(
+        db.Integer,
+        nullable=False,
+        default=0,
+        server_default='0',
+    )
+
+    likes_count = db.Column(
+        db.Integer,
+        nullable=False,
+        default=0,
+        server_default='0',
+    )
+
+    # bumped whenever anything shown about the user (name, images, bio,
+    # location) changes, so cached renderings of it can tell they're stale
+    profile_version = db.Column(
+        db.Integer,
+        nullable=False,
+        default=1,
+        server_default='1',
+    )
+
+    # bumped along with the counters whenever the user posts, follows,
+    # likes, or is followed (see counters.py), so it changes whenever their
+    # profile page or what they'd see on others' pages does
+    activity_version = db.Column(
+        db.Integer,
+        nullable=False,
+        default=1,
+        server_default='1',
+    )
+
+    # set when the account is deleted; its rows are purged by a background
+    # job (see accounts.py), until then it can't log in
+    deleted = db.Column(
+        db.Boolean,
+        nullable=False,
+        default=False,
+        server_default=db.false(),
+    )
+
     ############ USER RELATIONSHIPS ###################
     #  relationship between messages and users throug 
     messages = db.relationship('Message', backref='user')
@@ -98,21 +197,65 @@ class User(db.Model):
     def is_followed_by(self, other_user):
         """Is this user followed by `other_user`?"""
 
-        found_user_list = [user for user in self.followers if user == other_user]
-        return len(found_user_list) == 1
+        return db.session.query(
+            FollowersFollowee
+            .query
+            .filter(FollowersFollowee.follower_id == self.id,
+                    FollowersFollowee.followee_id == other_user.id)
+            .exists()
+        ).scalar()
 
     def is_following(self, other_user):
         """Is this user following `other_use`?"""
 
-        found_user_list = [user for user in self.following if user == other_user]
-        return len(found_user_list) == 1
-    
+        return db.session.query(
+            FollowersFollowee
+            .query
+            .filter(FollowersFollowee.followee_id == self.id,
+                    FollowersFollowee.follower_id == other_user.id)
+            .exists()
+        ).scalar()
+
     def is_liking(self, a_message):
         """Does this user like the message"""
-        
-        found_user_likes = [msg for msg in self.liked_messages if msg == a_message]
-        return len(found_user_likes) == 1     
 
+        return db.session.query(
+            Like
+            .query
+            .filter(Like.user_id == self.id,
+                    Like.message_id == a_message.id)
+            .exists()
+        ).scalar()
+
+    def following_ids_among(self, user_ids):
+        """Which of `user_ids` is this user following? (one query, as a set)"""
+
+        user_ids = list(user_ids)
+        if not user_ids:
+            return set()
+
+        rows = (db.session
+                .query(FollowersFollowee.follower_id)
+                .filter(FollowersFollowee.followee_id == self.id,
+                        FollowersFollowee.follower_id.in_(user_ids))
+                .all())
+
+        return {user_id for (user_id,) in rows}
+
+    def liked_ids_among(self, message_ids):
+        """Which of `message_ids` does this user like? (one query, as a set)"""
+
+        message_ids = list(message_ids)
+        if not message_ids:
+            return set()
+
+        rows = (db.session
+                .query(Like.message_id)
+                .filter(Like.user_id == self.id,
+                        Like.message_id.in_(message_ids))
+                .all())
+
+        return {message_id for (message_id,) in rows}
 
 
     ############ USER Class Methoods ###################
@@ -122,7 +265,7 @@ class User(db.Model):
         Hashes password and adds user to system.
         """
 
-        hashed_pwd = bcrypt.generate_password_hash(password).decode('UTF-8')
+        hashed_pwd = passwords.hash_password(password)
 
         user = User(
             username=username,
@@ -143,13 +286,18 @@ class User(db.Model):
         and, if it finds such a user, returns that user object.
 
         If can't find matching user (or if password is wrong), returns False.
+
+        If the stored hash was made with an outdated bcrypt cost, it is
+        replaced with a fresh one (the caller commits).
         """
 
-        user = cls.query.filter_by(username=username).first()
+        user = cls.query.filter_by(username=username, deleted=False).first()
 
         if user:
-            is_auth = bcrypt.check_password_hash(user.password, password)
+            is_auth = passwords.check_password(user.password, password)
             if is_auth:
+                if passwords.needs_rehash(user.password):
+                    user.password = passwords.hash_password(password)
                 return user
 
         return False
@@ -162,8 +310,14 @@ class Message(db.Model):
 
     __tablename__ = 'messages'
 
+    # fetch the server-assigned timestamp right after the INSERT
+    __mapper_args__ = {'eager_defaults': True}
+
+    # see ArchivedMessage
+    archived = False
+
     id = db.Column(
-        db.Integer,
+        MessageId,
         primary_key=True,
     )
 
@@ -172,10 +326,52 @@ class Message(db.Model):
         nullable=False,
     )
 
+    # assigned by the database when the message is inserted
     timestamp = db.Column(
         db.DateTime,
         nullable=False,
-        default=datetime.utcnow(),
+        server_default=utcnow(),
+    )
+
+    user_id = db.Column(
+        db.Integer,
+        db.ForeignKey('users.id', ondelete='CASCADE'),
+        nullable=False,
+    )
+
+    # a user's messages newest first: profile pages, backfill, cascades
+    __table_args__ = (
+        db.Index('ix_messages_user_timestamp',
+                 user_id, timestamp.desc(), id.desc()),
+    )
+
+
+class ArchivedMessage(db.Model):
+    """A message moved out of `messages` once it went cold (see archive.py).
+
+    On Postgres the archive is partitioned by month of `timestamp`, which is
+    why that's part of the primary key.
+    """
+
+    __tablename__ = 'message_archive'
+
+    # archived messages can't be liked any more
+    archived = True
+
+    id = db.Column(
+        MessageId,
+        primary_key=True,
+        autoincrement=False,
+    )
+
+    text = db.Column(
+        db.String(140),
+        nullable=False,
+    )
+
+    timestamp = db.Column(
+        db.DateTime,
+        primary_key=True,
     )
 
     user_id = db.Column(
@@ -184,6 +380,13 @@ class Message(db.Model):
         nullable=False,
     )
 
+    user = db.relationship('User')
+
+    __table_args__ = (
+        db.Index('ix_message_archive_user', 'user_id'),
+        {'postgresql_partition_by': 'RANGE (timestamp)'},
+    )
+
 
 ##############################
 class Like(db.Model):
@@ -198,12 +401,142 @@ class Like(db.Model):
     )
 
     message_id = db.Column(
+        MessageId,
+        db.ForeignKey('messages.id', ondelete='CASCADE'),
+        primary_key=True,
+    )
+
+    # when the like was made, assigned by the database
+    created_at = db.Column(
+        db.DateTime,
+        nullable=False,
+        server_default=utcnow(),
+    )
+
+    __table_args__ = (
+        # likes of a message: cascades from messages and counter fix-ups
+        db.Index('ix_likes_message_user', 'message_id', 'user_id'),
+        # a user's likes, most recent first: their likes page
+        db.Index('ix_likes_user_created', 'user_id', 'created_at', 'message_id'),
+    )
+
+
+class ArchivedLike(db.Model):
+    """A like of an archived message, moved along with it (see archive.py).
+
+    There's no foreign key to `message_archive`, whose primary key includes
+    the timestamp; deleting an archived message deletes these by hand.
+    """
+
+    __tablename__ = 'like_archive'
+
+    user_id = db.Column(
         db.Integer,
+        db.ForeignKey('users.id', ondelete='CASCADE'),
+        primary_key=True,
+    )
+
+    message_id = db.Column(
+        MessageId,
+        primary_key=True,
+        autoincrement=False,
+    )
+
+    created_at = db.Column(
+        db.DateTime,
+        nullable=False,
+    )
+
+    __table_args__ = (
+        db.Index('ix_like_archive_message', 'message_id'),
+    )
+
+
+
+##############################
+class TimelineEntry(db.Model):
+    """A message materialized into a user's home timeline (fan-out on write)."""
+
+    __tablename__ = 'timeline_entries'
+
+    user_id = db.Column(
+        db.Integer,
+        db.ForeignKey('users.id', ondelete='CASCADE'),
+        primary_key=True,
+    )
+
+    message_id = db.Column(
+        MessageId,
         db.ForeignKey('messages.id', ondelete='CASCADE'),
         primary_key=True,
-    ) 
+    )
+
+    # copied from the message so the home feed is a range read on one index
+    timestamp = db.Column(
+        db.DateTime,
+        nullable=False,
+    )
+
+    __table_args__ = (
+        db.Index('ix_timeline_entries_user_recent',
+                 'user_id', 'timestamp', 'message_id'),
+    )
+
+
+class Job(db.Model):
+    """Deferred work for the background workers (see jobs.py)."""
+
+    __tablename__ = 'jobs'
+
+    id = db.Column(
+        db.Integer,
+        primary_key=True,
+    )
+
+    name = db.Column(
+        db.Text,
+        nullable=False,
+    )
+
+    # the handler's keyword arguments, as JSON
+    payload = db.Column(
+        db.Text,
+        nullable=False,
+    )
 
+    # pending, running or failed; finished jobs are deleted
+    status = db.Column(
+        db.Text,
+        nullable=False,
+        default='pending',
+        server_default='pending',
+    )
 
+    attempts = db.Column(
+        db.Integer,
+        nullable=False,
+        default=0,
+        server_default='0',
+    )
+
+    run_at = db.Column(
+        db.DateTime,
+        nullable=False,
+        default=datetime.utcnow,
+    )
+
+    locked_at = db.Column(
+        db.DateTime,
+    )
+
+    last_error = db.Column(
+        db.Text,
+    )
+
+    # workers look for the oldest due pending jobs
+    __table_args__ = (
+        db.Index('ix_jobs_status_run_at', 'status', 'run_at'),
+    )
 
 
 def connect_db(app):
@@ -0,0 +1,118 @@
+"""Keyset (cursor) pagination for Warbler's message lists.
+
+Pages are seeked on a `(timestamp, id)` pair rather than with OFFSET, so
+fetching page 500 costs the same as fetching page 1. Cursors handed to
+clients are opaque url-safe tokens; don't rely on their contents.
+"""
+
+import base64
+from collections import namedtuple
+from datetime import datetime
+
+from flask import abort, current_app, request, url_for
+from sqlalchemy import and_, or_
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 200
+
+CURSOR_ARG = 'before'
+TIMESTAMP_FORMAT = '%Y-%m-%dT%H:%M:%S.%f'
+
+Page = namedtuple('Page', ['items', 'next_cursor'])
+
+
+def encode_cursor(timestamp, id):
+    """Turn the sort key of the last item on a page into a cursor token."""
+
+    raw = f"{timestamp.strftime(TIMESTAMP_FORMAT)}|{id}".encode('UTF-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(token):
+    """Turn a cursor token back into a `(timestamp, id)` pair.
+
+    Raises ValueError if the token wasn't made by `encode_cursor`.
+    """
+
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        raw = base64.urlsafe_b64decode(padded.encode('ascii')).decode('UTF-8')
+        timestamp, id = raw.split('|')
+        return datetime.strptime(timestamp, TIMESTAMP_FORMAT), int(id)
+    except (UnicodeError, TypeError, ValueError) as e:
+        raise ValueError(f"Invalid cursor: {token!r}") from e
+
+
+def cursor_from_request():
+    """The cursor passed in the querystring, or None for the first page."""
+
+    token = request.args.get(CURSOR_ARG)
+    if not token:
+        return None
+
+    try:
+        return decode_cursor(token)
+    except ValueError:
+        abort(400)
+
+
+def page_size_from_request():
+    """Requested page size (`?limit=`), clamped to the configured bounds."""
+
+    default = current_app.config.get('FEED_PAGE_SIZE', DEFAULT_PAGE_SIZE)
+    maximum = current_app.config.get('FEED_MAX_PAGE_SIZE', MAX_PAGE_SIZE)
+
+    size = request.args.get('limit', default, type=int)
+    return max(1, min(size, maximum))
+
+
+def older_than(timestamp_col, id_col, cursor):
+    """Filter clause selecting rows that sort after `cursor`, newest first."""
+
+    timestamp, id = cursor
+    return or_(timestamp_col < timestamp,
+               and_(timestamp_col == timestamp, id_col < id))
+
+
+def paginate(query, timestamp_col, id_col, cursor, per_page, key=None):
+    """Fetch one page of `query`, newest first, starting after `cursor`.
+
+    `key` maps a result row to its `(timestamp, id)` sort key; by default
+    rows are assumed to be messages.
+    """
+
+    rows = newest_first(query, timestamp_col, id_col, cursor, per_page + 1)
+    return page_of(rows, per_page, key)
+
+
+def newest_first(query, timestamp_col, id_col, cursor, limit):
+    """Up to `limit` rows of `query`, newest first, starting after `cursor`."""
+
+    if cursor is not None:
+        query = query.filter(older_than(timestamp_col, id_col, cursor))
+
+    return (query
+            .order_by(timestamp_col.desc(), id_col.desc())
+            .limit(limit)
+            .all())
+
+
+def page_of(rows, per_page, key=None):
+    """Build a Page from up to `per_page + 1` rows sorted newest first."""
+
+    key = key or (lambda msg: (msg.timestamp, msg.id))
+
+    if len(rows) <= per_page:
+        return Page(rows, None)
+
+    items = rows[:per_page]
+    return Page(items, encode_cursor(*key(items[-1])))
+
+
+def next_page_url(cursor):
+    """URL of the current view's next page (keeps other querystring args)."""
+
+    # one dict: a querystring arg named like a view arg (?user_id=)
+    # mustn't be passed twice
+    args = {**request.args.to_dict(), **request.view_args, CURSOR_ARG: cursor}
+    return url_for(request.endpoint, **args)
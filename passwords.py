@@ -0,0 +1,105 @@
+"""Password hashing on a bounded worker pool.
+
+bcrypt is deliberately slow (~250 ms at cost 12) and holds the calling
+thread for the whole time. Hashes are computed on a small thread pool
+instead: bcrypt releases the GIL while it works, so with threaded workers
+other requests keep being served during a burst of logins, and the pool's
+bounded queue means a burst can't pile up unbounded work. When the queue
+is full, `HasherBusy` is raised so the view can answer 503 straight away.
+
+The cost factor comes from `BCRYPT_LOG_ROUNDS`; hashes made with a
+different cost are upgraded transparently the next time the user logs in
+(see `User.authenticate`).
+"""
+
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+
+from flask import current_app, has_app_context
+from flask_bcrypt import Bcrypt
+
+DEFAULT_LOG_ROUNDS = 12
+DEFAULT_WORKERS = 4
+DEFAULT_QUEUE = 16
+DEFAULT_TIMEOUT = 10
+
+_bcrypt = Bcrypt()
+_pool = None
+_slots = None
+_pool_lock = threading.Lock()
+
+
+class HasherBusy(Exception):
+    """Too many password hashes are already queued; try again shortly."""
+
+
+def _config(name, default):
+    if has_app_context():
+        return current_app.config.get(name, default)
+    return default
+
+
+def log_rounds():
+    """The bcrypt cost factor new hashes should use."""
+
+    return _config('BCRYPT_LOG_ROUNDS', DEFAULT_LOG_ROUNDS)
+
+
+def _run(fn, *args):
+    """Run `fn(*args)` on the hashing pool and wait for its result."""
+
+    global _pool, _slots
+
+    with _pool_lock:
+        if _pool is None:
+            workers = _config('PASSWORD_HASH_WORKERS', DEFAULT_WORKERS)
+            queue = _config('PASSWORD_HASH_QUEUE', DEFAULT_QUEUE)
+            _pool = ThreadPoolExecutor(max_workers=workers,
+                                       thread_name_prefix='password-hash')
+            _slots = threading.BoundedSemaphore(workers + queue)
+
+    slots = _slots
+    if not slots.acquire(blocking=False):
+        raise HasherBusy()
+
+    try:
+        future = _pool.submit(fn, *args)
+    except BaseException:
+        slots.release()
+        raise
+    # the slot is freed when the hash is done, not when we stop waiting,
+    # so hashes still running after a timeout keep counting
+    future.add_done_callback(lambda _: slots.release())
+
+    try:
+        return future.result(timeout=_config('PASSWORD_HASH_TIMEOUT', DEFAULT_TIMEOUT))
+    except TimeoutError:
+        raise HasherBusy()
+
+
+def hash_password(password):
+    """bcrypt hash of `password` at the configured cost, as text."""
+
+    pw_hash = _run(_bcrypt.generate_password_hash, password, log_rounds())
+    return pw_hash.decode('UTF-8')
+
+
+def check_password(pw_hash, password):
+    """Does `password` match `pw_hash`?"""
+
+    return _run(_bcrypt.check_password_hash, pw_hash, password)
+
+
+def cost_of(pw_hash):
+    """The cost factor a bcrypt hash was made with (`$2b$12$...` -> 12)."""
+
+    try:
+        return int(pw_hash.split('$')[2])
+    except (IndexError, ValueError):
+        return None
+
+
+def needs_rehash(pw_hash):
+    """Was `pw_hash` made with a cost other than the configured one?"""
+
+    return cost_of(pw_hash) != log_rounds()
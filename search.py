@@ -0,0 +1,155 @@
+"""User search for `/users?q=` and username autocomplete.
+
+On Postgres, users are matched through a GIN full-text index over username,
+bio and location plus a trigram index on username (which also serves the
+`LIKE '%q%'` substring match), and ranked by text rank and similarity.
+On SQLite (local development and tests) an FTS5 table kept in step by
+triggers stands in. Other databases fall back to an unindexed LIKE.
+"""
+
+from sqlalchemy import DDL, event, func, literal_column, or_, text
+from sqlalchemy.sql import column, table
+
+from models import User
+
+DEFAULT_PAGE_SIZE = 24
+MAX_PAGE = 50
+AUTOCOMPLETE_LIMIT = 10
+
+# the indexed expression; queries must repeat it exactly to use the index
+DOCUMENT = ("to_tsvector('simple', coalesce(username, '') || ' ' || "
+            "coalesce(bio, '') || ' ' || coalesce(location, ''))")
+
+POSTGRES_DDL = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    f"CREATE INDEX IF NOT EXISTS ix_users_search ON users USING gin ({DOCUMENT})",
+    "CREATE INDEX IF NOT EXISTS ix_users_username_trgm "
+    "ON users USING gin (username gin_trgm_ops)",
+]
+
+SQLITE_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS users_fts USING fts5("
+    "username, bio, location, content='users', content_rowid='id')",
+    "CREATE TRIGGER IF NOT EXISTS users_fts_insert AFTER INSERT ON users BEGIN "
+    "INSERT INTO users_fts (rowid, username, bio, location) "
+    "VALUES (new.id, new.username, new.bio, new.location); END",
+    "CREATE TRIGGER IF NOT EXISTS users_fts_delete AFTER DELETE ON users BEGIN "
+    "INSERT INTO users_fts (users_fts, rowid, username, bio, location) "
+    "VALUES ('delete', old.id, old.username, old.bio, old.location); END",
+    "CREATE TRIGGER IF NOT EXISTS users_fts_update "
+    "AFTER UPDATE OF username, bio, location ON users BEGIN "
+    "INSERT INTO users_fts (users_fts, rowid, username, bio, location) "
+    "VALUES ('delete', old.id, old.username, old.bio, old.location); "
+    "INSERT INTO users_fts (rowid, username, bio, location) "
+    "VALUES (new.id, new.username, new.bio, new.location); END",
+    "INSERT INTO users_fts (users_fts) VALUES ('rebuild')",
+]
+
+users_fts = table('users_fts', column('rowid'))
+
+
+for statement in POSTGRES_DDL:
+    event.listen(User.__table__, 'after_create',
+                 DDL(statement).execute_if(dialect='postgresql'))
+
+for statement in SQLITE_DDL:
+    event.listen(User.__table__, 'after_create',
+                 DDL(statement).execute_if(dialect='sqlite'))
+
+event.listen(User.__table__, 'before_drop',
+             DDL("DROP TABLE IF EXISTS users_fts").execute_if(dialect='sqlite'))
+
+
+def _dialect():
+    return User.query.session.get_bind().dialect.name
+
+
+def _like_pattern(term, prefix_only=False):
+    """LIKE pattern matching `term` literally (escaping % and _)."""
+
+    escaped = (term.replace('\\', '\\\\')
+                   .replace('%', '\\%')
+                   .replace('_', '\\_'))
+    return f"{escaped}%" if prefix_only else f"%{escaped}%"
+
+
+def _fts_query(term, column_name=None):
+    """FTS5 query matching every word of `term`, the last one as a prefix."""
+
+    words = [w.replace('"', '""') for w in term.split()]
+    query = ' '.join(f'"{w}"' for w in words) + '*'
+    return f"{column_name}: ({query})" if column_name else query
+
+
+def _matching(term):
+    """Query of users matching `term`, best matches first."""
+
+    dialect = _dialect()
+
+    if dialect == 'postgresql':
+        tsquery = func.plainto_tsquery('simple', term)
+        document = literal_column(DOCUMENT)
+        rank = (func.ts_rank(document, tsquery)
+                + func.similarity(User.username, term))
+
+        return (User
+                .query
+                .filter(or_(document.op('@@')(tsquery),
+                            User.username.ilike(_like_pattern(term), escape='\\')))
+                .order_by(rank.desc(), User.id))
+
+    if dialect == 'sqlite':
+        return (User
+                .query
+                .join(users_fts, users_fts.c.rowid == User.id)
+                .filter(text("users_fts MATCH :fts_query"))
+                .params(fts_query=_fts_query(term))
+                .order_by(text("bm25(users_fts)"), User.id))
+
+    return (User
+            .query
+            .filter(User.username.like(_like_pattern(term), escape='\\'))
+            .order_by(User.id))
+
+
+def search(term, page=1, per_page=DEFAULT_PAGE_SIZE):
+    """Page `page` of users matching `term`, as `(users, has_next_page)`."""
+
+    page = max(1, min(page, MAX_PAGE))
+
+    users = (_matching(term)
+             .offset((page - 1) * per_page)
+             .limit(per_page + 1)
+             .all())
+
+    return users[:per_page], len(users) > per_page and page < MAX_PAGE
+
+
+def browse(after_id=None, per_page=DEFAULT_PAGE_SIZE):
+    """Users in id order after `after_id`, as `(users, next_after_id)`."""
+
+    query = User.query
+    if after_id is not None:
+        query = query.filter(User.id > after_id)
+
+    users = query.order_by(User.id).limit(per_page + 1).all()
+
+    if len(users) <= per_page:
+        return users, None
+    return users[:per_page], users[per_page - 1].id
+
+
+def autocomplete(prefix, limit=AUTOCOMPLETE_LIMIT):
+    """Up to `limit` users whose username starts with `prefix`."""
+
+    if _dialect() == 'sqlite':
+        query = (User
+                 .query
+                 .join(users_fts, users_fts.c.rowid == User.id)
+                 .filter(text("users_fts MATCH :fts_query"))
+                 .params(fts_query=_fts_query(prefix, 'username')))
+    else:
+        query = User.query.filter(
+            User.username.ilike(_like_pattern(prefix, prefix_only=True), escape='\\'))
+
+    return query.order_by(func.length(User.username), User.username).limit(limit).all()
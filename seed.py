@@ -1,20 +1,12 @@
-"""Seed database with sample data from CSV Files."""
+"""Seed database with sample data from CSV Files.
 
-from csv import DictReader
-from app import db
-from models import User, Message, FollowersFollowee
+This drops and recreates every table, then streams the CSVs in through
+loader.py (use that directly to tune batch sizes or resume large loads).
+"""
 
+from app import app
+import loader
 
-db.drop_all()
-db.create_all()
 
-with open('generator/users.csv') as users:
-    db.session.bulk_insert_mappings(User, DictReader(users))
-
-with open('generator/messages.csv') as messages:
-    db.session.bulk_insert_mappings(Message, DictReader(messages))
-
-with open('generator/follows.csv') as follows:
-    db.session.bulk_insert_mappings(FollowersFollowee, DictReader(follows))
-
-db.session.commit()
+with app.app_context():
+    loader.load(reset=True)
@@ -0,0 +1,112 @@
+"""Time-ordered 64-bit message ids ("snowflakes").
+
+With MESSAGE_ID_SCHEME = 'snowflake', new messages get ids made of
+
+    41 bits   milliseconds since EPOCH
+    10 bits   worker id (SNOWFLAKE_WORKER_ID)
+    12 bits   sequence within the millisecond
+
+instead of the next value of a database sequence. They sort in the order
+the messages were posted, whichever process posted them, and
+`timestamp_of` recovers when. Every process must have its own worker id;
+if SNOWFLAKE_WORKER_ID isn't set it is derived from the process id, which
+is only good enough for a handful of processes on one host.
+
+Ids are bigger than JavaScript's safe integers, so browser code should
+treat them as opaque.
+"""
+
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import event
+
+from models import db, Message
+
+EPOCH = datetime(2019, 1, 1)
+WORKER_BITS = 10
+SEQUENCE_BITS = 12
+MAX_WORKER_ID = (1 << WORKER_BITS) - 1
+MAX_SEQUENCE = (1 << SEQUENCE_BITS) - 1
+
+_EPOCH_MS = int((EPOCH - datetime(1970, 1, 1)).total_seconds() * 1000)
+
+
+class IdGenerator:
+    """Makes increasing, unique ids for one worker id. Thread-safe."""
+
+    def __init__(self, worker_id):
+        if not 0 <= worker_id <= MAX_WORKER_ID:
+            raise ValueError(f"worker id must be 0-{MAX_WORKER_ID}, not {worker_id}")
+
+        self.worker_id = worker_id
+        self._lock = threading.Lock()
+        self._last_ms = -1
+        self._sequence = 0
+
+    def next_id(self):
+        with self._lock:
+            now = _now_ms()
+
+            # if the clock went back, keep counting from where it was
+            if now <= self._last_ms:
+                now = self._last_ms
+                self._sequence = (self._sequence + 1) & MAX_SEQUENCE
+                if self._sequence == 0:
+                    # used up this millisecond: borrow the next one
+                    now += 1
+            else:
+                self._sequence = 0
+
+            self._last_ms = now
+            return (((now - _EPOCH_MS) << (WORKER_BITS + SEQUENCE_BITS))
+                    | (self.worker_id << SEQUENCE_BITS)
+                    | self._sequence)
+
+
+def _now_ms():
+    return int(time.time() * 1000)
+
+
+def timestamp_of(id):
+    """When the message with snowflake id `id` was posted (UTC)."""
+
+    return EPOCH + timedelta(milliseconds=id >> (WORKER_BITS + SEQUENCE_BITS))
+
+
+def generator(app):
+    """This process's generator, for `app`'s worker id."""
+
+    ids = app.extensions.get('snowflake')
+
+    if ids is None:
+        worker_id = app.config.get('SNOWFLAKE_WORKER_ID')
+        if worker_id is None:
+            worker_id = os.getpid() & MAX_WORKER_ID
+        ids = app.extensions['snowflake'] = IdGenerator(worker_id)
+
+    return ids
+
+
+def init_app(app):
+    """Have new messages get snowflake ids when `app` is configured for them.
+
+    The scheme is checked per insert, so it can be switched in config.
+    """
+
+    if not event.contains(Message, 'before_insert', assign_id):
+        event.listen(Message, 'before_insert', assign_id)
+
+    if app.config.get('MESSAGE_ID_SCHEME') == 'snowflake':
+        # a bad SNOWFLAKE_WORKER_ID fails at startup, not on the first post
+        generator(app)
+
+
+def assign_id(mapper, connection, msg):
+    """Give new messages a snowflake id, if that's the configured scheme."""
+
+    app = db.get_app()
+    if msg.id is None and app.config.get('MESSAGE_ID_SCHEME') == 'snowflake':
+        msg.id = generator(app).next_id()
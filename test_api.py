@@ -0,0 +1,125 @@
+"""JSON API tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_api.py
+
+
+import os
+from unittest import TestCase
+
+from models import db, User, Message, FollowersFollowee, Like, TimelineEntry
+
+os.environ['DATABASE_URL'] = "postgresql:///warbler-test"
+
+from app import app, CURR_USER_KEY
+
+db.create_all()
+
+app.config['WTF_CSRF_ENABLED'] = False
+app.config['USER_CACHE_SIZE'] = 0
+
+WRITE = {'X-Requested-With': 'XMLHttpRequest'}
+
+
+class APITestCase(TestCase):
+    """Test the /api/v1 endpoints."""
+
+    def setUp(self):
+        TimelineEntry.query.delete()
+        Like.query.delete()
+        FollowersFollowee.query.delete()
+        Message.query.delete()
+        User.query.delete()
+
+        author = User.signup(username="author", email="author@test.com",
+                             password="password", image_url=None)
+        reader = User.signup(username="reader", email="reader@test.com",
+                             password="password", image_url=None)
+        db.session.commit()
+        msgs = [Message(text=f"message {i}", user_id=author.id) for i in range(3)]
+        db.session.add_all(msgs)
+        db.session.commit()
+
+        self.author_id = author.id
+        self.reader_id = reader.id
+        self.msg_ids = [msg.id for msg in msgs]
+
+        self.client = app.test_client()
+        with self.client.session_transaction() as sess:
+            sess[CURR_USER_KEY] = self.reader_id
+
+    def test_login_required(self):
+        """Do anonymous requests get a JSON 401?"""
+
+        resp = app.test_client().get("/api/v1/timeline")
+
+        self.assertEqual(resp.status_code, 401)
+        self.assertEqual(resp.json['status'], 401)
+
+    def test_follow_and_timeline(self):
+        """Does following through the API fill the timeline?"""
+
+        resp = self.client.put(f"/api/v1/users/{self.author_id}/follow", headers=WRITE)
+        self.assertEqual(resp.json, {'user_id': self.author_id,
+                                     'following': True, 'changed': True})
+
+        # following again changes nothing
+        resp = self.client.put(f"/api/v1/users/{self.author_id}/follow", headers=WRITE)
+        self.assertFalse(resp.json['changed'])
+
+        resp = self.client.get("/api/v1/timeline")
+        self.assertEqual(sorted(m['id'] for m in resp.json['messages']), self.msg_ids)
+        # each author is listed once
+        self.assertEqual(list(resp.json['users']), [str(self.author_id)])
+
+        resp = self.client.get(f"/api/v1/users/{self.author_id}")
+        self.assertTrue(resp.json['following'])
+        self.assertEqual(resp.json['followers_count'], 1)
+
+        resp = self.client.delete(f"/api/v1/users/{self.author_id}/follow", headers=WRITE)
+        self.assertFalse(resp.json['following'])
+        self.assertEqual(self.client.get("/api/v1/timeline").json['messages'], [])
+
+    def test_like_and_batch_state(self):
+        """Are likes reported back for a whole batch of ids in one call?"""
+
+        liked_id, other_id, _ = self.msg_ids
+
+        resp = self.client.put(f"/api/v1/messages/{liked_id}/like", headers=WRITE)
+        self.assertTrue(resp.json['changed'])
+        self.assertEqual(User.query.get(self.reader_id).likes_count, 1)
+
+        resp = self.client.get(f"/api/v1/likes?ids={liked_id},{other_id}")
+        self.assertEqual(resp.json, {'liked': [liked_id]})
+
+        resp = self.client.get(f"/api/v1/messages/{liked_id}")
+        self.assertEqual(resp.json['liked'], [liked_id])
+
+        resp = self.client.delete(f"/api/v1/messages/{liked_id}/like", headers=WRITE)
+        self.assertTrue(resp.json['changed'])
+        self.assertEqual(User.query.get(self.reader_id).likes_count, 0)
+
+    def test_batch_following(self):
+        """Is follow state reported for a batch of ids?"""
+
+        self.client.put(f"/api/v1/users/{self.author_id}/follow", headers=WRITE)
+
+        resp = self.client.get(f"/api/v1/following?ids={self.author_id},{self.reader_id}")
+
+        self.assertEqual(resp.json, {'following': [self.author_id]})
+
+    def test_writes_need_header(self):
+        """Are writes without X-Requested-With refused?"""
+
+        resp = self.client.put(f"/api/v1/messages/{self.msg_ids[0]}/like")
+
+        self.assertEqual(resp.status_code, 403)
+        self.assertEqual(Like.query.count(), 0)
+
+    def test_bad_input(self):
+        """Are bad ids and missing rows JSON errors?"""
+
+        self.assertEqual(self.client.get("/api/v1/likes?ids=1,x").status_code, 400)
+        self.assertEqual(self.client.get("/api/v1/messages/0").status_code, 404)
+        self.assertEqual(self.client.get("/api/v1/messages/0").json['error'], "Not Found")
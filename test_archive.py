@@ -0,0 +1,148 @@
+"""Message archive tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_archive.py
+
+
+import os
+from datetime import datetime, timedelta
+from unittest import TestCase
+
+from models import (db, User, Message, ArchivedLike, ArchivedMessage,
+                    FollowersFollowee, Like, TimelineEntry)
+
+os.environ['DATABASE_URL'] = "postgresql:///warbler-test"
+
+from app import app, CURR_USER_KEY
+import archive
+import counters
+
+db.create_all()
+
+app.config['WTF_CSRF_ENABLED'] = False
+app.config['USER_CACHE_SIZE'] = 0
+
+
+class ArchiveTestCase(TestCase):
+    """Test moving cold messages to the archive and reading them back."""
+
+    def setUp(self):
+        ArchivedLike.query.delete()
+        ArchivedMessage.query.delete()
+        TimelineEntry.query.delete()
+        Like.query.delete()
+        FollowersFollowee.query.delete()
+        Message.query.delete()
+        User.query.delete()
+
+        author = User.signup(username="author", email="author@test.com",
+                             password="password", image_url=None)
+        fan = User.signup(username="fan", email="fan@test.com",
+                          password="password", image_url=None)
+        db.session.commit()
+
+        now = datetime.utcnow()
+        self.old = Message(text="old news", user_id=author.id,
+                           timestamp=now - timedelta(days=400))
+        self.new = Message(text="fresh", user_id=author.id,
+                           timestamp=now - timedelta(days=1))
+        db.session.add_all([self.old, self.new])
+        db.session.commit()
+
+        db.session.add_all([Like(user_id=fan.id, message_id=self.old.id),
+                            Like(user_id=fan.id, message_id=self.new.id)])
+        db.session.add(TimelineEntry(user_id=author.id, message_id=self.old.id,
+                                     timestamp=self.old.timestamp))
+        db.session.commit()
+        counters.reconcile()
+        db.session.commit()
+
+        self.author_id = author.id
+        self.fan_id = fan.id
+        self.old_id = self.old.id
+        self.new_id = self.new.id
+
+        self.client = app.test_client()
+
+    def tearDown(self):
+        db.session.rollback()
+
+    def archive(self):
+        with app.app_context():
+            return archive.archive_cold_messages()
+
+    def test_moves_only_cold_messages(self):
+        """Are old messages moved, with their likes and timeline entries?"""
+
+        version = User.query.get(self.author_id).activity_version
+        self.assertEqual(self.archive(), 1)
+
+        self.assertEqual([m.id for m in Message.query], [self.new_id])
+        self.assertEqual([m.id for m in ArchivedMessage.query], [self.old_id])
+        self.assertEqual(TimelineEntry.query.count(), 0)
+        self.assertEqual([l.message_id for l in Like.query], [self.new_id])
+        self.assertEqual([(l.user_id, l.message_id) for l in ArchivedLike.query],
+                         [(self.fan_id, self.old_id)])
+
+        fan = User.query.get(self.fan_id)
+        author = User.query.get(self.author_id)
+        self.assertEqual(fan.likes_count, 1)
+        self.assertEqual(author.messages_count, 2)
+        self.assertGreater(author.activity_version, version)
+
+        # counting again gives the same numbers
+        counters.reconcile()
+        db.session.commit()
+        self.assertEqual((author.messages_count, fan.likes_count), (2, 1))
+
+        # nothing left to move
+        self.assertEqual(self.archive(), 0)
+
+    def test_archived_message_page(self):
+        """Can an archived message still be shown, and deleted by its author?"""
+
+        self.archive()
+
+        resp = self.client.get(f"/messages/{self.old_id}")
+        self.assertEqual(resp.status_code, 200)
+        self.assertIn(b"old news", resp.data)
+
+        self.assertEqual(self.client.get("/messages/0").status_code, 404)
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.author_id
+            c.post(f"/messages/{self.old_id}/delete")
+
+        self.assertEqual(ArchivedMessage.query.count(), 0)
+        self.assertEqual(ArchivedLike.query.count(), 0)
+        self.assertEqual(User.query.get(self.author_id).messages_count, 1)
+
+    def test_profile_pages_into_archive(self):
+        """Do a profile's pages, and the API, carry on into the archive?"""
+
+        self.archive()
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.fan_id
+
+            first = c.get(f"/users/{self.author_id}?limit=1")
+            self.assertIn(b"fresh", first.data)
+            self.assertNotIn(b"old news", first.data)
+            self.assertIn(b'id="older-messages"', first.data)
+
+            resp = c.get(f"/api/v1/users/{self.author_id}/messages?limit=1")
+            resp = c.get(f"/api/v1/users/{self.author_id}/messages"
+                         f"?limit=1&before={resp.json['next']}")
+            self.assertEqual([m['id'] for m in resp.json['messages']], [self.old_id])
+            self.assertNotIn('next', resp.json)
+
+            resp = c.get(f"/api/v1/messages/{self.old_id}")
+            self.assertEqual(resp.json['messages'][0]['text'], "old news")
+
+            # read-only: no like button on the archived message
+            page = c.get(f"/users/{self.author_id}").data
+            self.assertIn(b"old news", page)
+            self.assertEqual(page.count(b'name="message_id"'), 1)
@@ -0,0 +1,171 @@
+"""Cache and logged-in user cache tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_cache.py
+
+
+import os
+from unittest import TestCase
+from unittest.mock import patch
+
+from flask import g
+
+from models import db, User
+
+os.environ['DATABASE_URL'] = "postgresql:///warbler-test"
+
+from app import app, CURR_USER_KEY
+from cache import LRUCache
+import usercache
+
+db.create_all()
+
+
+class LRUCacheTestCase(TestCase):
+    """Test the in-process LRU cache."""
+
+    def test_evicts_least_recently_used(self):
+        """Does the oldest untouched entry go first?"""
+
+        cache = LRUCache(maxsize=2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+
+        self.assertEqual(cache.get('a'), 1)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('c'), 3)
+
+    def test_ttl(self):
+        """Do entries expire?"""
+
+        cache = LRUCache(maxsize=2, ttl=10)
+
+        with patch('cache.time.monotonic', return_value=100):
+            cache.set('a', 1)
+        with patch('cache.time.monotonic', return_value=105):
+            self.assertEqual(cache.get('a'), 1)
+        with patch('cache.time.monotonic', return_value=111):
+            self.assertIsNone(cache.get('a'))
+
+    def test_byte_bound(self):
+        """Are entries evicted to stay under `maxbytes`?"""
+
+        cache = LRUCache(maxsize=10, maxbytes=10, sizeof=len)
+        cache.set('a', "xxxx")
+        cache.set('b', "xxxx")
+        cache.set('c', "xxxx")
+        cache.set('huge', "x" * 11)
+
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(cache.get('b'), "xxxx")
+        self.assertIsNone(cache.get('huge'))
+        self.assertEqual(cache.nbytes, 8)
+
+    def test_disabled(self):
+        """Does a size of 0 cache nothing?"""
+
+        cache = LRUCache(maxsize=0)
+        cache.set('a', 1)
+        self.assertIsNone(cache.get('a'))
+
+
+class UserCacheTestCase(TestCase):
+    """Test snapshots of the logged-in user."""
+
+    def setUp(self):
+        """Create a user and give the app a fresh cache."""
+
+        User.query.delete()
+
+        user = User.signup(username="cached",
+                           email="cached@test.com",
+                           password="password",
+                           image_url=None)
+        db.session.commit()
+        self.user_id = user.id
+
+        self.ctx = app.app_context()
+        self.ctx.push()
+        self.saved_backend = app.extensions.pop('user_cache', None)
+        app.extensions['user_cache'] = LRUCache(maxsize=10)
+
+    def tearDown(self):
+        app.extensions['user_cache'] = self.saved_backend
+        self.ctx.pop()
+
+    def test_snapshot_does_not_load_user(self):
+        """Is a cached user served without loading the User row?"""
+
+        usercache.load(self.user_id)
+
+        with patch.object(User, 'query') as query:
+            query.get.return_value.deleted = False
+            snapshot = usercache.load(self.user_id)
+            self.assertEqual(snapshot.username, "cached")
+            query.get.assert_not_called()
+
+            # anything beyond the hot fields loads the real user
+            snapshot.email
+            query.get.assert_called_once_with(self.user_id)
+
+    def test_invalidate(self):
+        """Does invalidating pick up profile changes?"""
+
+        usercache.load(self.user_id)
+        User.query.get(self.user_id).username = "renamed"
+        db.session.commit()
+
+        self.assertEqual(usercache.load(self.user_id).username, "cached")
+        usercache.invalidate(self.user_id)
+        self.assertEqual(usercache.load(self.user_id).username, "renamed")
+
+    def test_home_page_does_not_load_user(self):
+        """Is the home page served from the cached fields (and its counters)?"""
+
+        client = app.test_client()
+        with client.session_transaction() as sess:
+            sess[CURR_USER_KEY] = self.user_id
+
+        client.get("/")
+        with client:
+            resp = client.get("/")
+            self.assertIsNone(g.user._user)
+
+        self.assertIn(b'/following">0</a>', resp.data)
+
+    def test_deleted_user(self):
+        """Is a deleted user's cached snapshot turned away?"""
+
+        usercache.load(self.user_id)
+        User.query.get(self.user_id).deleted = True
+        db.session.commit()
+
+        # no shared backend, so this worker doesn't know yet...
+        snapshot = usercache.load(self.user_id)
+        self.assertEqual(snapshot.username, "cached")
+
+        # ...until it needs the full row
+        self.assertRaises(usercache.UserGone, getattr, snapshot, 'bio')
+        self.assertIsNone(usercache.load(self.user_id))
+
+    def test_purged_user_is_logged_out(self):
+        """Does a request that needs a purged user's row end their session?"""
+
+        client = app.test_client()
+        with client.session_transaction() as sess:
+            sess[CURR_USER_KEY] = self.user_id
+        client.get("/")
+
+        User.query.filter_by(id=self.user_id).delete()
+        db.session.commit()
+
+        resp = client.get("/users/profile")
+        self.assertEqual(resp.status_code, 302)
+        self.assertTrue(resp.location.endswith("/login"))
+        with client.session_transaction() as sess:
+            self.assertNotIn(CURR_USER_KEY, sess)
+
+        self.assertEqual(client.get("/api/v1/following?ids=1").status_code, 401)
@@ -0,0 +1,94 @@
+"""Denormalized counter tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_counters.py
+
+
+import os
+from unittest import TestCase
+
+from models import db, User, Message, FollowersFollowee, Like
+
+os.environ['DATABASE_URL'] = "postgresql:///warbler-test"
+
+from app import app, CURR_USER_KEY
+import counters
+
+db.create_all()
+
+app.config['WTF_CSRF_ENABLED'] = False
+app.config['USER_CACHE_SIZE'] = 0
+
+
+class CountersTestCase(TestCase):
+    """Test that write paths keep the profile counters in step."""
+
+    def setUp(self):
+        """Create test client and two users."""
+
+        Like.query.delete()
+        FollowersFollowee.query.delete()
+        Message.query.delete()
+        User.query.delete()
+
+        self.client = app.test_client()
+
+        u1 = User.signup(username="counted1",
+                         email="counted1@test.com",
+                         password="password",
+                         image_url=None)
+        u2 = User.signup(username="counted2",
+                         email="counted2@test.com",
+                         password="password",
+                         image_url=None)
+        db.session.commit()
+
+        self.u1_id = u1.id
+        self.u2_id = u2.id
+
+    def counts(self, user_id):
+        user = User.query.get(user_id)
+        return (user.messages_count,
+                user.following_count,
+                user.followers_count,
+                user.likes_count)
+
+    def test_write_paths(self):
+        """Do posting, following and liking keep the counters right?"""
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.u2_id
+            c.post("/messages/new", data={"text": "count me"})
+
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.u1_id
+            c.post(f"/users/follow/{self.u2_id}")
+            msg_id = Message.query.one().id
+            c.post("/like-unlike", data={"message_id": msg_id, "redirect_to": "/"})
+
+            self.assertEqual(self.counts(self.u1_id), (0, 1, 0, 1))
+            self.assertEqual(self.counts(self.u2_id), (1, 0, 1, 0))
+
+            c.post("/like-unlike", data={"message_id": msg_id, "redirect_to": "/"})
+            c.post(f"/users/stop-following/{self.u2_id}")
+
+            self.assertEqual(self.counts(self.u1_id), (0, 0, 0, 0))
+            self.assertEqual(self.counts(self.u2_id), (1, 0, 0, 0))
+
+    def test_reconcile(self):
+        """Does reconcile rebuild counters that have drifted?"""
+
+        msg = Message(text="uncounted", user_id=self.u1_id)
+        db.session.add(msg)
+        db.session.add(FollowersFollowee(followee_id=self.u2_id, follower_id=self.u1_id))
+        db.session.commit()
+        db.session.add(Like(user_id=self.u2_id, message_id=msg.id))
+        db.session.commit()
+
+        counters.reconcile()
+        db.session.commit()
+
+        self.assertEqual(self.counts(self.u1_id), (1, 0, 1, 0))
+        self.assertEqual(self.counts(self.u2_id), (0, 1, 0, 1))
@@ -0,0 +1,102 @@
+"""Read-replica routing tests, with a second database standing in for the replica."""
+
+# run these tests like:
+#
+#    python -m unittest test_database.py
+
+
+import os
+from unittest import TestCase
+
+from sqlalchemy import func, select
+
+from models import db, User, Message, FollowersFollowee, Like, TimelineEntry
+
+os.environ['DATABASE_URL'] = "postgresql:///warbler-test"
+
+from app import app, CURR_USER_KEY
+import database
+
+db.create_all()
+
+app.config['WTF_CSRF_ENABLED'] = False
+app.config['USER_CACHE_SIZE'] = 0
+
+REPLICA_URL = "postgresql:///warbler-test-replica"
+
+
+class ReplicaRoutingTestCase(TestCase):
+    """Test which database reads and writes go to."""
+
+    def setUp(self):
+        self.binds = app.config.get('SQLALCHEMY_BINDS')
+        app.config['SQLALCHEMY_BINDS'] = {database.REPLICA: REPLICA_URL}
+        db.session.remove()
+
+        self.replica = db.get_engine(app, bind=database.REPLICA)
+        db.metadata.create_all(self.replica)
+
+        for model in (TimelineEntry, Like, FollowersFollowee, Message, User):
+            model.query.delete()
+            self.replica.execute(model.__table__.delete())
+
+        user = User.signup(username="primary", email="user@test.com",
+                           password="password", image_url=None)
+        db.session.commit()
+        self.user_id = user.id
+
+        # the same user as the (lagging) replica has it
+        self.replica.execute(User.__table__.insert().values(
+            id=user.id, username="replica", email="user@test.com",
+            password=user.password))
+
+        self.client = app.test_client()
+
+    def tearDown(self):
+        db.session.remove()
+        app.config['SQLALCHEMY_BINDS'] = self.binds
+
+    def login(self, c):
+        with c.session_transaction() as sess:
+            sess[CURR_USER_KEY] = self.user_id
+
+    def test_read_only_views_use_replica(self):
+        """Do marked views read from the replica, and others from the primary?"""
+
+        with self.client as c:
+            resp = c.get(f"/users/{self.user_id}")
+            self.assertIn(b"@replica", resp.data)
+
+            self.login(c)
+            resp = c.get("/users/profile")
+            self.assertIn(b'value="primary"', resp.data)
+
+    def test_writes_go_to_primary_and_stick(self):
+        """Does a client read its own writes from the primary after a POST?"""
+
+        with self.client as c:
+            self.login(c)
+            c.post("/messages/new", data={"text": "hello"})
+
+            self.assertEqual(Message.query.count(), 1)
+            self.assertEqual(self.replica.execute(
+                select([func.count()]).select_from(Message.__table__)).scalar(), 0)
+
+            resp = c.get(f"/users/{self.user_id}")
+            self.assertIn(b"@primary", resp.data)
+            self.assertIn(b"hello", resp.data)
+
+            # once the window passes, reads go back to the replica
+            with c.session_transaction() as sess:
+                sess[database.STICKY_KEY] = 0
+            resp = c.get(f"/users/{self.user_id}")
+            self.assertNotIn(b"hello", resp.data)
+
+    def test_no_replica_configured(self):
+        """Without a replica bind, does everything use the primary?"""
+
+        app.config['SQLALCHEMY_BINDS'] = None
+
+        resp = self.client.get(f"/users/{self.user_id}")
+
+        self.assertIn(b"@primary", resp.data)
@@ -0,0 +1,97 @@
+"""Followers / following page tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_follows.py
+
+
+import os
+from unittest import TestCase
+
+from models import db, User, Message, FollowersFollowee, Like, TimelineEntry
+
+os.environ['DATABASE_URL'] = "postgresql:///warbler-test"
+
+from app import app, CURR_USER_KEY
+import follows
+
+db.create_all()
+
+app.config['WTF_CSRF_ENABLED'] = False
+app.config['USER_CACHE_SIZE'] = 0
+
+
+class FollowsTestCase(TestCase):
+    """Test paging through who a user follows and who follows them."""
+
+    def setUp(self):
+        TimelineEntry.query.delete()
+        Like.query.delete()
+        FollowersFollowee.query.delete()
+        Message.query.delete()
+        User.query.delete()
+
+        users = [User.signup(username=f"user{i}", email=f"user{i}@test.com",
+                             password="password", image_url=None)
+                 for i in range(5)]
+        db.session.commit()
+        self.ids = [user.id for user in users]
+
+        # user0 follows user1-3; user1-3 follow user4; user4 follows user1
+        hub, *others, star = self.ids
+        db.session.add_all(
+            [FollowersFollowee(followee_id=hub, follower_id=id) for id in others]
+            + [FollowersFollowee(followee_id=id, follower_id=star) for id in others]
+            + [FollowersFollowee(followee_id=star, follower_id=others[0])])
+        db.session.commit()
+
+        self.client = app.test_client()
+        with self.client.session_transaction() as sess:
+            sess[CURR_USER_KEY] = star
+
+    def test_pages(self):
+        """Are the lists paged in id order with a cursor to the next page?"""
+
+        hub, a, b, c, star = self.ids
+
+        cards, next_after = follows.following_page(hub, per_page=2)
+        self.assertEqual([card.id for card in cards], [a, b])
+        self.assertEqual(next_after, b)
+
+        cards, next_after = follows.following_page(hub, after_id=b, per_page=2)
+        self.assertEqual([card.id for card in cards], [c])
+        self.assertIsNone(next_after)
+
+        cards, _ = follows.followers_page(star)
+        self.assertEqual([card.username for card in cards], ["user1", "user2", "user3"])
+
+    def test_following_view(self):
+        """Does the page show one page of cards, with the viewer's follow state?"""
+
+        hub, a, b, c, star = self.ids
+
+        app.config['USERS_PAGE_SIZE'] = 2
+        try:
+            resp = self.client.get(f"/users/{hub}/following")
+            self.assertIn(b"@user1", resp.data)
+            self.assertIn(b"@user2", resp.data)
+            self.assertNotIn(b"@user3", resp.data)
+            self.assertIn(f"/users/{hub}/following?after={b}".encode(), resp.data)
+            # the viewer (user4) follows user1 only
+            self.assertIn(f'action="/users/stop-following/{a}"'.encode(), resp.data)
+            self.assertIn(f'action="/users/follow/{b}"'.encode(), resp.data)
+
+            resp = self.client.get(f"/users/{hub}/following?after={b}")
+            self.assertIn(b"@user3", resp.data)
+            self.assertNotIn(b'id="more-users"', resp.data)
+        finally:
+            app.config['USERS_PAGE_SIZE'] = 24
+
+    def test_followers_view(self):
+        """Does the followers page list the followers?"""
+
+        resp = self.client.get(f"/users/{self.ids[-1]}/followers")
+
+        for username in (b"@user1", b"@user2", b"@user3"):
+            self.assertIn(username, resp.data)
+        self.assertNotIn(b'id="more-users"', resp.data)
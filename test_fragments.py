@@ -0,0 +1,113 @@
+"""Rendered-fragment cache tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_fragments.py
+
+
+import os
+from unittest import TestCase
+from unittest.mock import patch
+
+from models import db, User, Message, Like
+
+os.environ['DATABASE_URL'] = "postgresql:///warbler-test"
+
+from app import app, CURR_USER_KEY
+from cache import LRUCache
+import fragments
+
+db.create_all()
+
+app.config['WTF_CSRF_ENABLED'] = False
+app.config['USER_CACHE_SIZE'] = 0
+
+
+class FragmentsTestCase(TestCase):
+    """Test that cached message items and headers stay correct."""
+
+    def setUp(self):
+        Like.query.delete()
+        Message.query.delete()
+        User.query.delete()
+
+        author = User.signup(username="author", email="author@test.com",
+                             password="password", image_url=None)
+        reader = User.signup(username="reader", email="reader@test.com",
+                             password="password", image_url=None)
+        db.session.commit()
+        msg = Message(text="cached words", user_id=author.id)
+        db.session.add(msg)
+        db.session.commit()
+
+        self.author_id = author.id
+        self.reader_id = reader.id
+        self.msg_id = msg.id
+
+        app.extensions['fragment_cache'] = LRUCache(maxsize=100)
+        self.client = app.test_client()
+
+    def tearDown(self):
+        app.extensions.pop('fragment_cache', None)
+
+    def get_as(self, user_id, url):
+        with self.client.session_transaction() as sess:
+            sess[CURR_USER_KEY] = user_id
+        return self.client.get(url).get_data(as_text=True)
+
+    def test_items_are_rendered_once(self):
+        """Is a message item rendered once and then served from the cache?"""
+
+        with patch.object(fragments, 'render_template',
+                          wraps=fragments.render_template) as render:
+            self.get_as(self.reader_id, f"/users/{self.author_id}")
+            self.get_as(self.reader_id, f"/users/{self.author_id}")
+
+        templates = [call[0][0] for call in render.call_args_list]
+        self.assertEqual(templates.count('messages/_item.html'), 1)
+        self.assertEqual(templates.count('users/_header.html'), 1)
+
+    def test_viewer_bits_are_not_cached(self):
+        """Does each viewer get their own like and follow buttons?"""
+
+        self.get_as(self.reader_id, f"/users/{self.author_id}")
+        db.session.add(Like(user_id=self.reader_id, message_id=self.msg_id))
+        db.session.commit()
+
+        as_reader = self.get_as(self.reader_id, f"/users/{self.author_id}")
+        as_author = self.get_as(self.author_id, f"/users/{self.author_id}")
+
+        self.assertIn('fas fa-thumbs-up', as_reader)
+        self.assertIn('Follow', as_reader)
+        self.assertNotIn('fa-thumbs-up', as_author)
+        self.assertIn('Edit Profile', as_author)
+        self.assertNotIn('Edit Profile', as_reader)
+
+    def test_profile_change_rerenders(self):
+        """Do edited profiles show up in cached items and headers?"""
+
+        self.get_as(self.reader_id, f"/users/{self.author_id}")
+
+        with self.client.session_transaction() as sess:
+            sess[CURR_USER_KEY] = self.author_id
+        self.client.post("/users/profile", data={"username": "renamed",
+                                                 "email": "author@test.com",
+                                                 "password": "password"})
+
+        html = self.get_as(self.reader_id, f"/users/{self.author_id}")
+        self.assertNotIn('@author', html)
+        self.assertIn('@renamed', html)
+
+    def test_deleted_message_is_forgotten(self):
+        """Does deleting a message drop its cached item?"""
+
+        cache = app.extensions['fragment_cache']
+
+        self.get_as(self.reader_id, f"/users/{self.author_id}")
+        self.assertIsNotNone(cache.get(f"message:{self.msg_id}"))
+
+        with self.client.session_transaction() as sess:
+            sess[CURR_USER_KEY] = self.author_id
+        self.client.post(f"/messages/{self.msg_id}/delete")
+
+        self.assertIsNone(cache.get(f"message:{self.msg_id}"))
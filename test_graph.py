@@ -0,0 +1,152 @@
+"""Follow graph tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_graph.py
+
+
+import os
+import tempfile
+from unittest import TestCase
+
+from models import db, User, Message, FollowersFollowee, Like, TimelineEntry
+
+os.environ['DATABASE_URL'] = "postgresql:///warbler-test"
+
+from app import app, CURR_USER_KEY
+import graph
+import interactions
+
+db.create_all()
+
+app.config['WTF_CSRF_ENABLED'] = False
+app.config['USER_CACHE_SIZE'] = 0
+
+# 1 -> 2, 1 -> 3, 2 -> 1, 2 -> 3, 3 -> 4, 3 -> 5
+EDGES = [(1, 2), (1, 3), (2, 1), (2, 3), (3, 4), (3, 5)]
+
+
+class FollowGraphTestCase(TestCase):
+    """Test the graph structure on its own."""
+
+    def setUp(self):
+        self.graph = graph.FollowGraph.from_edges(EDGES)
+
+    def test_queries(self):
+        """Do lookups, mutuals and suggestions match the edges?"""
+
+        g = self.graph
+        self.assertEqual(g.following(1), [2, 3])
+        self.assertEqual(g.followers(3), [1, 2])
+        self.assertTrue(g.follows(2, 1))
+        self.assertFalse(g.follows(4, 3))
+        self.assertEqual(g.mutuals(1), [2])
+        self.assertEqual((g.following_count(3), g.followers_count(3)), (2, 2))
+        # 1 follows 2 and 3, who between them follow 4 and 5 (and 1 and 3)
+        self.assertEqual(g.who_to_follow(1), [(4, 1), (5, 1)])
+        self.assertEqual(g.who_to_follow(2), [(4, 1), (5, 1)])
+
+    def test_overlay(self):
+        """Are follows and unfollows reflected before compaction?"""
+
+        g = self.graph
+        g.add(1, 4)
+        g.remove(1, 2)
+        g.add(9, 1)
+        # undoing a change leaves nothing in the overlay
+        g.add(5, 3)
+        g.remove(5, 3)
+
+        self.assertEqual(g.following(1), [3, 4])
+        self.assertEqual(g.followers(1), [2, 9])
+        self.assertEqual(g.mutuals(1), [])
+        self.assertEqual(g.followers_count(4), 2)
+        self.assertEqual(g.overlay_size(), 3)
+
+        compacted = graph.FollowGraph.from_edges(g.edges())
+        self.assertEqual(compacted.overlay_size(), 0)
+        self.assertEqual(compacted.following(9), [1])
+        self.assertEqual(compacted.followers(1), [2, 9])
+
+    def test_snapshot(self):
+        """Does a memory-mapped snapshot answer like the graph it came from?"""
+
+        self.graph.add(1, 4)
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'graph.snapshot')
+            self.graph.save(path)
+            loaded = graph.FollowGraph.load(path)
+
+            for user_id in range(7):
+                self.assertEqual(loaded.following(user_id), self.graph.following(user_id))
+                self.assertEqual(loaded.followers(user_id), self.graph.followers(user_id))
+
+            # still takes updates
+            loaded.remove(1, 4)
+            self.assertEqual(loaded.following(1), [2, 3])
+            del loaded
+
+
+class AppGraphTestCase(TestCase):
+    """Test the app's graph: built from the database, updated on commit."""
+
+    def setUp(self):
+        TimelineEntry.query.delete()
+        Like.query.delete()
+        FollowersFollowee.query.delete()
+        Message.query.delete()
+        User.query.delete()
+        app.extensions.pop('follow_graph', None)
+
+        users = [User.signup(username=f"user{i}", email=f"user{i}@test.com",
+                             password="password", image_url=None)
+                 for i in range(4)]
+        db.session.commit()
+        self.ids = [user.id for user in users]
+
+        a, b, c, _ = self.ids
+        db.session.add_all([FollowersFollowee(followee_id=a, follower_id=b),
+                            FollowersFollowee(followee_id=b, follower_id=c)])
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.rollback()
+        app.extensions.pop('follow_graph', None)
+
+    def test_updated_on_commit_only(self):
+        """Do committed follows reach the graph, and rolled back ones not?"""
+
+        a, b, c, d = self.ids
+        with app.app_context():
+            self.assertEqual(graph.get().following(a), [b])
+
+            interactions.follow(a, d)
+            db.session.rollback()
+            self.assertEqual(graph.get().following(a), [b])
+
+            interactions.follow(a, d)
+            interactions.unfollow(a, b)
+            db.session.commit()
+            self.assertEqual(graph.get().following(a), [d])
+
+    def test_api(self):
+        """Do the suggestions and mutuals endpoints use the graph?"""
+
+        a, b, c, _ = self.ids
+        db.session.add(FollowersFollowee(followee_id=b, follower_id=a))
+        db.session.commit()
+
+        client = app.test_client()
+        with client.session_transaction() as sess:
+            sess[CURR_USER_KEY] = a
+
+        resp = client.get("/api/v1/suggestions")
+        self.assertEqual([(s['id'], s['followed_by']) for s in resp.json['suggestions']],
+                         [(c, 1)])
+
+        resp = client.get(f"/api/v1/users/{a}/mutuals")
+        self.assertEqual(resp.json['mutuals'], [b])
+
+        resp = client.get(f"/api/v1/users/{b}")
+        self.assertTrue(resp.json['follows_you'])
@@ -0,0 +1,117 @@
+"""HTTP caching tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_httpcache.py
+
+
+import os
+from unittest import TestCase
+from unittest.mock import patch
+
+from models import db, User, Message, FollowersFollowee, Like
+
+os.environ['DATABASE_URL'] = "postgresql:///warbler-test"
+
+from app import app, CURR_USER_KEY
+
+db.create_all()
+
+app.config['WTF_CSRF_ENABLED'] = False
+app.config['USER_CACHE_SIZE'] = 0
+
+
+class HTTPCacheTestCase(TestCase):
+    """Test ETags, 304s and Cache-Control."""
+
+    def setUp(self):
+        Like.query.delete()
+        FollowersFollowee.query.delete()
+        Message.query.delete()
+        User.query.delete()
+
+        owner = User.signup(username="owner", email="owner@test.com",
+                            password="password", image_url=None)
+        viewer = User.signup(username="viewer", email="viewer@test.com",
+                             password="password", image_url=None)
+        db.session.commit()
+        msg = Message(text="etagged", user_id=owner.id)
+        db.session.add(msg)
+        db.session.commit()
+
+        self.owner_id = owner.id
+        self.viewer_id = viewer.id
+        self.msg_id = msg.id
+
+        self.client = app.test_client()
+        with self.client.session_transaction() as sess:
+            sess[CURR_USER_KEY] = self.viewer_id
+
+    def test_not_modified(self):
+        """Is a matching If-None-Match answered without rendering?"""
+
+        resp = self.client.get(f"/users/{self.owner_id}")
+        etag = resp.headers['ETag']
+
+        with patch('app.render_template') as render:
+            resp = self.client.get(f"/users/{self.owner_id}",
+                                   headers={'If-None-Match': etag})
+
+        self.assertEqual(resp.status_code, 304)
+        self.assertEqual(resp.data, b'')
+        render.assert_not_called()
+
+    def test_etag_changes_with_activity(self):
+        """Does following the owner change the owner's page's ETag?"""
+
+        before = self.client.get(f"/users/{self.owner_id}").headers['ETag']
+        self.client.post(f"/users/follow/{self.owner_id}")
+
+        resp = self.client.get(f"/users/{self.owner_id}",
+                               headers={'If-None-Match': before})
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertNotEqual(resp.headers['ETag'], before)
+        self.assertIn(b'Unfollow', resp.data)
+
+    def test_message_page(self):
+        """Are message pages tagged, and is a new viewer told apart?"""
+
+        resp = self.client.get(f"/messages/{self.msg_id}")
+        etag = resp.headers['ETag']
+
+        other = app.test_client()
+        resp = other.get(f"/messages/{self.msg_id}", headers={'If-None-Match': etag})
+
+        self.assertEqual(resp.status_code, 200)
+
+    def test_flashes_are_not_cached(self):
+        """Is a page with a pending flash left untagged?"""
+
+        with self.client.session_transaction() as sess:
+            sess['_flashes'] = [('success', "Hello!")]
+
+        resp = self.client.get(f"/users/{self.owner_id}")
+
+        self.assertNotIn('ETag', resp.headers)
+
+    def test_cache_control(self):
+        """Are logged-in pages private and do all pages vary on the cookie?"""
+
+        resp = self.client.get(f"/users/{self.owner_id}")
+
+        self.assertIn('private', resp.headers['Cache-Control'])
+        self.assertIn('no-cache', resp.headers['Cache-Control'])
+        self.assertIn('Cookie', resp.headers['Vary'])
+
+    def test_fingerprinted_static(self):
+        """Are fingerprinted static files cached as immutable?"""
+
+        html = self.client.get("/").get_data(as_text=True)
+        self.assertRegex(html, r'/static/stylesheets/style.css\?v=[0-9a-f]{12}')
+
+        fingerprint = html.split('href="/static/stylesheets/style.css?v=')[1].split('"')[0]
+        resp = self.client.get(f"/static/stylesheets/style.css?v={fingerprint}")
+
+        self.assertIn('immutable', resp.headers['Cache-Control'])
+        self.assertIn('max-age=31536000', resp.headers['Cache-Control'])
@@ -0,0 +1,90 @@
+"""Request instrumentation tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_instrumentation.py
+
+
+import os
+from unittest import TestCase
+
+from models import db, User, Message
+
+os.environ['DATABASE_URL'] = "postgresql:///warbler-test"
+
+from app import app, CURR_USER_KEY
+import instrumentation
+
+db.create_all()
+
+app.config['WTF_CSRF_ENABLED'] = False
+app.config['USER_CACHE_SIZE'] = 0
+
+
+class InstrumentationTestCase(TestCase):
+    """Test query counting, slow-query/N+1 logging and /metrics."""
+
+    def setUp(self):
+        Message.query.delete()
+        User.query.delete()
+
+        user = User.signup(username="measured", email="measured@test.com",
+                           password="password", image_url=None)
+        db.session.commit()
+        self.user_id = user.id
+
+        self.client = app.test_client()
+        with self.client.session_transaction() as sess:
+            sess[CURR_USER_KEY] = self.user_id
+
+        self.saved = (app.config['SLOW_QUERY_MS'], app.config['N_PLUS_ONE_THRESHOLD'])
+
+    def tearDown(self):
+        app.config['SLOW_QUERY_MS'], app.config['N_PLUS_ONE_THRESHOLD'] = self.saved
+
+    def test_server_timing(self):
+        """Does every response report its query count and database time?"""
+
+        resp = self.client.get(f"/users/{self.user_id}")
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertIn('db;dur=', resp.headers['Server-Timing'])
+        self.assertRegex(resp.headers['Server-Timing'], r'desc="[1-9]\d* queries"')
+
+    def test_slow_queries_and_n_plus_one_are_logged(self):
+        """Are slow and repeated statements logged with their route?"""
+
+        app.config['SLOW_QUERY_MS'] = 0
+        app.config['N_PLUS_ONE_THRESHOLD'] = 1
+
+        with self.assertLogs(instrumentation.logger, 'WARNING') as logs:
+            self.client.get(f"/users/{self.user_id}")
+
+        self.assertTrue(any("slow query" in line and f"/users/{self.user_id}" in line
+                            for line in logs.output))
+        self.assertTrue(any("possible N+1" in line for line in logs.output))
+
+    def test_metrics(self):
+        """Are per-endpoint histograms exposed in the Prometheus format?"""
+
+        self.client.get(f"/users/{self.user_id}")
+        resp = self.client.get("/metrics")
+        body = resp.get_data(as_text=True)
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertIn('# TYPE warbler_request_duration_seconds histogram', body)
+        self.assertIn('warbler_request_queries_count{endpoint="warbler.users_show"}', body)
+        self.assertIn('warbler_request_db_seconds_bucket{endpoint="warbler.users_show",le="+Inf"}',
+                      body)
+
+    def test_metrics_token(self):
+        """Is /metrics closed when a token is configured?"""
+
+        app.config['METRICS_TOKEN'] = "sekrit"
+        try:
+            self.assertEqual(self.client.get("/metrics").status_code, 401)
+            resp = self.client.get("/metrics",
+                                   headers={'Authorization': "Bearer sekrit"})
+            self.assertEqual(resp.status_code, 200)
+        finally:
+            app.config['METRICS_TOKEN'] = None
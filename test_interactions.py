@@ -0,0 +1,126 @@
+"""Like / follow write path tests, including concurrent ones."""
+
+# run these tests like:
+#
+#    python -m unittest test_interactions.py
+
+
+import os
+import threading
+from unittest import TestCase
+
+from models import db, User, Message, FollowersFollowee, Like, TimelineEntry
+
+os.environ['DATABASE_URL'] = "postgresql:///warbler-test"
+
+from app import app
+import interactions
+
+db.create_all()
+
+THREADS = 8
+ROUNDS = 10
+
+
+class InteractionsTestCase(TestCase):
+    """Test that likes and follows are idempotent and race-free."""
+
+    def setUp(self):
+        TimelineEntry.query.delete()
+        Like.query.delete()
+        FollowersFollowee.query.delete()
+        Message.query.delete()
+        User.query.delete()
+
+        author = User.signup(username="author", email="author@test.com",
+                             password="password", image_url=None)
+        fan = User.signup(username="fan", email="fan@test.com",
+                          password="password", image_url=None)
+        db.session.commit()
+        msg = Message(text="like me", user_id=author.id)
+        db.session.add(msg)
+        db.session.commit()
+
+        self.author_id = author.id
+        self.fan_id = fan.id
+        self.msg_id = msg.id
+
+    def tearDown(self):
+        db.session.rollback()
+
+    def hammer(self, action, *args):
+        """Run `action(*args)` and commit, from many threads at once."""
+
+        start = threading.Barrier(THREADS)
+        errors = []
+
+        def worker():
+            with app.app_context():
+                start.wait()
+                for _ in range(ROUNDS):
+                    try:
+                        action(*args)
+                        db.session.commit()
+                    except Exception as e:
+                        db.session.rollback()
+                        errors.append(e)
+                db.session.remove()
+
+        threads = [threading.Thread(target=worker) for _ in range(THREADS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        db.session.expire_all()
+
+    def test_repeats_change_nothing(self):
+        """Do repeated likes / follows report that nothing changed?"""
+
+        with app.app_context():
+            self.assertTrue(interactions.like(self.fan_id, self.msg_id))
+            self.assertFalse(interactions.like(self.fan_id, self.msg_id))
+            self.assertTrue(interactions.unlike(self.fan_id, self.msg_id))
+            self.assertFalse(interactions.unlike(self.fan_id, self.msg_id))
+
+            self.assertFalse(interactions.unfollow(self.fan_id, self.author_id))
+            self.assertTrue(interactions.follow(self.fan_id, self.author_id))
+            self.assertFalse(interactions.follow(self.fan_id, self.author_id))
+            db.session.commit()
+
+        self.assertEqual(User.query.get(self.fan_id).likes_count, 0)
+        self.assertEqual(User.query.get(self.fan_id).following_count, 1)
+
+    def test_concurrent_likes(self):
+        """Do many concurrent likes, then unlikes, leave one like, then none?"""
+
+        self.hammer(interactions.like, self.fan_id, self.msg_id)
+        self.assertEqual(Like.query.count(), 1)
+        self.assertEqual(User.query.get(self.fan_id).likes_count, 1)
+
+        self.hammer(interactions.unlike, self.fan_id, self.msg_id)
+        self.assertEqual(Like.query.count(), 0)
+        self.assertEqual(User.query.get(self.fan_id).likes_count, 0)
+
+    def test_concurrent_toggles(self):
+        """Do racing like/unlike clicks keep the counter equal to the rows?"""
+
+        self.hammer(interactions.toggle_like, self.fan_id, self.msg_id)
+
+        self.assertEqual(User.query.get(self.fan_id).likes_count, Like.query.count())
+
+    def test_concurrent_follows(self):
+        """Do many concurrent follows, then unfollows, keep both counters right?"""
+
+        self.hammer(interactions.follow, self.fan_id, self.author_id)
+        self.assertEqual(FollowersFollowee.query.count(), 1)
+        self.assertEqual(User.query.get(self.fan_id).following_count, 1)
+        self.assertEqual(User.query.get(self.author_id).followers_count, 1)
+        self.assertEqual(TimelineEntry.query.filter_by(user_id=self.fan_id).count(), 1)
+
+        self.hammer(interactions.unfollow, self.fan_id, self.author_id)
+        self.assertEqual(FollowersFollowee.query.count(), 0)
+        self.assertEqual(User.query.get(self.fan_id).following_count, 0)
+        self.assertEqual(User.query.get(self.author_id).followers_count, 0)
+        self.assertEqual(TimelineEntry.query.filter_by(user_id=self.fan_id).count(), 0)
@@ -0,0 +1,205 @@
+"""Background job queue tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_jobs.py
+
+
+import os
+from datetime import datetime, timedelta
+from unittest import TestCase
+from unittest.mock import patch
+
+from sqlalchemy import false
+
+from models import db, User, Message, FollowersFollowee, Like, TimelineEntry, Job
+
+os.environ['DATABASE_URL'] = "postgresql:///warbler-test"
+
+from app import app, CURR_USER_KEY
+import jobs
+
+db.create_all()
+
+app.config['WTF_CSRF_ENABLED'] = False
+app.config['USER_CACHE_SIZE'] = 0
+
+
+@jobs.handler('test.fail')
+def fail():
+    raise RuntimeError("always fails")
+
+
+class JobsTestCase(TestCase):
+    """Test queueing, running and retrying jobs, and what is deferred."""
+
+    def setUp(self):
+        Job.query.delete()
+        TimelineEntry.query.delete()
+        Like.query.delete()
+        FollowersFollowee.query.delete()
+        Message.query.delete()
+        User.query.delete()
+
+        author = User.signup(username="author", email="author@test.com",
+                             password="password", image_url=None)
+        reader = User.signup(username="reader", email="reader@test.com",
+                             password="password", image_url=None)
+        db.session.commit()
+        db.session.add(FollowersFollowee(followee_id=reader.id, follower_id=author.id))
+        reader.following_count = author.followers_count = 1
+        db.session.commit()
+
+        self.author_id = author.id
+        self.reader_id = reader.id
+
+        app.config['JOBS_EAGER'] = False
+        self.client = app.test_client()
+
+    def tearDown(self):
+        app.config['JOBS_EAGER'] = True
+        db.session.rollback()
+
+    def login(self, c, user_id):
+        with c.session_transaction() as sess:
+            sess[CURR_USER_KEY] = user_id
+
+    def test_runs_and_deletes(self):
+        """Is a queued job run by a worker, and then gone?"""
+
+        with app.app_context():
+            jobs.enqueue('counters.adjust', user_ids=[self.author_id],
+                         deltas={'likes_count': 2})
+            db.session.commit()
+
+        self.assertEqual(Job.query.count(), 1)
+        self.assertEqual(User.query.get(self.author_id).likes_count, 0)
+
+        with app.app_context():
+            self.assertEqual(jobs.run_pending(), 1)
+
+        self.assertEqual(Job.query.count(), 0)
+        self.assertEqual(User.query.get(self.author_id).likes_count, 2)
+
+    def test_retries_then_fails(self):
+        """Is a failing job retried later, then marked failed?"""
+
+        with app.app_context():
+            jobs.enqueue('test.fail')
+            db.session.commit()
+
+            jobs.run_pending()
+            job = Job.query.one()
+            self.assertEqual((job.status, job.attempts), ('pending', 1))
+            self.assertGreater(job.run_at, datetime.utcnow())
+            self.assertIn("always fails", job.last_error)
+
+            # not due yet
+            self.assertEqual(jobs.run_pending(), 0)
+
+            for _ in range(app.config['JOBS_MAX_ATTEMPTS'] - 1):
+                Job.query.update({Job.run_at: datetime.utcnow() - timedelta(seconds=1)})
+                db.session.commit()
+                jobs.run_pending()
+
+            job = Job.query.one()
+            self.assertEqual(job.status, 'failed')
+            self.assertEqual(job.attempts, app.config['JOBS_MAX_ATTEMPTS'])
+
+    def test_reclaims_stale_jobs(self):
+        """Is a job whose worker went away run again?"""
+
+        with app.app_context():
+            jobs.enqueue('counters.adjust', user_ids=[self.author_id],
+                         deltas={'likes_count': 1})
+            db.session.commit()
+            job_id = jobs.claim()
+            self.assertIsNone(jobs.claim())
+
+            stale = datetime.utcnow() - timedelta(seconds=app.config['JOBS_LOCK_TIMEOUT'] + 1)
+            Job.query.update({Job.locked_at: stale})
+            db.session.commit()
+            self.assertEqual(jobs.claim(), job_id)
+
+    def test_fan_out_is_deferred(self):
+        """Does a new message reach followers' timelines only via the worker?"""
+
+        with self.client as c:
+            self.login(c, self.author_id)
+            c.post("/messages/new", data={"text": "hello"})
+
+        self.assertEqual(TimelineEntry.query.filter_by(user_id=self.author_id).count(), 1)
+        self.assertEqual(TimelineEntry.query.filter_by(user_id=self.reader_id).count(), 0)
+
+        with app.app_context():
+            jobs.run_pending()
+
+        self.assertEqual(TimelineEntry.query.filter_by(user_id=self.reader_id).count(), 1)
+
+    def test_claim_after_many_lost_races(self):
+        """Does a worker that keeps losing the race to claim carry on trying?"""
+
+        with app.app_context():
+            jobs.enqueue('counters.adjust', user_ids=[self.author_id],
+                         deltas={'likes_count': 1})
+            db.session.commit()
+
+            ready = jobs._ready
+            calls = []
+
+            def lose_races(now):
+                # every other call is the claiming UPDATE; lose the first
+                # (more than the recursion limit) of those
+                calls.append(now)
+                if len(calls) % 2 == 0 and len(calls) <= 2 * 1100:
+                    return false()
+                return ready(now)
+
+            with patch.object(jobs, '_ready', lose_races):
+                self.assertIsNotNone(jobs.claim())
+
+            self.assertEqual(Job.query.one().status, 'running')
+
+    def test_delete_account_is_deferred(self):
+        """Is a deleted account locked out at once and purged by the worker?"""
+
+        msg = Message(text="bye", user_id=self.author_id)
+        db.session.add(msg)
+        db.session.commit()
+        db.session.add(Like(user_id=self.reader_id, message_id=msg.id))
+        User.query.get(self.reader_id).likes_count = 1
+        db.session.commit()
+
+        with self.client as c:
+            self.login(c, self.author_id)
+            c.post("/users/delete")
+
+        self.assertFalse(User.authenticate("author", "password"))
+        self.assertEqual(Message.query.count(), 1)
+
+        with app.app_context():
+            jobs.run_pending()
+
+        self.assertIsNone(User.query.get(self.author_id))
+        self.assertEqual(Message.query.count(), 0)
+        self.assertEqual(Like.query.count(), 0)
+        self.assertEqual(FollowersFollowee.query.count(), 0)
+        reader = User.query.get(self.reader_id)
+        self.assertEqual((reader.following_count, reader.likes_count), (0, 0))
+
+    def test_delete_account_eagerly(self):
+        """With JOBS_EAGER, is a deleted account purged during the request?"""
+
+        db.session.add(Message(text="bye", user_id=self.author_id))
+        db.session.commit()
+        app.config['JOBS_EAGER'] = True
+
+        with self.client as c:
+            self.login(c, self.author_id)
+            resp = c.post("/users/delete")
+
+        self.assertEqual(resp.status_code, 302)
+        self.assertIsNone(User.query.get(self.author_id))
+        self.assertEqual(Message.query.count(), 0)
+        self.assertEqual(Job.query.count(), 0)
+        self.assertEqual(User.query.get(self.reader_id).following_count, 0)
@@ -0,0 +1,126 @@
+"""Bulk loader tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_loader.py
+
+
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+from models import db, User, Message, FollowersFollowee, TimelineEntry
+
+os.environ['DATABASE_URL'] = "postgresql:///warbler-test"
+
+from app import app
+import loader
+
+db.create_all()
+
+USERS_CSV = """id,email,username,password,bio
+900001,one@test.com,one,HASHED_PASSWORD,
+900002,two@test.com,two,HASHED_PASSWORD,a bio
+900003,three@test.com,three,HASHED_PASSWORD,
+"""
+
+MESSAGES_CSV = """text,timestamp,user_id
+first,2018-01-01 10:00:00.000000,900001
+second,2018-01-02 10:00:00.000000,900001
+"""
+
+FOLLOWS_CSV = """followee_id,follower_id
+900002,900001
+"""
+
+
+class LoaderTestCase(TestCase):
+    """Test streaming CSVs into the database."""
+
+    def setUp(self):
+        FollowersFollowee.query.delete()
+        Message.query.delete()
+        User.query.delete()
+        db.session.commit()
+
+        self.data_dir = tempfile.mkdtemp()
+        for name, content in [('users.csv', USERS_CSV),
+                              ('messages.csv', MESSAGES_CSV),
+                              ('follows.csv', FOLLOWS_CSV)]:
+            with open(os.path.join(self.data_dir, name), 'w') as f:
+                f.write(content)
+
+        self.ctx = app.app_context()
+        self.ctx.push()
+        loader.load_checkpoints.create(db.engine, checkfirst=True)
+        db.session.execute(loader.load_checkpoints.delete())
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.rollback()
+        self.ctx.pop()
+        shutil.rmtree(self.data_dir)
+
+    def load(self):
+        loader.load(self.data_dir, batch_size=2, progress=lambda line: None)
+
+    def checkpoints(self):
+        return db.session.execute(loader.load_checkpoints.select()).fetchall()
+
+    def test_load(self):
+        """Are rows loaded in small batches, with projections rebuilt?"""
+
+        self.load()
+
+        self.assertEqual(User.query.count(), 3)
+        self.assertIsNone(User.query.get(900001).bio)
+        self.assertEqual(User.query.get(900001).messages_count, 2)
+        self.assertEqual(User.query.get(900001).followers_count, 1)
+
+        # user two follows user one, so both messages are in their timeline
+        self.assertEqual(TimelineEntry.query.filter_by(user_id=900002).count(), 2)
+
+        # finished loads clean up after themselves
+        self.assertEqual(self.checkpoints(), [])
+
+    def test_resume(self):
+        """Does a load skip the rows an interrupted run already loaded?"""
+
+        db.session.add(User(id=900001, email="one@test.com",
+                            username="one", password="HASHED_PASSWORD"))
+        db.session.add(User(id=900002, email="two@test.com",
+                            username="two", password="HASHED_PASSWORD"))
+        db.session.commit()
+
+        db.session.execute(loader.load_checkpoints.insert().values(
+            filename=os.path.join(self.data_dir, 'users.csv'), rows_done=2))
+        db.session.commit()
+
+        self.load()
+
+        self.assertEqual(User.query.count(), 3)
+        self.assertEqual(Message.query.count(), 2)
+
+    def test_failed_batch_keeps_checkpoint(self):
+        """Does a batch that fails leave the checkpoint at the last good batch?"""
+
+        # the second batch repeats an email, so it fails
+        with open(os.path.join(self.data_dir, 'users.csv'), 'w') as f:
+            f.write(USERS_CSV + "900004,one@test.com,four,HASHED_PASSWORD,\n")
+
+        with self.assertRaises(Exception):
+            self.load()
+        db.session.rollback()
+
+        self.assertEqual(User.query.count(), 2)
+        self.assertEqual([tuple(row) for row in self.checkpoints()],
+                         [(os.path.join(self.data_dir, 'users.csv'), 2)])
+
+        # fixed, it carries on from there
+        with open(os.path.join(self.data_dir, 'users.csv'), 'w') as f:
+            f.write(USERS_CSV + "900004,four@test.com,four,HASHED_PASSWORD,\n")
+        self.load()
+
+        self.assertEqual(User.query.count(), 4)
+        self.assertEqual(Message.query.count(), 2)
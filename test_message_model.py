@@ -0,0 +1,123 @@
+"""Message model tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_message_model.py
+
+
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from unittest import TestCase
+
+from models import db, User, Message, Like, FollowersFollowee, TimelineEntry
+
+os.environ['DATABASE_URL'] = "postgresql:///warbler-test"
+
+from app import app
+import snowflake
+
+db.create_all()
+
+
+class MessageModelTestCase(TestCase):
+    """Test message timestamps and ids."""
+
+    def setUp(self):
+        TimelineEntry.query.delete()
+        Like.query.delete()
+        FollowersFollowee.query.delete()
+        Message.query.delete()
+        User.query.delete()
+
+        user = User.signup(username="author", email="author@test.com",
+                           password="password", image_url=None)
+        db.session.commit()
+        self.user_id = user.id
+
+    def tearDown(self):
+        db.session.rollback()
+        app.config['MESSAGE_ID_SCHEME'] = 'serial'
+
+    def test_timestamp_set_by_database(self):
+        """Is each message stamped when it's inserted, and readable at once?"""
+
+        first = Message(text="first", user_id=self.user_id)
+        db.session.add(first)
+        db.session.flush()
+        # available without another query (eager defaults)
+        self.assertIn('timestamp', first.__dict__)
+
+        time.sleep(1.1)
+        second = Message(text="second", user_id=self.user_id)
+        db.session.add(second)
+        db.session.commit()
+
+        self.assertLess(abs(second.timestamp - datetime.utcnow()), timedelta(minutes=1))
+        self.assertGreater(second.timestamp, first.timestamp)
+
+    def test_snowflake_ids(self):
+        """With snowflake ids, do messages get time-ordered 64-bit ids?"""
+
+        app.config['MESSAGE_ID_SCHEME'] = 'snowflake'
+
+        msgs = [Message(text=f"message {i}", user_id=self.user_id) for i in range(3)]
+        for msg in msgs:
+            db.session.add(msg)
+            db.session.flush()
+        db.session.commit()
+
+        ids = [msg.id for msg in msgs]
+        self.assertEqual(ids, sorted(ids))
+        self.assertGreater(ids[0], 2 ** 32)
+        self.assertLess(abs(snowflake.timestamp_of(ids[0]) - datetime.utcnow()),
+                        timedelta(minutes=1))
+
+
+class IdGeneratorTestCase(TestCase):
+    """Test the snowflake id generator on its own."""
+
+    def test_unique_and_increasing_across_threads(self):
+        """Do many threads get unique ids, each increasing?"""
+
+        ids = snowflake.IdGenerator(worker_id=7)
+        per_thread = []
+
+        def worker():
+            mine = [ids.next_id() for _ in range(5000)]
+            per_thread.append(mine)
+
+        threads = [threading.Thread(target=worker) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        everything = [id for mine in per_thread for id in mine]
+        self.assertEqual(len(set(everything)), len(everything))
+        for mine in per_thread:
+            self.assertEqual(mine, sorted(mine))
+
+        worker_id = (everything[0] >> snowflake.SEQUENCE_BITS) & snowflake.MAX_WORKER_ID
+        self.assertEqual(worker_id, 7)
+
+    def test_clock_going_back(self):
+        """Do ids keep increasing if the clock goes backwards?"""
+
+        ids = snowflake.IdGenerator(worker_id=1)
+        now = [10 ** 12 + 5000]
+        real_now = snowflake._now_ms
+        snowflake._now_ms = lambda: now[0]
+        try:
+            first = ids.next_id()
+            now[0] -= 1000
+            second = ids.next_id()
+        finally:
+            snowflake._now_ms = real_now
+
+        self.assertGreater(second, first)
+
+    def test_bad_worker_id(self):
+        with self.assertRaises(ValueError):
+            snowflake.IdGenerator(worker_id=snowflake.MAX_WORKER_ID + 1)
@@ -8,7 +8,9 @@
 import os
 from unittest import TestCase
 
-from models import db, connect_db, Message, User
+from sqlalchemy import event
+
+from models import db, connect_db, Message, User, Like
 
 # BEFORE we import our app, let's set an environmental variable
 # to use a different database for tests (we need to do this
@@ -32,6 +34,10 @@ db.create_all()
 
 app.config['WTF_CSRF_ENABLED'] = False
 
+# Tests delete users behind the app's back, so don't cache logged-in users
+
+app.config['USER_CACHE_SIZE'] = 0
+
 
 class MessageViewTestCase(TestCase):
     """Test views for messages."""
@@ -105,6 +111,30 @@ class MessageViewTestCase(TestCase):
             msg = Message.query.one()
             self.assertEqual(msg.text, "Hello")
 
+    def test_add_message_skips_other_messages(self):
+        """Is a message posted without loading the author's other messages?"""
+
+        statements = []
+
+        def record(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.testuser_id
+
+            with app.app_context():
+                engine = db.engine
+            event.listen(engine, 'before_cursor_execute', record)
+            try:
+                c.post("/messages/new", data={"text": "Hello"})
+            finally:
+                event.remove(engine, 'before_cursor_execute', record)
+
+        self.assertTrue(statements)
+        self.assertFalse([s for s in statements
+                          if s.lstrip().startswith('SELECT') and 'messages.user_id' in s])
+
 
     #POST new messages and check for display and count
     def test_show_own_message(self):
@@ -124,6 +154,33 @@ class MessageViewTestCase(TestCase):
             self.assertIn(b'id="message_count" value="2"',resp_get.data)
 
 
+    def test_liked_state_on_profile(self):
+        '''test that only the messages the viewer likes show a filled like icon'''
+
+        other = User.signup(username="otheruser",
+                            email="other@test.com",
+                            password="otheruser",
+                            image_url=None)
+        db.session.commit()
+        other_id = other.id
+
+        liked = Message(text="liked", user_id=other_id)
+        not_liked = Message(text="not liked", user_id=other_id)
+        db.session.add_all([liked, not_liked])
+        db.session.commit()
+        db.session.add(Like(user_id=self.testuser_id, message_id=liked.id))
+        db.session.commit()
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.testuser_id
+
+            resp_get = c.get(f'/users/{other_id}')
+
+            self.assertEqual(resp_get.data.count(b'fas fa-thumbs-up'), 1)
+            self.assertEqual(resp_get.data.count(b'far fa-thumbs-up'), 1)
+
+
     #POST Delete messages and check for display and count
     def test_view_message(self):
         '''test to see if a message is clicked it shows separately'''
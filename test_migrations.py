@@ -0,0 +1,114 @@
+"""Schema migration tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_migrations.py
+
+
+import os
+from unittest import TestCase
+
+from sqlalchemy import MetaData, inspect, text
+
+from models import db
+
+os.environ['DATABASE_URL'] = "postgresql:///warbler-test"
+
+from app import app
+import migrations
+
+db.create_all()
+
+
+def baseline_schema():
+    """The tables as `db.create_all()` made them before any migration."""
+
+    metadata = MetaData()
+    db.Table('users', metadata,
+             db.Column('id', db.Integer, primary_key=True),
+             db.Column('email', db.Text, nullable=False, unique=True),
+             db.Column('username', db.Text, nullable=False, unique=True),
+             db.Column('image_url', db.Text),
+             db.Column('header_image_url', db.Text),
+             db.Column('bio', db.Text),
+             db.Column('location', db.Text),
+             db.Column('password', db.Text, nullable=False))
+    db.Table('follows', metadata,
+             db.Column('followee_id', db.Integer,
+                       db.ForeignKey('users.id', ondelete='cascade'), primary_key=True),
+             db.Column('follower_id', db.Integer,
+                       db.ForeignKey('users.id', ondelete='cascade'), primary_key=True))
+    db.Table('messages', metadata,
+             db.Column('id', db.Integer, primary_key=True),
+             db.Column('text', db.String(140), nullable=False),
+             db.Column('timestamp', db.DateTime, nullable=False),
+             db.Column('user_id', db.Integer,
+                       db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False))
+    db.Table('likes', metadata,
+             db.Column('user_id', db.Integer,
+                       db.ForeignKey('users.id', ondelete='CASCADE'), primary_key=True),
+             db.Column('message_id', db.Integer,
+                       db.ForeignKey('messages.id', ondelete='CASCADE'), primary_key=True))
+    return metadata
+
+
+class MigrationsTestCase(TestCase):
+    """Test applying migrations."""
+
+    def setUp(self):
+        self.ctx = app.app_context()
+        self.ctx.push()
+
+    def tearDown(self):
+        db.session.rollback()
+        self.ctx.pop()
+
+    def test_upgrade_is_idempotent(self):
+        """Can migrations be applied over create_all, and only once?"""
+
+        migrations.upgrade(log=lambda line: None)
+
+        self.assertEqual(migrations.pending(), [])
+        self.assertEqual(migrations.applied_versions(),
+                         {version for version, _ in migrations.MIGRATIONS})
+
+        # nothing left to do the second time round
+        migrations.upgrade(log=self.fail)
+
+    def test_hot_path_indexes(self):
+        """Are the hot query indexes in place?"""
+
+        migrations.upgrade(log=lambda line: None)
+        inspector = inspect(db.session.connection())
+
+        for table, index in [('messages', 'ix_messages_user_timestamp'),
+                             ('follows', 'ix_follows_follower_followee'),
+                             ('likes', 'ix_likes_message_user'),
+                             ('timeline_entries', 'ix_timeline_entries_user_recent')]:
+            names = {i['name'] for i in inspector.get_indexes(table)}
+            self.assertIn(index, names)
+
+    def test_upgrade_from_baseline(self):
+        """Do migrations apply to a database made before any of them?"""
+
+        db.drop_all()
+        migrations.schema_migrations.drop(db.session.connection(), checkfirst=True)
+        baseline_schema().create_all(db.session.connection())
+        db.session.commit()
+
+        try:
+            migrations.upgrade(log=lambda line: None)
+
+            self.assertEqual(migrations.pending(), [])
+            inspector = inspect(db.session.connection())
+            self.assertIn('created_at', {c['name'] for c in inspector.get_columns('likes')})
+            self.assertIn('ix_likes_user_created',
+                          {i['name'] for i in inspector.get_indexes('likes')})
+        finally:
+            # leave the current schema behind for the other tests
+            db.session.rollback()
+            db.drop_all()
+            for table in ('schema_migrations', 'likes', 'follows', 'messages', 'users'):
+                db.session.execute(text(f"DROP TABLE IF EXISTS {table}"))
+            db.session.commit()
+            db.create_all()
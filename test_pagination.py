@@ -0,0 +1,198 @@
+"""Keyset pagination tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_pagination.py
+
+
+import os
+import re
+from datetime import datetime
+from unittest import TestCase
+
+from models import db, User, Message, Like, FollowersFollowee, TimelineEntry
+
+os.environ['DATABASE_URL'] = "postgresql:///warbler-test"
+
+from app import app, CURR_USER_KEY
+from pagination import encode_cursor, decode_cursor
+
+db.create_all()
+
+app.config['WTF_CSRF_ENABLED'] = False
+app.config['USER_CACHE_SIZE'] = 0
+
+
+def walk_pages(client, url, pattern):
+    """Follow a view's "older" links from `url`; every match of `pattern` seen."""
+
+    seen = []
+    page_url = url
+    for _ in range(10):
+        resp = client.get(page_url)
+        seen += re.findall(pattern, resp.data)
+        older = re.search(rb'before=([\w-]+)', resp.data)
+        if older is None:
+            return seen
+        page_url = f"{url}&before={older.group(1).decode()}"
+    raise AssertionError(f"still paging after 10 pages: {seen}")
+
+
+class CursorTestCase(TestCase):
+    """Test cursor tokens."""
+
+    def test_round_trip(self):
+        """Does a cursor decode back to the key it was made from?"""
+
+        key = (datetime(2018, 10, 21, 7, 1, 6, 23966), 42)
+        self.assertEqual(decode_cursor(encode_cursor(*key)), key)
+
+    def test_garbage_cursor(self):
+        """Is a token we didn't make rejected?"""
+
+        self.assertRaises(ValueError, decode_cursor, "not-a-cursor")
+
+
+class PaginatedViewsTestCase(TestCase):
+    """Test paging through a user's messages."""
+
+    def setUp(self):
+        """Create a user with three messages."""
+
+        Message.query.delete()
+        User.query.delete()
+
+        self.client = app.test_client()
+
+        user = User.signup(username="pager",
+                           email="pager@test.com",
+                           password="password",
+                           image_url=None)
+        db.session.commit()
+        self.user_id = user.id
+
+        for day in (1, 2, 3):
+            db.session.add(Message(text=f"day {day}",
+                                   timestamp=datetime(2018, 1, day),
+                                   user_id=self.user_id))
+        db.session.commit()
+
+    def test_walk_pages(self):
+        """Does following the cursor reach every message exactly once?"""
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.user_id
+
+            first = c.get(f"/users/{self.user_id}?limit=2")
+            self.assertIn(b'day 3', first.data)
+            self.assertIn(b'day 2', first.data)
+            self.assertNotIn(b'day 1', first.data)
+            self.assertIn(b'id="older-messages"', first.data)
+
+            cursor = encode_cursor(datetime(2018, 1, 2),
+                                   Message.query.filter_by(text="day 2").one().id)
+            second = c.get(f"/users/{self.user_id}?limit=2&before={cursor}")
+            self.assertIn(b'day 1', second.data)
+            self.assertNotIn(b'day 2', second.data)
+            self.assertNotIn(b'id="older-messages"', second.data)
+
+    def test_same_timestamps(self):
+        """Are messages posted at the same moment each shown once?"""
+
+        Message.query.delete()
+        # the database's clock stamps them all in one go
+        db.session.add_all([Message(text=f"same {n}", user_id=self.user_id)
+                            for n in range(5)])
+        db.session.commit()
+
+        seen = walk_pages(self.client, f"/users/{self.user_id}?limit=2", rb'same \d')
+        self.assertEqual(sorted(seen), [f"same {n}".encode() for n in range(5)])
+
+    def test_querystring_named_like_view_arg(self):
+        """Does a `?user_id=` in the querystring leave the next page link alone?"""
+
+        resp = self.client.get(f"/users/{self.user_id}?limit=2&user_id=0")
+        self.assertEqual(resp.status_code, 200)
+        self.assertIn(f'/users/{self.user_id}?'.encode(), resp.data)
+
+    def test_bad_cursor_is_rejected(self):
+        """Does a malformed cursor give a 400 instead of a server error?"""
+
+        resp = self.client.get(f"/users/{self.user_id}?before=%%%")
+        self.assertEqual(resp.status_code, 400)
+
+
+class LikesPageTestCase(TestCase):
+    """Test the likes page: the profile owner's likes, by when they liked."""
+
+    def setUp(self):
+        TimelineEntry.query.delete()
+        Like.query.delete()
+        FollowersFollowee.query.delete()
+        Message.query.delete()
+        User.query.delete()
+
+        author, owner, viewer = [
+            User.signup(username=name, email=f"{name}@test.com",
+                        password="password", image_url=None)
+            for name in ("author", "owner", "viewer")]
+        db.session.commit()
+
+        msgs = [Message(text=f"day {day}", timestamp=datetime(2018, 1, day),
+                        user_id=author.id) for day in (1, 2, 3)]
+        db.session.add_all(msgs)
+        db.session.commit()
+
+        # liked in the opposite order to posting; the viewer likes day 3 only
+        for msg, liked_on in zip(msgs, (12, 11, 10)):
+            db.session.add(Like(user_id=owner.id, message_id=msg.id,
+                                created_at=datetime(2018, 2, liked_on)))
+        db.session.add(Like(user_id=viewer.id, message_id=msgs[2].id))
+        db.session.commit()
+
+        self.owner_id = owner.id
+        self.client = app.test_client()
+        with self.client.session_transaction() as sess:
+            sess[CURR_USER_KEY] = viewer.id
+
+    def queries(self, resp):
+        return int(re.search(r'"(\d+) queries"', resp.headers['Server-Timing']).group(1))
+
+    def test_owners_likes_by_like_time(self):
+        """Are the owner's likes shown most recently liked first, a page at a time?"""
+
+        first = self.client.get(f"/users/{self.owner_id}/likes?limit=2")
+        self.assertEqual(re.findall(rb'day \d', first.data), [b'day 1', b'day 2'])
+        self.assertIn(b'id="older-messages"', first.data)
+
+        cursor = re.search(rb'before=([\w-]+)', first.data).group(1).decode()
+        second = self.client.get(f"/users/{self.owner_id}/likes?limit=2&before={cursor}")
+        self.assertEqual(re.findall(rb'day \d', second.data), [b'day 3'])
+        self.assertNotIn(b'id="older-messages"', second.data)
+
+        # the viewer's own like state shows on the buttons
+        self.assertIn(b'fas fa-thumbs-up', second.data)
+        self.assertNotIn(b'fas fa-thumbs-up', first.data)
+
+    def test_same_like_times(self):
+        """Are likes made at the same moment each shown once?"""
+
+        Like.query.filter_by(user_id=self.owner_id).delete()
+        author_id = User.query.filter_by(username="author").one().id
+        msgs = [Message(text=f"same {n}", user_id=author_id) for n in range(5)]
+        db.session.add_all(msgs)
+        db.session.commit()
+        db.session.add_all([Like(user_id=self.owner_id, message_id=msg.id) for msg in msgs])
+        db.session.commit()
+
+        seen = walk_pages(self.client, f"/users/{self.owner_id}/likes?limit=2", rb'same \d')
+        self.assertEqual(sorted(seen), [f"same {n}".encode() for n in range(5)])
+
+    def test_fixed_number_of_queries(self):
+        """Does a bigger page take no more queries?"""
+
+        small = self.client.get(f"/users/{self.owner_id}/likes?limit=1")
+        large = self.client.get(f"/users/{self.owner_id}/likes?limit=3")
+
+        self.assertEqual(self.queries(small), self.queries(large))
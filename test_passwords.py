@@ -0,0 +1,101 @@
+"""Password hashing tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_passwords.py
+
+
+import os
+import threading
+from unittest import TestCase
+from unittest.mock import patch
+
+from models import db, User
+
+os.environ['DATABASE_URL'] = "postgresql:///warbler-test"
+
+from app import app
+import passwords
+
+db.create_all()
+
+app.config['WTF_CSRF_ENABLED'] = False
+
+
+class PasswordsTestCase(TestCase):
+    """Test the hashing pool and rehash-on-login."""
+
+    def setUp(self):
+        User.query.delete()
+        db.session.commit()
+
+        self.ctx = app.app_context()
+        self.ctx.push()
+        self.saved_rounds = app.config['BCRYPT_LOG_ROUNDS']
+        app.config['BCRYPT_LOG_ROUNDS'] = 4
+
+    def tearDown(self):
+        app.config['BCRYPT_LOG_ROUNDS'] = self.saved_rounds
+        db.session.rollback()
+        self.ctx.pop()
+
+    def test_hash_and_check(self):
+        """Does a hash made on the pool verify, at the configured cost?"""
+
+        pw_hash = passwords.hash_password("secret")
+
+        self.assertEqual(passwords.cost_of(pw_hash), 4)
+        self.assertTrue(passwords.check_password(pw_hash, "secret"))
+        self.assertFalse(passwords.check_password(pw_hash, "wrong"))
+
+    def test_rehash_on_login(self):
+        """Is a hash with an outdated cost replaced when the user logs in?"""
+
+        User.signup(username="rehash", email="rehash@test.com",
+                    password="password", image_url=None)
+        db.session.commit()
+
+        app.config['BCRYPT_LOG_ROUNDS'] = 5
+        user = User.authenticate("rehash", "password")
+        db.session.commit()
+
+        self.assertEqual(passwords.cost_of(user.password), 5)
+        self.assertTrue(User.authenticate("rehash", "password"))
+
+    def test_timeout_keeps_slot_until_done(self):
+        """Does a hash that times out answer busy, and hold its slot until it ends?"""
+
+        passwords.hash_password("warm up the pool")
+        done = threading.Event()
+
+        with patch.object(passwords, '_slots', threading.BoundedSemaphore(1)):
+            try:
+                with patch.dict(app.config, {'PASSWORD_HASH_TIMEOUT': 0.01}):
+                    self.assertRaises(passwords.HasherBusy, passwords._run, done.wait, 5)
+                # still hashing, so there's no room for another
+                self.assertRaises(passwords.HasherBusy, passwords._run, abs, -1)
+            finally:
+                done.set()
+
+            self.assertTrue(passwords._slots.acquire(timeout=5))
+            passwords._slots.release()
+
+    def test_busy_pool_is_rejected(self):
+        """Does a full hashing queue answer 503 instead of waiting?"""
+
+        passwords.cost_of(passwords.hash_password("warm up the pool"))
+
+        with patch.object(passwords, '_slots', threading.BoundedSemaphore(1)):
+            passwords._slots.acquire()
+            self.assertRaises(passwords.HasherBusy, passwords.hash_password, "x")
+
+            resp = app.test_client().post("/login", data={"username": "nobody",
+                                                           "password": "password"})
+            # unknown users never reach bcrypt...
+            self.assertEqual(resp.status_code, 200)
+
+            # ...but signing up has to hash the new password
+            resp = app.test_client().post("/signup", data={"username": "busy",
+                                                            "email": "busy@test.com",
+                                                            "password": "password"})
+            self.assertEqual(resp.status_code, 503)
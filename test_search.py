@@ -0,0 +1,87 @@
+"""User search tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_search.py
+
+
+import os
+import json
+from unittest import TestCase
+
+from models import db, User
+
+os.environ['DATABASE_URL'] = "postgresql:///warbler-test"
+
+from app import app
+
+db.create_all()
+
+app.config['WTF_CSRF_ENABLED'] = False
+app.config['USER_CACHE_SIZE'] = 0
+
+
+class SearchTestCase(TestCase):
+    """Test /users search, listing and autocomplete."""
+
+    def setUp(self):
+        """Create a few searchable users."""
+
+        User.query.delete()
+
+        for username, bio, location in [("birdwatcher", "I like owls", "Oakland"),
+                                        ("birdie", "golf all day", "Fresno"),
+                                        ("catperson", "meow", "Portland")]:
+            db.session.add(User(username=username,
+                                email=f"{username}@test.com",
+                                password="HASHED_PASSWORD",
+                                bio=bio,
+                                location=location))
+        db.session.commit()
+
+        self.client = app.test_client()
+
+    def test_search_username(self):
+        """Does searching find users by username?"""
+
+        resp = self.client.get("/users?q=bird")
+
+        self.assertIn(b'@birdwatcher', resp.data)
+        self.assertIn(b'@birdie', resp.data)
+        self.assertNotIn(b'@catperson', resp.data)
+
+    def test_search_bio_and_location(self):
+        """Does searching look at bio and location too?"""
+
+        self.assertIn(b'@birdwatcher', self.client.get("/users?q=owls").data)
+        self.assertIn(b'@catperson', self.client.get("/users?q=portland").data)
+
+    def test_search_no_results(self):
+        """Does a search with no match say so?"""
+
+        resp = self.client.get("/users?q=nobodyhere")
+        self.assertIn(b'Sorry, no users found', resp.data)
+
+    def test_listing_is_paginated(self):
+        """Does the unfiltered listing page through every user?"""
+
+        app.config['USERS_PAGE_SIZE'] = 2
+        try:
+            first = self.client.get("/users")
+            self.assertIn(b'id="more-users"', first.data)
+            self.assertNotIn(b'@catperson', first.data)
+
+            last_id = User.query.order_by(User.id).all()[1].id
+            second = self.client.get(f"/users?after={last_id}")
+            self.assertIn(b'@catperson', second.data)
+            self.assertNotIn(b'id="more-users"', second.data)
+        finally:
+            app.config['USERS_PAGE_SIZE'] = 24
+
+    def test_autocomplete(self):
+        """Does autocomplete return usernames starting with the prefix?"""
+
+        resp = self.client.get("/users/autocomplete?q=bir")
+        usernames = [u['username'] for u in json.loads(resp.data)]
+
+        self.assertEqual(usernames, ["birdie", "birdwatcher"])
@@ -0,0 +1,133 @@
+"""Materialized timeline tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_timeline.py
+
+
+import os
+from unittest import TestCase
+
+from models import db, User, Message, FollowersFollowee, TimelineEntry
+
+os.environ['DATABASE_URL'] = "postgresql:///warbler-test"
+
+from app import app, CURR_USER_KEY
+
+db.create_all()
+
+app.config['WTF_CSRF_ENABLED'] = False
+app.config['USER_CACHE_SIZE'] = 0
+
+
+class TimelineTestCase(TestCase):
+    """Test fan-out on write and the hybrid read path."""
+
+    def setUp(self):
+        """Create test client and two users."""
+
+        TimelineEntry.query.delete()
+        FollowersFollowee.query.delete()
+        Message.query.delete()
+        User.query.delete()
+
+        app.config['TIMELINE_FANOUT_LIMIT'] = 10000
+
+        self.client = app.test_client()
+
+        self.author = User.signup(username="author",
+                                  email="author@test.com",
+                                  password="password",
+                                  image_url=None)
+        self.reader = User.signup(username="reader",
+                                  email="reader@test.com",
+                                  password="password",
+                                  image_url=None)
+        db.session.commit()
+
+        self.author_id = self.author.id
+        self.reader_id = self.reader.id
+
+    def login(self, c, user_id):
+        with c.session_transaction() as sess:
+            sess[CURR_USER_KEY] = user_id
+
+    def test_post_fans_out_to_followers(self):
+        """Does a new message land in the followers' timelines?"""
+
+        with self.client as c:
+            self.login(c, self.reader_id)
+            c.post(f"/users/follow/{self.author_id}")
+
+            self.login(c, self.author_id)
+            c.post("/messages/new", data={"text": "fanned out"})
+
+            self.login(c, self.reader_id)
+            resp = c.get("/")
+
+        self.assertIn(b'fanned out', resp.data)
+        self.assertEqual(TimelineEntry.query.filter_by(user_id=self.reader_id).count(), 1)
+        self.assertEqual(TimelineEntry.query.filter_by(user_id=self.author_id).count(), 1)
+
+    def test_follow_backfills_and_unfollow_prunes(self):
+        """Does following copy in old messages, and unfollowing remove them?"""
+
+        with self.client as c:
+            self.login(c, self.author_id)
+            c.post("/messages/new", data={"text": "before the follow"})
+
+            self.login(c, self.reader_id)
+            c.post(f"/users/follow/{self.author_id}")
+            self.assertIn(b'before the follow', c.get("/").data)
+
+            c.post(f"/users/stop-following/{self.author_id}")
+            self.assertNotIn(b'before the follow', c.get("/").data)
+
+        self.assertEqual(TimelineEntry.query.filter_by(user_id=self.reader_id).count(), 0)
+
+    def test_popular_author_is_merged_on_read(self):
+        """Are messages by accounts over the fan-out limit read, not copied?"""
+
+        app.config['TIMELINE_FANOUT_LIMIT'] = 0
+
+        with self.client as c:
+            self.login(c, self.reader_id)
+            c.post(f"/users/follow/{self.author_id}")
+
+            self.login(c, self.author_id)
+            c.post("/messages/new", data={"text": "merged on read"})
+
+            self.login(c, self.reader_id)
+            resp = c.get("/")
+
+        self.assertIn(b'merged on read', resp.data)
+        self.assertEqual(TimelineEntry.query.filter_by(user_id=self.reader_id).count(), 0)
+
+    def test_dropping_under_limit_catches_up(self):
+        """Do messages merged on read stay in feeds once their author is fanned out again?"""
+
+        app.config['TIMELINE_FANOUT_LIMIT'] = 1
+        fan = User.signup(username="fan", email="fan@test.com",
+                          password="password", image_url=None)
+        db.session.commit()
+        fan_id = fan.id
+
+        with self.client as c:
+            for follower_id in (self.reader_id, fan_id):
+                self.login(c, follower_id)
+                c.post(f"/users/follow/{self.author_id}")
+
+            # two followers: over the limit, so this is only merged on read
+            self.login(c, self.author_id)
+            c.post("/messages/new", data={"text": "posted while popular"})
+            self.assertEqual(TimelineEntry.query.filter_by(user_id=self.reader_id).count(), 0)
+
+            # back down to one: fanned out on write again
+            self.login(c, fan_id)
+            c.post(f"/users/stop-following/{self.author_id}")
+
+            self.login(c, self.reader_id)
+            resp = c.get("/")
+
+        self.assertIn(b'posted while popular', resp.data)
+        self.assertEqual(TimelineEntry.query.filter_by(user_id=self.reader_id).count(), 1)
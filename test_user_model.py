@@ -118,6 +118,33 @@ class UserModelTestCase(TestCase):
         self.assertTrue(self._user1.is_followed_by(self._user2))
 
 
+    def test_following_ids_among(self):
+        """Does following_ids_among pick out just the followed users?"""
+
+        self.assertEqual(self._user1.following_ids_among([2000]), set())
+
+        db.session.add(FollowersFollowee(followee_id=1000, follower_id=2000))
+        db.session.commit()
+
+        self.assertEqual(self._user1.following_ids_among([1000, 2000, 3000]), {2000})
+        self.assertEqual(self._user1.following_ids_among([]), set())
+
+
+    def test_liked_ids_among(self):
+        """Do is_liking and liked_ids_among agree on what a user likes?"""
+
+        liked = Message(text="liked", user_id=2000)
+        other = Message(text="other", user_id=2000)
+        db.session.add_all([liked, other])
+        db.session.commit()
+        db.session.add(Like(user_id=1000, message_id=liked.id))
+        db.session.commit()
+
+        self.assertTrue(self._user1.is_liking(liked))
+        self.assertFalse(self._user1.is_liking(other))
+        self.assertEqual(self._user1.liked_ids_among([liked.id, other.id]), {liked.id})
+
+
     def test_user_signup(self):
         """Does User.signup successfully create a new user given valid credentials?"""    
 
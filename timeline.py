@@ -0,0 +1,238 @@
+"""Materialized home timelines for Warbler.
+
+Every message is pushed ("fanned out") into the `timeline_entries` rows of
+its author and of everyone following the author, so the home feed is a
+single indexed range read per user instead of a scan over the follow set.
+
+Copying a message into followers' timelines runs as a background job (see
+jobs.py), so posting only waits for the author's own entry.
+
+Accounts with very many followers are not fanned out on write: copying one
+message into hundreds of thousands of timelines is too expensive. Their
+messages are merged into their followers' feeds at read time instead.
+When an account drops back under the limit, `catch_up` copies its newest
+messages, which were only ever merged on read, into its followers'
+timelines.
+"""
+
+import heapq
+
+from flask import current_app
+from sqlalchemy import and_, exists, literal, select, true
+
+from models import db, FollowersFollowee, Message, TimelineEntry, User
+import feed
+import jobs
+import pagination
+
+DEFAULT_FANOUT_LIMIT = 10000
+DEFAULT_BACKFILL = 100
+
+
+def fanout_limit():
+    """Follower count above which an author is merged on read instead."""
+
+    return current_app.config.get('TIMELINE_FANOUT_LIMIT', DEFAULT_FANOUT_LIMIT)
+
+
+def is_fanned_out_on_read(user_id):
+    """Is `user_id` too popular to fan out on write?"""
+
+    followers_count = (db.session
+                       .query(User.followers_count)
+                       .filter(User.id == user_id)
+                       .scalar())
+
+    return (followers_count or 0) > fanout_limit()
+
+
+def fan_out(msg):
+    """Push a freshly flushed message into its author's timeline, and queue
+    pushing it into its followers' timelines."""
+
+    db.session.execute(TimelineEntry.__table__.insert().values(
+        user_id=msg.user_id,
+        message_id=msg.id,
+        timestamp=msg.timestamp,
+    ))
+
+    if is_fanned_out_on_read(msg.user_id):
+        return
+
+    jobs.enqueue('timeline.fan_out_to_followers', message_id=msg.id)
+
+
+@jobs.handler('timeline.fan_out_to_followers')
+def fan_out_to_followers(message_id):
+    """Push a message into its author's followers' timelines."""
+
+    msg = Message.query.get(message_id)
+    if msg is None:
+        return
+
+    # followers who followed since the message was posted were backfilled
+    already_there = (select([TimelineEntry.user_id])
+                     .where(TimelineEntry.message_id == msg.id))
+
+    # `followee_id` is the follower's id; see FollowersFollowee
+    followers = (select([
+        FollowersFollowee.followee_id,
+        literal(msg.id),
+        literal(msg.timestamp),
+    ]).where(and_(FollowersFollowee.follower_id == msg.user_id,
+                  FollowersFollowee.followee_id.notin_(already_there))))
+
+    db.session.execute(TimelineEntry.__table__.insert().from_select(
+        ['user_id', 'message_id', 'timestamp'], followers))
+
+
+def backfill(user_id, followee_id):
+    """Copy the newest messages of a just-followed user into `user_id`'s timeline."""
+
+    if is_fanned_out_on_read(followee_id):
+        return
+
+    limit = current_app.config.get('TIMELINE_BACKFILL', DEFAULT_BACKFILL)
+    already_there = (select([TimelineEntry.message_id])
+                     .where(TimelineEntry.user_id == user_id))
+
+    newest = (select([literal(user_id), Message.id, Message.timestamp])
+              .where(and_(Message.user_id == followee_id,
+                          Message.id.notin_(already_there)))
+              .order_by(Message.timestamp.desc(), Message.id.desc())
+              .limit(limit))
+
+    db.session.execute(TimelineEntry.__table__.insert().from_select(
+        ['user_id', 'message_id', 'timestamp'], newest))
+
+
+@jobs.handler('timeline.catch_up')
+def catch_up(user_id):
+    """Copy `user_id`'s newest messages into all their followers' timelines.
+
+    For when they drop back to being fanned out on write: what they posted
+    while merged on read was never copied, and nor were they backfilled
+    for anyone who followed them meanwhile.
+    """
+
+    if is_fanned_out_on_read(user_id):
+        return
+
+    limit = current_app.config.get('TIMELINE_BACKFILL', DEFAULT_BACKFILL)
+    newest = (select([Message.id, Message.timestamp])
+              .where(Message.user_id == user_id)
+              .order_by(Message.timestamp.desc(), Message.id.desc())
+              .limit(limit)
+              .alias('newest'))
+
+    already_there = exists().where(and_(
+        TimelineEntry.user_id == FollowersFollowee.followee_id,
+        TimelineEntry.message_id == newest.c.id))
+
+    # `followee_id` is the follower's id; see FollowersFollowee
+    missing = (select([FollowersFollowee.followee_id, newest.c.id, newest.c.timestamp])
+               .select_from(FollowersFollowee.__table__.join(newest, true()))
+               .where(and_(FollowersFollowee.follower_id == user_id,
+                           ~already_there)))
+
+    db.session.execute(TimelineEntry.__table__.insert().from_select(
+        ['user_id', 'message_id', 'timestamp'], missing))
+
+
+def prune(user_id, followee_id):
+    """Remove an unfollowed user's messages from `user_id`'s timeline."""
+
+    their_messages = select([Message.id]).where(Message.user_id == followee_id)
+
+    (TimelineEntry
+     .query
+     .filter(TimelineEntry.user_id == user_id,
+             TimelineEntry.message_id.in_(their_messages))
+     .delete(synchronize_session=False))
+
+
+def read_merged_followee_ids(user_id):
+    """Ids of the users `user_id` follows whose messages are merged on read."""
+
+    rows = (db.session
+            .query(FollowersFollowee.follower_id)
+            .join(User, User.id == FollowersFollowee.follower_id)
+            .filter(FollowersFollowee.followee_id == user_id,
+                    User.followers_count > fanout_limit())
+            .all())
+
+    return [followee_id for (followee_id,) in rows]
+
+
+def home_page(user, per_page=100, cursor=None):
+    """One page of `user`'s home feed, newest first, starting after `cursor`."""
+
+    materialized = (feed.with_authors(Message.query)
+                    .join(TimelineEntry, TimelineEntry.message_id == Message.id)
+                    .filter(TimelineEntry.user_id == user.id))
+    if cursor is not None:
+        materialized = materialized.filter(pagination.older_than(
+            TimelineEntry.timestamp, TimelineEntry.message_id, cursor))
+    materialized = (materialized
+                    .order_by(TimelineEntry.timestamp.desc(),
+                              TimelineEntry.message_id.desc())
+                    .limit(per_page + 1)
+                    .all())
+
+    merged_ids = read_merged_followee_ids(user.id)
+    if not merged_ids:
+        return pagination.page_of(materialized, per_page)
+
+    on_read = (feed.with_authors(Message.query)
+               .filter(Message.user_id.in_(merged_ids)))
+    if cursor is not None:
+        on_read = on_read.filter(pagination.older_than(
+            Message.timestamp, Message.id, cursor))
+    on_read = (on_read
+               .order_by(Message.timestamp.desc(), Message.id.desc())
+               .limit(per_page + 1)
+               .all())
+
+    merged = _merge_newest_first([materialized, on_read], per_page + 1)
+    return pagination.page_of(merged, per_page)
+
+
+def _merge_newest_first(streams, limit):
+    """Merge message lists already sorted newest first, dropping duplicates."""
+
+    seen = set()
+    merged = []
+
+    for msg in heapq.merge(*streams, key=lambda m: (m.timestamp, m.id), reverse=True):
+        if msg.id in seen:
+            continue
+        seen.add(msg.id)
+        merged.append(msg)
+        if len(merged) == limit:
+            break
+
+    return merged
+
+
+def rebuild_all():
+    """Recompute every materialized timeline from messages and follows.
+
+    Relies on the follower counters, so reconcile those first.
+    """
+
+    entries = TimelineEntry.__table__
+    columns = ['user_id', 'message_id', 'timestamp']
+
+    TimelineEntry.query.delete(synchronize_session=False)
+
+    own = select([Message.user_id, Message.id, Message.timestamp])
+    db.session.execute(entries.insert().from_select(columns, own))
+
+    popular = select([User.id]).where(User.followers_count > fanout_limit())
+
+    followed = (select([FollowersFollowee.followee_id, Message.id, Message.timestamp])
+                .select_from(FollowersFollowee.__table__.join(
+                    Message.__table__,
+                    Message.user_id == FollowersFollowee.follower_id))
+                .where(Message.user_id.notin_(popular)))
+    db.session.execute(entries.insert().from_select(columns, followed))
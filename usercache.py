@@ -0,0 +1,105 @@
+"""Cache of the logged-in user's hot profile fields.
+
+`add_user_to_g` runs before every request. Rather than loading the full
+`User` row each time, it gets a `UserSnapshot` built from a few cached
+columns; the ORM object is only loaded if a view touches anything else
+(relationships, counters, the password hash, ...).
+
+Views that change a user's profile or delete the user must call
+`invalidate`. Other workers notice within `USER_CACHE_TTL` seconds, unless
+a shared backend is configured as `USER_CACHE_BACKEND`. Until then a
+snapshot may outlive its user; loading the full row then raises `UserGone`,
+which logs the session out.
+"""
+
+from flask import current_app
+
+from cache import LRUCache
+from models import User
+
+DEFAULT_SIZE = 1024
+DEFAULT_TTL = 60
+
+HOT_FIELDS = ('id', 'username', 'image_url', 'header_image_url', 'deleted')
+
+
+class UserGone(Exception):
+    """The logged-in user was deleted after their snapshot was cached."""
+
+
+class UserSnapshot:
+    """Stand-in for the logged-in `User` made from its cached hot fields."""
+
+    def __init__(self, fields, user=None):
+        self._user = user
+        self.__dict__.update(fields)
+
+    def __repr__(self):
+        return f"<UserSnapshot #{self.id}: {self.username}>"
+
+    @property
+    def model(self):
+        """The full ORM `User`, loaded on first use."""
+
+        if self._user is None:
+            user = User.query.get(self.id)
+            if user is None or user.deleted:
+                invalidate(self.id)
+                raise UserGone(self.id)
+            self._user = user
+        return self._user
+
+    def __getattr__(self, name):
+        # only called for attributes the snapshot doesn't have itself
+        if name.startswith('__'):
+            raise AttributeError(name)
+        return getattr(self.model, name)
+
+    # these only need the user's id, so they don't load the ORM object
+    is_followed_by = User.is_followed_by
+    is_following = User.is_following
+    is_liking = User.is_liking
+    following_ids_among = User.following_ids_among
+    liked_ids_among = User.liked_ids_among
+
+
+def backend():
+    """The configured cache backend (an in-process LRU by default)."""
+
+    cache = current_app.extensions.get('user_cache')
+
+    if cache is None:
+        cache = current_app.config.get('USER_CACHE_BACKEND') or LRUCache(
+            maxsize=current_app.config.get('USER_CACHE_SIZE', DEFAULT_SIZE),
+            ttl=current_app.config.get('USER_CACHE_TTL', DEFAULT_TTL))
+        current_app.extensions['user_cache'] = cache
+
+    return cache
+
+
+def _key(user_id):
+    return f"user:{user_id}"
+
+
+def load(user_id):
+    """A snapshot of user `user_id`, or None if there's no such user (any more)."""
+
+    fields = backend().get(_key(user_id))
+    if fields is None:
+        user = User.query.get(user_id)
+        if user is None:
+            return None
+        fields = {name: getattr(user, name) for name in HOT_FIELDS}
+        backend().set(_key(user_id), fields)
+    else:
+        user = None
+
+    if fields.get('deleted'):
+        return None
+    return UserSnapshot(fields, user)
+
+
+def invalidate(user_id):
+    """Drop user `user_id` from the cache after changing or deleting it."""
+
+    backend().delete(_key(user_id))